@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ASGI-вариант лицензионного сервера
+
+Публичные эндпоинты (/check_license, /check_license/token, /get_license_info,
+/increment_usage) с таблицей в памяти обслуживаются прямо в цикле событий:
+медленный клиент занимает только корутину, а не поток. С SQLite (запрос к
+базе может ждать блокировку) и с LICENSE_SYNC_COMMIT=1 (ожидание fsync)
+обработчик выполняется в пуле потоков, чтобы не останавливать цикл.
+Остальные маршруты (/, /admin/*) передаются Flask-приложению из
+license_server в пуле потоков, поэтому поведение у двух вариантов одно и то же.
+
+Запуск: python asgi_server.py (или uvicorn asgi_server:app)
+"""
+
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import license_server
+from license_http import choose_encoding, compress, dumps, loads
+from license_store import LicenseStore
+from rate_limit import client_ip, request_start_delay
+
+# Тела ответов Flask читаются в отдельном пуле: живая лента админки (/admin/events) занимает
+# поток, пока открыта вкладка, и не должна отнимать потоки у остальных маршрутов
+STREAM_THREADS = int(os.environ.get('LICENSE_ASGI_STREAM_THREADS', 64))
+STREAMS = ThreadPoolExecutor(STREAM_THREADS, thread_name_prefix="asgi-stream")
+
+
+def _parse_json(body):
+    try:
+        return loads(body) if body else None
+    except ValueError:
+        return None
+
+
+def _audit(endpoint, hwid, status, message, ip):
+    if license_server.AUDIT is not None:
+        license_server.AUDIT.record(hwid, endpoint, status, message, ip)
+
+
+def check_license(query, body, ip, scope):
+    """Проверка лицензии"""
+    data = _parse_json(body)
+    if not isinstance(data, dict) or 'hwid' not in data:
+        return 400, {"valid": False, "message": "Неверный запрос"}
+
+    try:
+        retry_after = license_server.hwid_retry_after(data['hwid'])
+        if retry_after:
+            _audit('check_license', data['hwid'], 429, None, ip)
+            return 429, license_server.rate_limit_response(retry_after)
+        current_time = int(time.time())
+        started = time.perf_counter()
+        is_valid, message, license_data = license_server.LICENSES.use(data['hwid'], current_time)
+        license_server.record_stage("validate", started)
+        _audit('check_license', data['hwid'], 200 if is_valid else 403, message, ip)
+        if is_valid:
+            started = time.perf_counter()
+            body = license_server.license_response_json(message, license_data, current_time).encode()
+            license_server.record_stage("sign", started)
+            return 200, body
+        return 403, {"valid": False, "message": message}
+    except Exception as e:
+        return 500, {"valid": False, "message": f"Ошибка сервера: {str(e)}"}
+
+
+def check_license_token(query, body, ip, scope):
+    """Проверка лицензии с выдачей токена"""
+    data = _parse_json(body)
+    if not isinstance(data, dict) or 'hwid' not in data:
+        return 400, {"valid": False, "message": "Неверный запрос"}
+
+    try:
+        retry_after = license_server.hwid_retry_after(data['hwid'])
+        if retry_after:
+            _audit('check_license_token', data['hwid'], 429, None, ip)
+            return 429, license_server.rate_limit_response(retry_after)
+        current_time = int(time.time())
+        started = time.perf_counter()
+        is_valid, message, license_data = license_server.LICENSES.use(data['hwid'], current_time)
+        license_server.record_stage("validate", started)
+        _audit('check_license_token', data['hwid'], 200 if is_valid else 403, message, ip)
+        if is_valid:
+            started = time.perf_counter()
+            token = license_server.license_token(data['hwid'], message, license_data, current_time)
+            license_server.record_stage("sign", started)
+            return 200, token
+        return 403, {"valid": False, "message": message}
+    except Exception as e:
+        return 500, {"valid": False, "message": f"Ошибка сервера: {str(e)}"}
+
+
+def get_license_info(query, body, ip, scope):
+    """Получение информации о лицензии (для отладки)"""
+    hwid = query.get('hwid', [None])[0]
+    retry_after = license_server.hwid_retry_after(hwid) if hwid else 0
+    if retry_after:
+        return 429, license_server.rate_limit_response(retry_after)
+    license_data = license_server.LICENSES.get(hwid) if hwid else None
+    if license_data is None:
+        return 404, {"error": "Лицензия не найдена"}
+    etag = license_server.license_etag(license_data)
+    headers = license_server.info_headers(license_data, etag, int(time.time()))
+    if license_server.not_modified(_header(scope, b"if-none-match"), etag):
+        return 304, b"", headers
+    return 200, license_server.license_info(license_data), headers
+
+
+def increment_usage(query, body, ip, scope):
+    """Увеличение счетчика использований"""
+    data = _parse_json(body) or {}
+    hwid = data.get('hwid')
+    retry_after = license_server.hwid_retry_after(hwid) if hwid else 0
+    if retry_after:
+        _audit('increment_usage', hwid, 429, None, ip)
+        return 429, license_server.rate_limit_response(retry_after)
+    if not hwid or license_server.LICENSES.increment(hwid, int(time.time())) is None:
+        if hwid:
+            _audit('increment_usage', hwid, 404, "Лицензия не найдена", ip)
+        return 404, {"valid": False, "message": "Лицензия не найдена"}
+    _audit('increment_usage', hwid, 200, "Счетчик использований увеличен", ip)
+    return 200, {"valid": True, "message": "Счетчик использований увеличен"}
+
+
+ROUTES = {
+    ("POST", "/check_license"): check_license,
+    ("POST", "/check_license/token"): check_license_token,
+    ("GET", "/get_license_info"): get_license_info,
+    ("POST", "/increment_usage"): increment_usage,
+}
+
+
+def _blocking():
+    """Обработчик может заблокировать поток: ожидание fsync или запрос к внешнему хранилищу"""
+    return license_server.SYNC_COMMIT or not isinstance(license_server.LICENSES, LicenseStore)
+
+
+def _route(scope):
+    """Обработчик в цикле событий или None - запрос передается Flask"""
+    follower = license_server.FOLLOWER
+    if follower is not None and (scope["method"] != "GET" or not follower.synced.is_set()):
+        # Фолловер: изменения выполняет лидер, пересылка идет через Flask (forward_to_leader)
+        return None
+    return ROUTES.get((scope["method"], scope["path"]))
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send_json(send, status, payload, extra_headers=None, accept_encoding=None):
+    # Подписанный ответ приходит уже сериализованным
+    body = payload if isinstance(payload, bytes) else dumps(payload)
+    headers = []
+    encoding = None
+    # Большие ответы сжимаются так же, как у Flask (compress_response)
+    if status == 200 and license_server.COMPRESS_MIN_BYTES and len(body) >= license_server.COMPRESS_MIN_BYTES:
+        headers.append((b"vary", b"Accept-Encoding"))
+        encoding = choose_encoding(accept_encoding)
+        if encoding is not None:
+            body = compress(body, encoding)
+            headers.append((b"content-encoding", encoding.encode()))
+    # У 304 нет тела, а значит и его типа и длины
+    if status != 304:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    for name, value in (extra_headers or {}).items():
+        if name == "ETag" and encoding is not None and not value.startswith("W/"):
+            # Сжатые байты другие - ETag слабый, как у Flask
+            value = "W/" + value
+        headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+    if status == 429 or status == 503:
+        retry_after = payload.get("retry_after", 1) if isinstance(payload, dict) else 1
+        headers.append((b"retry-after", str(retry_after).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _client_ip(scope):
+    remote_addr = (scope.get("client") or ("", 0))[0]
+    return client_ip(remote_addr, _header(scope, b"x-forwarded-for"), license_server.TRUSTED_PROXIES)
+
+
+def _limit(scope, ip):
+    """Отказ (статус, ответ) до чтения тела - перегрузка или лимит IP; None - запрос принят"""
+    shedder = license_server.SHEDDER
+    delay = request_start_delay(_header(scope, b"x-request-start"), time.time())
+    if delay is not None:
+        shedder.observe(delay)
+    if not shedder.enter():
+        return 503, {"valid": False, "message": "Сервер перегружен, повторите позже"}
+
+    if license_server.IP_LIMITS is not None:
+        retry_after = license_server.IP_LIMITS.acquire(ip, time.monotonic())
+        if retry_after:
+            shedder.leave()
+            return 429, license_server.rate_limit_response(retry_after)
+    return None
+
+
+def _wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            environ[name] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _call_flask(scope, body, receive, send):
+    """Передача запроса Flask-приложению в пуле потоков
+
+    Тело ответа читается по частям в пуле STREAMS. После обрыва соединения
+    send() молча ничего не отправляет, поэтому обрыв ловится по
+    http.disconnect: бесконечный ответ (лента событий) дочитывается до
+    текущей части и закрывается, поток освобождается.
+    """
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    result = await loop.run_in_executor(None, license_server.app.wsgi_app, _wsgi_environ(scope, body), start_response)
+    iterator = iter(result)
+    sentinel = object()
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        while not disconnected.done():
+            chunk = loop.run_in_executor(STREAMS, next, iterator, sentinel)
+            await asyncio.wait((chunk, disconnected), return_when=asyncio.FIRST_COMPLETED)
+            if not chunk.done():
+                # Генератор нельзя закрыть, пока он выполняется: ждем текущую часть
+                await asyncio.wait((chunk,))
+                break
+            chunk = chunk.result()
+            if chunk is sentinel:
+                await send({"type": "http.response.body", "body": b""})
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        disconnected.cancel()
+        if hasattr(result, "close"):
+            await loop.run_in_executor(STREAMS, result.close)
+
+
+async def _watch_loop_lag(interval=0.05):
+    """Отставание цикла событий - время, которое запросы ждут своей очереди"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        license_server.SHEDDER.observe(max(0.0, loop.time() - started - interval))
+
+
+async def _lifespan(receive, send):
+    watcher = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            watcher = asyncio.create_task(_watch_loop_lag())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if watcher:
+                watcher.cancel()
+            license_server.LICENSES.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI-приложение"""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    handler = _route(scope)
+    if handler is None:
+        body = await _read_body(receive)
+        if body is not None:
+            await _call_flask(scope, body, receive, send)
+        return
+
+    # Перегрузка и лимит по IP проверяются до чтения и разбора тела
+    started = time.perf_counter()
+    ip = _client_ip(scope)
+    rejected = _limit(scope, ip)
+    if rejected:
+        await _send_json(send, *rejected)
+        license_server.record_request(scope["path"], scope["method"], rejected[0], started)
+        return
+
+    try:
+        body = await _read_body(receive)
+        if body is None:
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if _blocking():
+            # Ожидание fsync или базы не должно останавливать цикл событий
+            result = await asyncio.get_running_loop().run_in_executor(None, handler, query, body, ip, scope)
+        else:
+            result = handler(query, body, ip, scope)
+    finally:
+        license_server.SHEDDER.leave()
+    # Обработчик может вернуть и заголовки: (статус, ответ, заголовки)
+    status, payload = result[:2]
+    await _send_json(send, status, payload, result[2] if len(result) > 2 else None, _header(scope, b"accept-encoding"))
+    license_server.record_request(scope["path"], scope["method"], status, started)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("ASGI-режиму нужен uvicorn: pip install uvicorn")
+
+    port = int(os.environ.get('PORT', 5000))
+    print(f"Starting FloraVisuals License Server (ASGI) on port {port}")
+    uvicorn.run(app, host='0.0.0.0', port=port, access_log=False, backlog=4096)
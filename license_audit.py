@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Журнал аудита использования лицензий
+
+Каждая проверка (/check_license, пакетная, с токеном) и /increment_usage
+добавляет событие: время, HWID, эндпоинт, HTTP-статус, результат и IP
+клиента. Запрос только кладет кортеж в ограниченную очередь; кодирование,
+сжатие и запись делает фоновый поток раз в interval секунд. Если очередь
+переполнена (диск не успевает), событие отбрасывается и учитывается в
+dropped - запрос никогда не ждет журнал.
+
+Файлы - audit-ГГГГММДД-ЧЧ-<pid>-<n>.gz в каталоге журнала: новый файл на
+каждый час и после max_bytes несжатых данных, у каждого процесса свои
+файлы (воркеры pre-fork пишут независимо). Файлы старше keep_days дней
+удаляются. Внутри gzip - MAGIC и записи HEADER + HWID + IP; после сбоя
+читается все до оборванного хвоста.
+"""
+
+import atexit
+import gzip
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+
+MAGIC = b"LICAUD01"
+# Время (мс), HTTP-статус, эндпоинт, результат, длина HWID, длина IP
+HEADER = struct.Struct("<qHBBBB")
+
+ENDPOINTS = ("other", "check_license", "check_license_batch", "check_license_token", "increment_usage")
+RESULTS = ("other", "valid", "activated", "expired", "uses_exhausted", "not_found", "rate_limited", "error")
+# Сообщения ответов -> результат
+MESSAGES = {
+    "Лицензия действительна": "valid",
+    "Лицензия активирована": "activated",
+    "Лицензия истекла": "expired",
+    "Превышено максимальное количество использований": "uses_exhausted",
+    "Лицензия не найдена": "not_found",
+    "Счетчик использований увеличен": "valid",
+}
+
+_ENDPOINT_CODES = {name: code for code, name in enumerate(ENDPOINTS)}
+_RESULT_CODES = {name: code for code, name in enumerate(RESULTS)}
+_FILE_NAME = re.compile(r"^audit-(\d{8}-\d{2})-\d+-\d+\.gz$")
+
+
+def result_of(status, message):
+    """Код результата по статусу и сообщению ответа"""
+    if status == 429:
+        return "rate_limited"
+    if status >= 500:
+        return "error"
+    return MESSAGES.get(message, "other")
+
+
+def encode(event):
+    timestamp, hwid, endpoint, status, message, ip = event
+    hwid = str(hwid).encode("utf-8")[:255]
+    ip = (ip or "").encode("ascii", "replace")[:255]
+    return HEADER.pack(int(timestamp * 1000), status, _ENDPOINT_CODES.get(endpoint, 0),
+                       _RESULT_CODES[result_of(status, message)], len(hwid), len(ip)) + hwid + ip
+
+
+class AuditLog:
+    """Журнал аудита с записью в фоновом потоке"""
+
+    def __init__(self, directory, max_bytes=256 * 2 ** 20, keep_days=30, queue_size=100000, interval=1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep_days = keep_days
+        self.queue_size = queue_size
+        self.interval = interval
+        self.written = 0
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        # deque.append атомарна и дешевле queue.Queue; размер ограничивается в record()
+        self._queue = deque()
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._file = None
+        self._hour = None
+        self._size = 0
+        self._segment = 0
+
+    def record(self, hwid, endpoint, status, message=None, ip=None):
+        """Событие в очередь (без ожидания диска)"""
+        if self._pid != os.getpid():
+            self._start()
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            return
+        self._queue.append((time.time(), hwid, endpoint, status, message, ip))
+
+    def _start(self):
+        # Поток запускается при первом событии в процессе: воркеры pre-fork получают свой
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue.clear()
+            self._file = None
+            self._stopped.clear()
+            threading.Thread(target=self._run, name="audit-writer", daemon=True).start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Запись накопленных событий, возвращает их число"""
+        with self._lock:
+            count = 0
+            chunks = []
+            hour = None
+            # Только то, что уже в очереди: под постоянной нагрузкой пачка не растет бесконечно
+            for _ in range(len(self._queue)):
+                event = self._queue.popleft()
+                event_hour = int(event[0]) // 3600
+                if event_hour != hour and chunks:
+                    self._write(hour, b"".join(chunks))
+                    chunks = []
+                hour = event_hour
+                chunks.append(encode(event))
+                count += 1
+            if chunks:
+                self._write(hour, b"".join(chunks))
+            if self._file is not None:
+                # Z_SYNC_FLUSH: записанное читается, даже если процесс упадет до закрытия файла
+                self._file.flush()
+            self.written += count
+            return count
+
+    def _write(self, hour, data):
+        if self._file is None or hour != self._hour or self._size >= self.max_bytes:
+            self._rotate(hour)
+        self._file.write(data)
+        self._size += len(data)
+
+    def _rotate(self, hour):
+        if self._file is not None:
+            self._file.close()
+        self._segment = self._segment + 1 if hour == self._hour else 0
+        self._hour = hour
+        stamp = datetime.fromtimestamp(hour * 3600).strftime("%Y%m%d-%H")
+        while True:
+            path = os.path.join(self.directory, f"audit-{stamp}-{os.getpid()}-{self._segment}.gz")
+            if not os.path.exists(path):
+                break
+            self._segment += 1
+        self._file = gzip.open(path, "wb", compresslevel=6)
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        self._expire()
+
+    def _expire(self):
+        if not self.keep_days:
+            return
+        oldest = datetime.fromtimestamp(time.time() - self.keep_days * 86400).strftime("%Y%m%d-%H")
+        for name in os.listdir(self.directory):
+            match = _FILE_NAME.match(name)
+            if match and match.group(1) < oldest:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def close(self):
+        self._stopped.set()
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def audit_files(paths):
+    """Файлы журнала из списка файлов и каталогов, по времени"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in os.listdir(path) if _FILE_NAME.match(name))
+        else:
+            files.append(path)
+    return sorted(files, key=lambda path: _FILE_NAME.sub(r"\1", os.path.basename(path)))
+
+
+def read_events(path, chunk_size=2 ** 20):
+    """События файла журнала: (время мс, HWID, эндпоинт, статус, результат, IP)
+
+    Файл читается кусками по chunk_size, поэтому память не зависит от его
+    размера. Оборванный хвост (сбой во время записи) пропускается.
+    """
+    with gzip.open(path, "rb") as f:
+        buffer = b""
+        try:
+            buffer = f.read(len(MAGIC))
+            if buffer != MAGIC:
+                raise ValueError(f"{path}: не журнал аудита")
+            buffer = b""
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                buffer += chunk
+                offset = 0
+                while offset + HEADER.size <= len(buffer):
+                    timestamp, status, endpoint, result, hwid_length, ip_length = HEADER.unpack_from(buffer, offset)
+                    end = offset + HEADER.size + hwid_length + ip_length
+                    if end > len(buffer):
+                        break
+                    hwid_end = offset + HEADER.size + hwid_length
+                    yield (timestamp, buffer[offset + HEADER.size:hwid_end].decode("utf-8", "replace"),
+                           ENDPOINTS[endpoint] if endpoint < len(ENDPOINTS) else "other", status,
+                           RESULTS[result] if result < len(RESULTS) else "other",
+                           buffer[hwid_end:end].decode("ascii", "replace"))
+                    offset = end
+                buffer = buffer[offset:]
+        except (EOFError, zlib.error):
+            return
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Кэш записей лицензий перед внешним хранилищем (SQLite, общее хранилище pre-fork)
+
+Записи живут ttl секунд, при переполнении вытесняется та, к которой дольше
+всех не обращались (LRU). Неизвестные HWID тоже кэшируются (на negative_ttl
+секунд), поэтому поток запросов с несуществующими HWID не доходит до
+хранилища. Изменения из админки, прошедшие через кэш, сразу его сбрасывают.
+У воркеров pre-fork режима общий счетчик таких изменений в разделяемой
+памяти: изменение в одном воркере сбрасывает кэши всех остальных при их
+следующем обращении. Прочие изменения из других процессов (учет
+использований) видны не позже чем через ttl.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from license_store import check_license_data
+
+NOT_FOUND = "Лицензия не найдена"
+# Метка "лицензии нет" в кэше (None означает "в кэше ничего")
+_MISSING = object()
+
+
+class LicenseCache:
+    """Ограниченный LRU-кэш hwid -> запись с временем жизни"""
+
+    def __init__(self, max_entries=100000, ttl=5.0, negative_ttl=30.0, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Номер сброса: запись, прочитанная из хранилища до сброса, в кэш уже не попадет
+        self._generation = 0
+        # Счетчик изменений из админки, общий для процессов (multiprocessing.Value("Q")),
+        # и его значение при последнем сбросе этого кэша
+        self._shared = shared
+        self._shared_seen = shared.value if shared is not None else 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _sync(self):
+        # Под self._lock: сброс, если лицензии менял другой процесс (чтение без блокировки Value)
+        if self._shared is None:
+            return
+        value = self._shared.get_obj().value
+        if value != self._shared_seen:
+            self._shared_seen = value
+            self._generation += 1
+            self._entries.clear()
+
+    def get(self, hwid):
+        """Запись, _MISSING (лицензии нет) или None (в кэше ничего)"""
+        now = time.monotonic()
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(hwid)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[hwid]
+                return None
+            self._entries.move_to_end(hwid)
+            return entry[1]
+
+    def record(self, result):
+        """Учет обращения: hit, negative_hit (ответ из кэша) или miss (запрос к хранилищу)"""
+        with self._lock:
+            if result == "hit":
+                self.hits += 1
+            elif result == "negative_hit":
+                self.negative_hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def generation(self):
+        with self._lock:
+            self._sync()
+            return self._generation
+
+    def put(self, hwid, license_data, generation):
+        """Запись в кэш (license_data=None - лицензии нет), если с generation не было сбросов"""
+        if license_data is None:
+            expires, license_data = time.monotonic() + self.negative_ttl, _MISSING
+        else:
+            expires, license_data = time.monotonic() + self.ttl, dict(license_data)
+        with self._lock:
+            self._sync()
+            if generation != self._generation:
+                return
+            self._entries[hwid] = (expires, license_data)
+            self._entries.move_to_end(hwid)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, hwid):
+        """Сброс записи после изменения лицензии (и кэшей других процессов, если счетчик общий)"""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(hwid, None)
+            if self._shared is not None:
+                with self._shared.get_lock():
+                    seen = self._shared.value
+                    self._shared.value = seen + 1
+                if seen != self._shared_seen:
+                    # Другой процесс тоже менял лицензии - сбрасываем весь кэш
+                    self._entries.clear()
+                self._shared_seen = seen + 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else None
+        }
+
+
+class CachedLicenseStore:
+    """Хранилище лицензий с кэшем чтения (те же методы, что у LicenseStore)
+
+    Через кэш отвечают get() и отказы проверки: неизвестный HWID, истекший
+    срок и исчерпанные использования. Такой отказ может снять только
+    изменение из админки, а оно сбрасывает запись в кэше. Успешная проверка
+    всегда идет в хранилище (там атомарный учет использования), а ее
+    результат обновляет кэш.
+    """
+
+    def __init__(self, store, cache):
+        self.store = store
+        self.cache = cache
+
+    @property
+    def recovery_time(self):
+        return getattr(self.store, "recovery_time", 0.0)
+
+    def __contains__(self, hwid):
+        return self.get(hwid) is not None
+
+    def __len__(self):
+        return len(self.store)
+
+    def _cached_refusal(self, hwid, current_time):
+        # Отказ по закэшированной записи или None, если нужно идти в хранилище
+        license_data = self.cache.get(hwid)
+        if license_data is _MISSING:
+            self.cache.record("negative_hit")
+            return False, NOT_FOUND
+        if license_data is not None:
+            is_valid, message, activate = check_license_data(license_data, current_time)
+            if not is_valid:
+                self.cache.record("hit")
+                return False, message
+        self.cache.record("miss")
+        return None
+
+    def _remember(self, hwid, message, license_data, generation):
+        if license_data is None and message != NOT_FOUND:
+            # Хранилище отказало, не вернув запись: берем ее, чтобы следующие отказы шли из кэша
+            license_data = self.store.get(hwid)
+        self.cache.put(hwid, license_data, generation)
+
+    def get(self, hwid):
+        """Запись лицензии (из кэша, если есть) или None"""
+        license_data = self.cache.get(hwid)
+        if license_data is _MISSING:
+            self.cache.record("negative_hit")
+            return None
+        if license_data is not None:
+            self.cache.record("hit")
+            return dict(license_data)
+        self.cache.record("miss")
+        generation = self.cache.generation
+        license_data = self.store.get(hwid)
+        self.cache.put(hwid, license_data, generation)
+        return license_data
+
+    def validate(self, hwid, current_time):
+        refusal = self._cached_refusal(hwid, current_time)
+        if refusal is not None:
+            return refusal
+        generation = self.cache.generation
+        is_valid, message = self.store.validate(hwid, current_time)
+        # Активация могла изменить запись, поэтому кэшируем ее заново
+        self._remember(hwid, message, None, generation)
+        return is_valid, message
+
+    def use(self, hwid, current_time):
+        refusal = self._cached_refusal(hwid, current_time)
+        if refusal is not None:
+            return refusal + (None,)
+        generation = self.cache.generation
+        is_valid, message, license_data = self.store.use(hwid, current_time)
+        self._remember(hwid, message, license_data, generation)
+        return is_valid, message, license_data
+
+    def increment(self, hwid, current_time):
+        generation = self.cache.generation
+        license_data = self.store.increment(hwid, current_time)
+        self.cache.put(hwid, license_data, generation)
+        return license_data
+
+    # Изменения из админки: после записи в хранилище запись в кэше сбрасывается
+
+    def add(self, hwid, license_data):
+        try:
+            return self.store.add(hwid, license_data)
+        finally:
+            self.cache.discard(hwid)
+
+    def update(self, hwid, **fields):
+        try:
+            return self.store.update(hwid, **fields)
+        finally:
+            self.cache.discard(hwid)
+
+    def extend(self, hwid, seconds):
+        try:
+            return self.store.extend(hwid, seconds)
+        finally:
+            self.cache.discard(hwid)
+
+    def delete(self, hwid):
+        try:
+            return self.store.delete(hwid)
+        finally:
+            self.cache.discard(hwid)
+
+    def bulk(self, operations):
+        try:
+            return self.store.bulk(operations)
+        finally:
+            for op, hwid, fields in operations:
+                self.cache.discard(hwid)
+
+    # Остальное - напрямую в хранилище
+
+    def items(self):
+        return self.store.items()
+
+    def keys(self):
+        return self.store.keys()
+
+    def get_many(self, hwids):
+        return self.store.get_many(hwids)
+
+    def stats(self, current_time):
+        return self.store.stats(current_time)
+
+    def page(self, *args, **kwargs):
+        return self.store.page(*args, **kwargs)
+
+    def search(self, query, limit=50):
+        return self.store.search(query, limit)
+
+    def changes(self, epoch, after, timeout=0):
+        return self.store.changes(epoch, after, timeout)
+
+    def replication_stats(self):
+        return self.store.replication_stats()
+
+    def watch(self, after=None):
+        return self.store.watch(after)
+
+    def unwatch(self):
+        return self.store.unwatch()
+
+    def changed(self, after, timeout=0, limit=1000):
+        return self.store.changed(after, timeout, limit)
+
+    def flush(self):
+        return self.store.flush()
+
+    def close(self):
+        self.cache.clear()
+        self.store.close()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Кодирование ответов: быстрый JSON и сжатие по Accept-Encoding
+
+С пакетом orjson (pip install orjson) JSON сериализуется и разбирается в
+несколько раз быстрее; без него - стандартный json с теми же настройками
+(компактно, ключи по алфавиту). С пакетом brotli (pip install brotli)
+клиентам, которые его принимают, отдается br - на тексте он плотнее gzip;
+без него - только gzip.
+"""
+
+import gzip
+import json
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Сжимается только текст: остальное либо уже сжато, либо не отдается
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "application/javascript", "text/")
+# Кодировки в порядке предпочтения при равном q у клиента
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+GZIP_LEVEL = 6
+# Качество 11 (по умолчанию) в десятки раз медленнее при выигрыше в несколько процентов
+BROTLI_QUALITY = 5
+
+
+def dumps(payload):
+    """JSON в байтах: компактно, ключи по алфавиту, не-ASCII без экранирования"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # Целые больше 64 бит и прочее, чего orjson не умеет
+            pass
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data):
+    """Разбор JSON (ValueError при ошибке, как у json.loads)"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def choose_encoding(accept_encoding):
+    """br или gzip по заголовку Accept-Encoding (q=0 - запрет), None - без сжатия"""
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding):
+    """Сжатие тела ответа выбранной choose_encoding кодировкой"""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0: одинаковое тело - одинаковые байты
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from itertools import islice
+
+
+class SortedIndex:
+    """Отсортированный список ключей, разбитый на блоки
+
+    Вставка и удаление сдвигают только один блок (O(sqrt n) вместо O(n)
+    у обычного списка), поиск - бинарный по максимумам блоков.
+    """
+
+    LOAD = 1000
+    # Ключей в части при построении: сортировка всего списка одним вызовом держит
+    # GIL все время, и проверки лицензий в других потоках стояли бы за ней
+    RUN = 10000
+
+    def __init__(self, keys=()):
+        keys = list(keys)
+        if len(keys) > self.RUN:
+            keys = list(heapq.merge(*[sorted(keys[i:i + self.RUN]) for i in range(0, len(keys), self.RUN)]))
+        else:
+            keys.sort()
+        self._blocks = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        return j < len(block) and block[j] == key
+
+    def add(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            return
+
+        i = min(bisect_left(self._maxes, key), len(self._maxes) - 1)
+        block = self._blocks[i]
+        insort(block, key)
+        self._maxes[i] = block[-1]
+        self._len += 1
+
+        # Слишком большой блок делим пополам
+        if len(block) > 2 * self.LOAD:
+            self._blocks[i:i + 1] = [block[:self.LOAD], block[self.LOAD:]]
+            self._maxes[i:i + 1] = [block[self.LOAD - 1], block[-1]]
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return
+        block = self._blocks[i]
+        j = bisect_left(block, key)
+        if j == len(block) or block[j] != key:
+            return
+        del block[j]
+        self._len -= 1
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+
+    def after(self, key, count):
+        """До count ключей строго больше key (с начала, если key is None)"""
+        if key is None:
+            i, j = 0, 0
+        else:
+            i = bisect_right(self._maxes, key)
+            j = bisect_right(self._blocks[i], key) if i < len(self._blocks) else 0
+
+        result = []
+        while i < len(self._blocks) and len(result) < count:
+            block = self._blocks[i]
+            result.extend(block[j:j + count - len(result)])
+            i, j = i + 1, 0
+        return result
+
+    def before(self, key, count):
+        """До count ключей строго меньше key по убыванию (с конца, если key is None)"""
+        if key is None:
+            i = len(self._blocks) - 1
+            j = len(self._blocks[i]) if i >= 0 else 0
+        else:
+            i = bisect_left(self._maxes, key)
+            if i == len(self._blocks):
+                i -= 1
+                j = len(self._blocks[i]) if i >= 0 else 0
+            else:
+                j = bisect_left(self._blocks[i], key)
+
+        result = []
+        while i >= 0 and len(result) < count:
+            block = self._blocks[i]
+            start = max(0, j - (count - len(result)))
+            result.extend(reversed(block[start:j]))
+            i -= 1
+            j = len(self._blocks[i]) if i >= 0 else 0
+        return result
+
+
+def _expires_at(license_data):
+    # Не активированные лицензии еще не истекают, в индексе они в начале
+    if license_data["created_at"] == 0:
+        return 0
+    return license_data["created_at"] + license_data["subscription_duration"]
+
+
+def _same_status(old, new):
+    # Статус (license_status) у записей совпадает в любой момент времени
+    return (_expires_at(old) == _expires_at(new)
+            and (old["created_at"] == 0) == (new["created_at"] == 0)
+            and (old["use_count"] >= old["max_uses"]) == (new["use_count"] >= new["max_uses"]))
+
+
+# Сортировки админки: значение ключа по записи (ключ индекса - (значение, hwid))
+SORTS = {
+    "hwid": lambda hwid, license_data: hwid,
+    "user_name": lambda hwid, license_data: str(license_data["user_name"]),
+    "expires_at": lambda hwid, license_data: _expires_at(license_data),
+    "created_at": lambda hwid, license_data: license_data["created_at"],
+}
+
+
+class LicenseIndex:
+    """Вторичные индексы таблицы лицензий для постраничного списка в админке
+
+    Обновляется слушателем хранилища; ключи меняются только при добавлении,
+    удалении, активации и правке срока или имени, поэтому учет использований
+    индекс не трогает. Строится при первом запросе (build), чтобы не
+    замедлять старт сервера сортировкой всей таблицы.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = None
+
+    @property
+    def built(self):
+        return self._indexes is not None
+
+    def build(self, records):
+        """Построение индексов; таблица не должна меняться во время вызова"""
+        indexes = {
+            name: SortedIndex((key(hwid, license_data), hwid) for hwid, license_data in records.items())
+            for name, key in SORTS.items()
+        }
+        with self._lock:
+            self._indexes = indexes
+
+    def __call__(self, hwid, old, new):
+        if self._indexes is None:
+            return
+        for name, key in SORTS.items():
+            old_key = (key(hwid, old), hwid) if old is not None else None
+            new_key = (key(hwid, new), hwid) if new is not None else None
+            if old_key == new_key:
+                continue
+            with self._lock:
+                if old_key is not None:
+                    self._indexes[name].remove(old_key)
+                if new_key is not None:
+                    self._indexes[name].add(new_key)
+
+    def scan(self, sort, key, count, descending=False):
+        """До count ключей (значение, hwid) индекса sort после key"""
+        with self._lock:
+            index = self._indexes[sort]
+            return index.before(key, count) if descending else index.after(key, count)
+
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def name_words(name):
+    """Слова имени для поиска: буквы и цифры в нижнем регистре ("Makaron_Old" -> makaron, old)"""
+    return set(_WORD.findall(str(name).lower())) if name is not None else set()
+
+
+def name_matches(name, prefixes):
+    """Каждое из prefixes - начало какого-то слова имени"""
+    words = name_words(name)
+    return all(any(word.startswith(prefix) for word in words) for prefix in prefixes)
+
+
+class SearchIndex:
+    """Индексы для поиска в админке: отсортированные HWID и слова имен
+
+    HWID лежат в SortedIndex - поиск по началу HWID бинарный. Для имен -
+    обратный индекс: слово -> множество HWID, а сами слова тоже в
+    SortedIndex, поэтому слова с заданным началом находятся так же.
+    Обновляется слушателем хранилища (учет использований индекс не
+    трогает); строится при первом поиске (build).
+    """
+
+    # Сколько слов индекса может подойти к одному слову запроса
+    MAX_WORDS = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hwids = None
+        self._postings = None
+        self._words = None
+
+    @property
+    def built(self):
+        return self._postings is not None
+
+    def build(self, records):
+        """Построение индексов; таблица не должна меняться во время вызова"""
+        keys = SortedIndex(records)
+        postings = {}
+        for hwid, license_data in records.items():
+            for word in name_words(license_data["user_name"]):
+                hwids = postings.get(word)
+                if hwids is None:
+                    hwids = postings[word] = set()
+                hwids.add(hwid)
+        words = SortedIndex(postings)
+        with self._lock:
+            self._hwids, self._postings, self._words = keys, postings, words
+
+    def __call__(self, hwid, old, new):
+        if self._postings is None:
+            return
+        if (old is None) != (new is None):
+            with self._lock:
+                if new is None:
+                    self._hwids.remove(hwid)
+                else:
+                    self._hwids.add(hwid)
+        old_words = name_words(old["user_name"]) if old is not None else set()
+        new_words = name_words(new["user_name"]) if new is not None else set()
+        if old_words == new_words:
+            return
+        with self._lock:
+            for word in old_words - new_words:
+                hwids = self._postings.get(word)
+                if hwids is None:
+                    continue
+                hwids.discard(hwid)
+                if not hwids:
+                    del self._postings[word]
+                    self._words.remove(word)
+            for word in new_words - old_words:
+                hwids = self._postings.get(word)
+                if hwids is None:
+                    hwids = self._postings[word] = set()
+                    self._words.add(word)
+                hwids.add(hwid)
+
+    def hwids(self, prefix, count):
+        """До count HWID, начинающихся с prefix, по возрастанию"""
+        result = []
+        key = prefix
+        with self._lock:
+            # after() ключ prefix не возвращает
+            if prefix in self._hwids:
+                result.append(prefix)
+            while len(result) < count:
+                batch = self._hwids.after(key, count - len(result))
+                if not batch:
+                    break
+                for key in batch:
+                    if not key.startswith(prefix):
+                        return result
+                    result.append(key)
+        return result
+
+    def _starting_with(self, prefix):
+        # Слова индекса, начинающиеся с prefix (под блокировкой)
+        words = [prefix] if prefix in self._postings else []
+        key = prefix
+        while len(words) < self.MAX_WORDS:
+            batch = self._words.after(key, 500)
+            if not batch:
+                break
+            for key in batch:
+                if not key.startswith(prefix):
+                    return words
+                words.append(key)
+        return words
+
+    def by_name(self, query, limit, lookup, max_scan=100000):
+        """Лицензии, у которых каждое слово query - начало какого-то слова имени
+
+        lookup(hwid) -> запись или None. Перебираются HWID самого редкого
+        слова запроса, остальные слова проверяются по имени записи; после
+        max_scan проверенных HWID поиск останавливается. Возвращает (список
+        (hwid, запись) не длиннее limit, есть ли еще совпадения).
+        """
+        query = sorted(name_words(query))
+        if not query:
+            return [], False
+        results = []
+        with self._lock:
+            matches = [self._starting_with(prefix) for prefix in query]
+            if not all(matches):
+                return [], False
+            rarest = min(matches, key=lambda words: sum(len(self._postings[word]) for word in words))
+            seen = set()
+            for word in rarest:
+                for hwid in self._postings[word]:
+                    if hwid in seen:
+                        continue
+                    seen.add(hwid)
+                    if len(seen) > max_scan:
+                        return results, True
+                    license_data = lookup(hwid)
+                    if license_data is None:
+                        continue
+                    if name_matches(license_data["user_name"], query):
+                        if len(results) == limit:
+                            return results, True
+                        results.append((hwid, license_data))
+        return results, False
+
+
+class ExpiryQueue:
+    """Очередь сроков истечения: min-куча (срок, hwid) с ленивым удалением
+
+    Перенос или снятие срока не ищет старую запись в куче, а только меняет
+    словарь актуальных сроков; устаревшие записи выбрасываются при извлечении.
+    Все операции - O(log n). Потокобезопасность - на стороне вызывающего.
+    """
+
+    def __init__(self, deadlines=None):
+        self._deadlines = dict(deadlines or {})
+        self._heap = [(deadline, hwid) for hwid, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def push(self, hwid, deadline):
+        if self._deadlines.get(hwid) == deadline:
+            return
+        self._deadlines[hwid] = deadline
+        heapq.heappush(self._heap, (deadline, hwid))
+
+        # Устаревших записей не должно быть больше, чем актуальных
+        if len(self._heap) > 2 * len(self._deadlines) + 1024:
+            self._heap = [(deadline, hwid) for hwid, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, hwid):
+        self._deadlines.pop(hwid, None)
+
+    def peek(self):
+        """Ближайший срок или None"""
+        heap = self._heap
+        while heap and self._deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def pop_due(self, current_time, limit=None):
+        """Извлечение всех (срок, hwid) со сроком не позже current_time"""
+        due = []
+        heap = self._heap
+        while heap and heap[0][0] - current_time <= 0 and (limit is None or len(due) < limit):
+            deadline, hwid = heapq.heappop(heap)
+            if self._deadlines.get(hwid) != deadline:
+                continue
+            del self._deadlines[hwid]
+            due.append((deadline, hwid))
+        return due
+
+
+class LicenseStats:
+    """Счетчики лицензий по статусам для админки, обновляются при каждом изменении
+
+    Переход "активна -> истекла по времени" происходит без изменения записи,
+    поэтому сроки истечения активированных лицензий лежат в ExpiryQueue и
+    обрабатываются по мере наступления (O(log n) на переход). Статусы -
+    как у license_status: active, expired_time, expired_uses, not_activated.
+    """
+
+    STATUSES = ("active", "expired_time", "expired_uses", "not_activated")
+
+    def __init__(self, status):
+        self._status = status
+        self._lock = threading.Lock()
+        self._counts = None
+        self._now = 0
+        self._queue = ExpiryQueue()
+        # Сроки только активных лицензий (для next_expiry): в _queue есть и исчерпавшие использования
+        self._active = ExpiryQueue()
+        # Еще не истекшие лицензии из очереди: hwid -> учтенный статус
+        self._tracked = {}
+
+    @property
+    def built(self):
+        return self._counts is not None
+
+    def build(self, records, current_time):
+        """Подсчет по всей таблице; таблица не должна меняться во время вызова"""
+        counts = dict.fromkeys(self.STATUSES, 0)
+        deadlines = {}
+        tracked = {}
+        for hwid, license_data in records.items():
+            status = self._status(license_data, current_time)
+            counts[status] += 1
+            if status == "active" or status == "expired_uses":
+                deadlines[hwid] = _expires_at(license_data)
+                tracked[hwid] = status
+        active = {hwid: deadlines[hwid] for hwid, status in tracked.items() if status == "active"}
+        with self._lock:
+            self._counts, self._tracked = counts, tracked
+            self._queue = ExpiryQueue(deadlines)
+            self._active = ExpiryQueue(active)
+            self._now = current_time
+
+    def _advance(self, current_time):
+        # Время не должно идти назад, иначе статусы разойдутся с уже учтенными переходами
+        current_time = max(current_time, self._now)
+        self._now = current_time
+
+        # Переводим в "истекла по времени" все, чей срок наступил
+        for expires_at, hwid in self._queue.pop_due(current_time):
+            self._counts[self._tracked.pop(hwid)] -= 1
+            self._counts["expired_time"] += 1
+        self._active.pop_due(current_time)
+        return current_time
+
+    def __call__(self, hwid, old, new):
+        if self._counts is None:
+            return
+        if old is not None and new is not None and _same_status(old, new):
+            # Учет использования без смены статуса - без блокировки и без time()
+            return
+        with self._lock:
+            # Сначала догоняем истечения, чтобы статус old совпал с уже учтенным
+            current_time = self._advance(int(time.time()))
+            old_status = self._status(old, current_time) if old is not None else None
+            new_status = self._status(new, current_time) if new is not None else None
+            if old_status == new_status and (old is None or _expires_at(old) == _expires_at(new)):
+                return
+
+            if old_status:
+                self._counts[old_status] -= 1
+            if new_status:
+                self._counts[new_status] += 1
+
+            if new_status == "active" or new_status == "expired_uses":
+                self._queue.push(hwid, _expires_at(new))
+                self._tracked[hwid] = new_status
+            else:
+                self._queue.discard(hwid)
+                self._tracked.pop(hwid, None)
+            if new_status == "active":
+                self._active.push(hwid, _expires_at(new))
+            else:
+                self._active.discard(hwid)
+
+    def snapshot(self, current_time):
+        """Текущие счетчики (O(1) плюс наступившие с прошлого раза истечения)"""
+        with self._lock:
+            self._advance(current_time)
+            counts = dict(self._counts)
+            next_expiry = self._active.peek()
+        counts["total"] = sum(counts[status] for status in self.STATUSES)
+        counts["expired"] = counts["total"] - counts["active"]
+        counts["next_expiry"] = next_expiry
+        return counts
+
+
+class ExpiryIndex:
+    """Сроки истечения всех активированных лицензий (для выселения в холодное хранилище)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+
+    @property
+    def built(self):
+        return self._queue is not None
+
+    def build(self, records):
+        """Построение очереди; таблица не должна меняться во время вызова"""
+        deadlines = {hwid: _expires_at(license_data)
+                     for hwid, license_data in records.items() if license_data["created_at"] != 0}
+        with self._lock:
+            self._queue = ExpiryQueue(deadlines)
+
+    def __call__(self, hwid, old, new):
+        if self._queue is None:
+            return
+        expires_at = _expires_at(new) if new is not None else 0
+        if old is not None and _expires_at(old) == expires_at:
+            return
+        with self._lock:
+            if expires_at:
+                self._queue.push(hwid, expires_at)
+            else:
+                self._queue.discard(hwid)
+
+    def pop_due(self, current_time, limit=None):
+        """(срок, hwid) лицензий, истекших не позже current_time; они уходят из очереди"""
+        with self._lock:
+            return self._queue.pop_due(current_time, limit)
+
+
+class ChangeFeed:
+    """HWID измененных лицензий по порядку для живого обновления админки"""
+
+    def __init__(self, size=100000):
+        self._cond = threading.Condition()
+        self._hwids = deque(maxlen=size)
+        self._seq = 0
+
+    def reset(self):
+        """Начало записи после перерыва: прежние номера ведут к перечитыванию страницы"""
+        with self._cond:
+            self._hwids.clear()
+            self._seq += 1
+
+    def __call__(self, hwid, old, new):
+        with self._cond:
+            self._seq += 1
+            self._hwids.append(hwid)
+            self._cond.notify_all()
+
+    def read(self, after, timeout=0, limit=1000):
+        """(номер, HWID лицензий, измененных после after, без повторов)
+
+        Без изменений ждет до timeout секунд. Вместо списка - None, если
+        after уже вытеснен из буфера или изменилось больше limit лицензий:
+        дешевле перечитать страницу целиком. after=None - только текущий номер.
+        """
+        with self._cond:
+            if after is None:
+                return self._seq, []
+            if not self._seq - len(self._hwids) <= after <= self._seq:
+                return self._seq, None
+            if after == self._seq and timeout:
+                self._cond.wait_for(lambda: self._seq > after, timeout)
+            hwids = dict.fromkeys(islice(reversed(self._hwids), self._seq - after))
+            if len(hwids) > limit:
+                return self._seq, None
+            return self._seq, list(hwids)
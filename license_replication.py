@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Репликация таблицы лицензий: лидер и фолловеры
+
+Лидер (LICENSE_ROLE=leader) выполняет все изменения, в том числе учет
+использований, поэтому max_uses соблюдается так же точно, как на одном
+узле. Каждое изменение попадает в ReplicationLog - кольцевой буфер
+(номер, hwid, запись). Фолловер (LICENSE_ROLE=follower) держит копию
+таблицы в памяти: забирает изменения длинным опросом GET /replication,
+сам отвечает на чтение (/get_license_info, списки и статистика админки),
+а запросы с изменениями (все, кроме GET) пересылает лидеру.
+
+Если фолловер отстал больше чем на размер буфера или лидер перезапустился
+(сменилась эпоха), лидер отдает снимок всей таблицы.
+"""
+
+import http.client
+import os
+import queue
+import threading
+import time
+from collections import deque
+from urllib.parse import urlencode, urlsplit
+
+from license_http import loads
+
+# Изменений в одном ответе /replication
+BATCH_LIMIT = 10000
+
+
+class ReplicationLog:
+    """Журнал изменений лидера для фолловеров (слушатель LicenseStore)"""
+
+    def __init__(self, size=50000):
+        # Эпоха меняется при каждом запуске: номера изменений начинаются заново
+        self.epoch = os.urandom(8).hex()
+        self._cond = threading.Condition()
+        self._entries = deque(maxlen=size)
+        self._seq = 0
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def __call__(self, hwid, old, new):
+        with self._cond:
+            self._seq += 1
+            self._entries.append((self._seq, hwid, dict(new) if new is not None else None))
+            self._cond.notify_all()
+
+    def read(self, epoch, after, timeout, items):
+        """Изменения после номера after; items() - снимок таблицы, если догнать по журналу нельзя
+
+        Без новых изменений ждет до timeout секунд. Возвращает {"epoch",
+        "seq", "entries": [[номер, hwid, запись или None], ...]} или вместо
+        entries "snapshot": [[hwid, запись], ...].
+        """
+        with self._cond:
+            oldest = self._entries[0][0] if self._entries else self._seq + 1
+            if epoch == self.epoch and oldest - 1 <= after <= self._seq:
+                if after == self._seq and timeout:
+                    self._cond.wait_for(lambda: self._seq > after, timeout)
+                entries = []
+                for entry in reversed(self._entries):
+                    if entry[0] <= after:
+                        break
+                    entries.append(entry)
+                entries.reverse()
+                entries = entries[:BATCH_LIMIT]
+                return {"epoch": self.epoch, "seq": entries[-1][0] if entries else after,
+                        "entries": [list(entry) for entry in entries]}
+            seq = self._seq
+
+        # Номер берется до снимка: изменения между ними придут еще раз, а запись
+        # целиком (не разница), поэтому повторное применение ничего не портит
+        return {"epoch": self.epoch, "seq": seq, "snapshot": [[hwid, license_data] for hwid, license_data in items()]}
+
+    def stats(self):
+        with self._cond:
+            return {"role": "leader", "epoch": self.epoch, "seq": self._seq, "buffered": len(self._entries)}
+
+
+class LeaderClient:
+    """HTTP-клиент лидера с пулом постоянных соединений"""
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        self.url = url
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname
+        self._port = parts.port
+        self._timeout = timeout
+        self._pool = queue.LifoQueue()
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        return cls(self._host, self._port, timeout=self._timeout)
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        """(статус, заголовки, тело) ответа лидера"""
+        for attempt in (0, 1):
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                connection.timeout = timeout or self._timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(connection.timeout)
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                # Лидер мог закрыть простаивавшее соединение - пробуем новое
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self._pool.put(connection)
+            return response.status, response.getheaders(), data
+
+
+class Follower:
+    """Фоновая синхронизация локальной копии таблицы с лидером"""
+
+    def __init__(self, client, store, key, wait=10):
+        self.client = client
+        self.store = store
+        self.key = key
+        self.wait = wait
+        self.epoch = None
+        self.seq = 0
+        self.synced = threading.Event()
+        self.last_contact = None
+        self.errors = 0
+        self._stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="license-follower", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def poll(self):
+        """Один запрос изменений к лидеру и их применение"""
+        query = urlencode({"key": self.key, "epoch": self.epoch or "", "after": self.seq, "wait": self.wait})
+        status, headers, body = self.client.request("GET", f"/replication?{query}", timeout=self.wait + 30)
+        if status != 200:
+            raise RuntimeError(f"Лидер ответил {status}: {body[:200]!r}")
+        result = loads(body)
+
+        if "snapshot" in result:
+            snapshot = dict(result["snapshot"])
+            changes = dict.fromkeys(set(self.store.keys()) - set(snapshot))
+            changes.update(snapshot)
+        else:
+            # Несколько изменений одной лицензии - достаточно последнего
+            changes = {hwid: license_data for seq, hwid, license_data in result["entries"]}
+        self.store.apply(changes)
+
+        self.epoch, self.seq = result["epoch"], result["seq"]
+        self.last_contact = time.time()
+        self.synced.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Replication from {self.client.url} failed: {e}")
+                self._stopped.wait(1)
+
+    def stats(self):
+        return {
+            "role": "follower",
+            "leader": self.client.url,
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "synced": self.synced.is_set(),
+            "last_contact": self.last_contact,
+            "errors": self.errors
+        }
@@ -1,17 +1,47 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_etags
 import hashlib
+import math
 import time
 import json
 import os
+import signal
+import sys
+import threading
+import csv
+import io
+import base64
 from datetime import datetime, timedelta
+from functools import lru_cache
 
-app = Flask(__name__)
+from license_store import FIELDS, LicenseStore, WriteAheadLog, NullLog, ColdStore, license_status
+from license_sqlite import SqliteLicenseStore
+from license_cache import CachedLicenseStore, LicenseCache
+from license_replication import ReplicationLog, LeaderClient, Follower
+from license_audit import AuditLog
+from license_http import COMPRESSIBLE, choose_encoding, compress, dumps
+from license_index import SORTS
+from license_tokens import TokenSigner, load_keys
+from rate_limit import TokenBuckets, LoadShedder, client_ip, request_start_delay
+from metrics import Counter, Histogram, Gauge, render, resident_memory, snapshot
 
-# Конфигурация лицензий (замените на свои данные)
-LICENSES = {
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify через license_http.dumps (orjson, если установлен)"""
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b"\n", mimetype=self.mimetype)
+
+# Статика админки отдается своим маршрутом (/admin/static), стандартный /static не нужен
+app = Flask(__name__, static_folder=None)
+app.json = FastJSONProvider(app)
+
+# Начальные лицензии для нового хранилища (замените на свои данные)
+DEFAULT_LICENSES = {
     # Замените на ваш реальный HWID
     "4553BEC6D63967B1": {
         "user_name": "Makaron_Old",
@@ -23,9 +53,158 @@ LICENSES = {
     }
 }
 
+# Хранилище лицензий: memory - таблица в памяти с журналом, sqlite - файл базы SQLite
+BACKEND = os.environ.get('LICENSE_BACKEND', 'memory')
+# Каталог с журналом и снапшотами (пустая строка - только в памяти)
+DATA_DIR = os.environ.get('LICENSE_DATA_DIR', 'data')
+FSYNC_INTERVAL_MS = int(os.environ.get('LICENSE_FSYNC_INTERVAL_MS', 10))  # Окно группового fsync
+SYNC_COMMIT = os.environ.get('LICENSE_SYNC_COMMIT', '0') == '1'  # Ждать fsync перед ответом
+SNAPSHOT_EVERY = int(os.environ.get('LICENSE_SNAPSHOT_EVERY', 100000))  # Операций между снапшотами
+# Формат снапшота: binary - отображается в память, запуск не читает записи; json - прежний
+SNAPSHOT_FORMAT = os.environ.get('LICENSE_SNAPSHOT_FORMAT', 'binary')
+# Учет использований пишется в журнал пачками раз в столько мс (0 - на каждый запрос)
+COUNTER_FLUSH_MS = int(os.environ.get('LICENSE_COUNTER_FLUSH_MS', 0 if SYNC_COMMIT else 1000))
+COUNTER_FLUSH_SIZE = int(os.environ.get('LICENSE_COUNTER_FLUSH_SIZE', 10000))  # Сброс раньше, если накопилось столько лицензий
+EVICT_AFTER_DAYS = int(os.environ.get('LICENSE_EVICT_AFTER_DAYS', 0))  # Через сколько дней после истечения убирать из памяти (0 - никогда)
+
+SQLITE_PATH = os.environ.get('LICENSE_SQLITE_PATH', os.path.join(DATA_DIR or 'data', 'licenses.db'))
+SQLITE_POOL_SIZE = int(os.environ.get('LICENSE_SQLITE_POOL_SIZE', 16))  # Соединений с базой одновременно
+
+# Кэш записей перед внешним хранилищем (SQLite, общее хранилище воркеров pre-fork); 0 - без кэша
+CACHE_SIZE = int(os.environ.get('LICENSE_CACHE_SIZE', 100000))
+CACHE_TTL = float(os.environ.get('LICENSE_CACHE_TTL', 5))  # Секунд жизни записи
+CACHE_NEGATIVE_TTL = float(os.environ.get('LICENSE_CACHE_NEGATIVE_TTL', 30))  # Секунд для неизвестных HWID
+
+def cached(store, shared=None):
+    """Хранилище за кэшем чтения (без изменений при LICENSE_CACHE_SIZE=0)
+
+    shared - общий для воркеров счетчик изменений из админки (см. LicenseCache).
+    """
+    if not CACHE_SIZE:
+        return store
+    return CachedLicenseStore(store, LicenseCache(CACHE_SIZE, CACHE_TTL, CACHE_NEGATIVE_TTL, shared))
+
+# Несколько узлов: standalone - один сервер, leader - выполняет изменения и раздает их,
+# follower - копия таблицы лидера в памяти, изменения пересылает лидеру
+ROLE = os.environ.get('LICENSE_ROLE', 'standalone')
+LEADER_URL = os.environ.get('LICENSE_LEADER_URL', 'http://localhost:5000')
+REPLICATION_LOG_SIZE = int(os.environ.get('LICENSE_REPLICATION_LOG_SIZE', 50000))  # Изменений в буфере лидера
+
+cold_store = None
+FOLLOWER = None
+if ROLE == 'follower':
+    LICENSES = LicenseStore()
+    FOLLOWER = Follower(LeaderClient(LEADER_URL), LICENSES, "FloraVisuals2024_Admin_Key_7x9K2mP8qR5")
+    FOLLOWER.start()
+elif BACKEND == 'sqlite':
+    LICENSES = cached(SqliteLicenseStore(SQLITE_PATH, seed=DEFAULT_LICENSES, sync_commit=SYNC_COMMIT, pool_size=SQLITE_POOL_SIZE))
+else:
+    if DATA_DIR:
+        license_log = WriteAheadLog(DATA_DIR, FSYNC_INTERVAL_MS / 1000, SYNC_COMMIT, SNAPSHOT_EVERY, SNAPSHOT_FORMAT)
+        cold_store = ColdStore(DATA_DIR)
+    else:
+        license_log = NullLog()
+    LICENSES = LicenseStore(license_log, seed=DEFAULT_LICENSES, cold=cold_store, evict_after=EVICT_AFTER_DAYS * 86400,
+                            flush_interval=COUNTER_FLUSH_MS / 1000, flush_size=COUNTER_FLUSH_SIZE,
+                            replication=ReplicationLog(REPLICATION_LOG_SIZE) if ROLE == 'leader' else None)
+
+# Журнал аудита проверок (пустая строка - не писать); файлы по часам, сжатые gzip
+AUDIT_DIR = os.environ.get('LICENSE_AUDIT_DIR', os.path.join(DATA_DIR, 'audit') if DATA_DIR else '')
+AUDIT_FILE_MB = int(os.environ.get('LICENSE_AUDIT_FILE_MB', 256))  # Несжатых МБ в файле до ротации
+AUDIT_KEEP_DAYS = int(os.environ.get('LICENSE_AUDIT_KEEP_DAYS', 30))  # Сколько дней хранить (0 - всегда)
+AUDIT_QUEUE = int(os.environ.get('LICENSE_AUDIT_QUEUE', 100000))  # Событий в очереди, дальше отбрасываются
+AUDIT = AuditLog(AUDIT_DIR, AUDIT_FILE_MB * 2 ** 20, AUDIT_KEEP_DAYS, AUDIT_QUEUE) if AUDIT_DIR else None
+
+# Максимум HWID в одном запросе /check_license/batch
+BATCH_LIMIT = int(os.environ.get('LICENSE_BATCH_LIMIT', 10000))
+
+# Количество процессов-воркеров (больше 1 - pre-fork режим с общим хранилищем)
+WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Лимиты публичных эндпоинтов: запросов в секунду и запас (0 - без лимита); в pre-fork режиме - на воркер
+IP_RATE = float(os.environ.get('LICENSE_IP_RATE', 50))
+IP_BURST = int(os.environ.get('LICENSE_IP_BURST', 100))
+HWID_RATE = float(os.environ.get('LICENSE_HWID_RATE', 2))
+HWID_BURST = int(os.environ.get('LICENSE_HWID_BURST', 20))
+RATE_TABLE_SIZE = int(os.environ.get('LICENSE_RATE_TABLE_SIZE', 100000))  # Сколько IP и HWID помнить
+TRUSTED_PROXIES = int(os.environ.get('LICENSE_TRUSTED_PROXIES', 0))  # Прокси перед сервером (X-Forwarded-For)
+SHED_QUEUE_MS = int(os.environ.get('LICENSE_SHED_QUEUE_MS', 500))  # Задержка в очереди, после которой отказываем
+MAX_INFLIGHT = int(os.environ.get('LICENSE_MAX_INFLIGHT', 0))  # Одновременных публичных запросов (0 - без лимита)
+
+IP_LIMITS = TokenBuckets(IP_RATE, IP_BURST, RATE_TABLE_SIZE) if IP_RATE > 0 else None
+HWID_LIMITS = TokenBuckets(HWID_RATE, HWID_BURST, RATE_TABLE_SIZE) if HWID_RATE > 0 else None
+SHEDDER = LoadShedder(SHED_QUEUE_MS / 1000, MAX_INFLIGHT)
+
+# Живое обновление админки: изменения копятся столько мс и уходят одним событием;
+# без изменений статистика обновляется раз в LICENSE_ADMIN_EVENTS_KEEPALIVE секунд
+ADMIN_EVENTS_MS = int(os.environ.get('LICENSE_ADMIN_EVENTS_MS', 1000))
+ADMIN_EVENTS_KEEPALIVE = float(os.environ.get('LICENSE_ADMIN_EVENTS_KEEPALIVE', 15))
+
+# Сколько секунд клиенты могут не перепроверять /get_license_info (ETag проверяется всегда)
+INFO_MAX_AGE = int(os.environ.get('LICENSE_INFO_MAX_AGE', 10))
+
+# Ответы от стольки байт сжимаются gzip или brotli, если клиент их принимает (0 - не сжимать)
+COMPRESS_MIN_BYTES = int(os.environ.get('LICENSE_COMPRESS_MIN_BYTES', 1024))
+
+# Стили и скрипт админки: в адресе хеш содержимого, поэтому браузер кэширует их
+# навсегда, а после деплоя с изменениями сразу загружает новую версию
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+def load_asset(name, mimetype):
+    """(содержимое, тип, версия) файла из static/"""
+    with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+        body = f.read()
+    return body, mimetype, hashlib.sha256(body).hexdigest()[:16]
+
+ADMIN_ASSETS = {
+    'admin.css': load_asset('admin.css', 'text/css; charset=utf-8'),
+    'admin.js': load_asset('admin.js', 'application/javascript; charset=utf-8'),
+}
+
+def asset_url(name):
+    return f"/admin/static/{name}?v={ADMIN_ASSETS[name][2]}"
+
+# Эндпоинты без авторизации, на которые действуют лимиты
+PUBLIC_ENDPOINTS = {'check_license', 'check_license_batch', 'check_license_token', 'get_license_info', 'increment_usage'}
+
+# Метрики для /metrics (0 - не собирать)
+METRICS_ENABLED = os.environ.get('LICENSE_METRICS', '1') != '0'
+REQUESTS = Counter("license_http_requests_total", "HTTP-запросы по маршруту, методу и статусу", ("route", "method", "status"))
+LATENCY = Histogram("license_http_request_duration_seconds", "Время обработки запроса по маршруту", ("route",))
+# validate - проверка и учет в хранилище, sign - сериализация и подпись ответа (один проход)
+STAGES = Histogram("license_stage_duration_seconds", "Время этапов проверки лицензии", ("stage",))
+# Pre-fork режим: раз в столько секунд воркер отправляет свои метрики мастеру
+METRICS_PUBLISH_INTERVAL = float(os.environ.get('LICENSE_METRICS_PUBLISH_INTERVAL', 5))
+# MetricsHub мастера и номер воркера (только в воркерах pre-fork режима)
+METRICS_HUB = None
+WORKER_ID = None
+
+def set_license_store(store, invalidations=None):
+    """Подмена хранилища лицензий (воркеры pre-fork режима получают прокси общего хранилища)"""
+    global LICENSES
+    # Каждое обращение к прокси - запрос к мастеру, поэтому в воркере перед ним свой кэш;
+    # изменения из админки сбрасывают кэши всех воркеров через общий счетчик invalidations
+    LICENSES = cached(store, invalidations)
+
+def set_metrics_hub(hub, worker):
+    """Подключение воркера pre-fork режима к метрикам мастера: /metrics отдает значения всех воркеров"""
+    global METRICS_HUB, WORKER_ID
+    METRICS_HUB, WORKER_ID = hub, worker
+
+    def publish_loop():
+        while True:
+            time.sleep(METRICS_PUBLISH_INTERVAL)
+            publish_metrics()
+
+    threading.Thread(target=publish_loop, name="metrics-publisher", daemon=True).start()
+
 # Секретный ключ для подписи (замените на свой)
 SECRET_KEY = "FloraVisuals2024SecretKey"
 
+# Токены для офлайн-проверки: ключи (JSON-список, первый подписывает) и срок жизни токена
+TOKEN_SIGNER = TokenSigner(load_keys(os.environ.get('LICENSE_TOKEN_KEYS'), SECRET_KEY))
+TOKEN_TTL = int(os.environ.get('LICENSE_TOKEN_TTL', 86400))
+
 def generate_signature(data):
     """Генерация подписи для проверки целостности"""
     message = f"{data}{SECRET_KEY}"
@@ -33,29 +212,247 @@ def generate_signature(data):
 
 def validate_license(hwid):
     """Проверка валидности лицензии"""
-    if hwid not in LICENSES:
-        return False, "Лицензия не найдена"
+    return LICENSES.validate(hwid, int(time.time()))
+
+def license_response(message, license_data, current_time):
+    """Подписанный ответ на успешную проверку лицензии"""
+    # Вычисляем оставшееся время
+    license_created = license_data["created_at"]
+    duration = license_data["subscription_duration"]
+    expiration_time = license_created + duration
+    remaining_time = max(0, expiration_time - current_time)
+    
+    response_data = {
+        "valid": True,
+        "message": message,
+        "user_name": license_data["user_name"],
+        "expiration_time": expiration_time,
+        "remaining_time": remaining_time,
+        "use_count": license_data["use_count"],
+        "max_uses": license_data["max_uses"]
+    }
+    
+    # Добавляем подпись
+    signature = generate_signature(json.dumps(response_data, sort_keys=True))
+    response_data["signature"] = signature
+    return response_data
 
-    license_data = LICENSES[hwid]
+@lru_cache(maxsize=65536)
+def signed_parts(expiration_time, max_uses, message, user_name):
+    """Неизменные между проверками части подписанного ответа
 
-    # Проверяем количество использований
-    if license_data["use_count"] >= license_data["max_uses"]:
-        return False, "Превышено максимальное количество использований"
+    Подписывается json.dumps(..., sort_keys=True), поэтому порядок полей
+    фиксирован: expiration_time, max_uses, message, remaining_time,
+    use_count, user_name, valid. Возвращает (sha256 от начала, начало,
+    конец вместе с SECRET_KEY для хеша, конец для тела ответа).
+    """
+    head = (f'{{"expiration_time": {json.dumps(expiration_time)}, "max_uses": {json.dumps(max_uses)}, '
+            f'"message": {json.dumps(message)}, "remaining_time": ')
+    tail = f', "user_name": {json.dumps(user_name)}, "valid": true}}'
+    return hashlib.sha256(head.encode()), head, f"{tail}{SECRET_KEY}".encode(), tail[:-1]
 
-    # Если лицензия еще не была использована, устанавливаем время создания
-    if license_data["created_at"] == 0:
-        license_data["created_at"] = int(time.time())
-        return True, "Лицензия активирована"
+def license_response_json(message, license_data, current_time):
+    """Тело подписанного ответа (как json.dumps(license_response(...))): сериализация и подпись за один проход"""
+    expiration_time = license_data["created_at"] + license_data["subscription_duration"]
+    remaining_time = max(0, expiration_time - current_time)
+    use_count = license_data["use_count"]
+    try:
+        head_hash, head, signed_tail, tail = signed_parts(expiration_time, license_data["max_uses"], message, license_data["user_name"])
+    except TypeError:
+        # Нехешируемое имя или лимит - собираем ответ обычным путем
+        return json.dumps(license_response(message, license_data, current_time), sort_keys=True)
 
-    # Проверяем время истечения
-    current_time = int(time.time())
-    license_created = license_data["created_at"]
-    duration = license_data["subscription_duration"]
+    # Целые числа json.dumps пишет как str, остальное - через json
+    middle = (f'{remaining_time if type(remaining_time) is int else json.dumps(remaining_time)}, "use_count": '
+              f'{use_count if type(use_count) is int else json.dumps(use_count)}')
+    signature = head_hash.copy()
+    signature.update(middle.encode())
+    signature.update(signed_tail)
+    return f'{head}{middle}{tail}, "signature": "{signature.hexdigest()}"}}'
+
+def license_token(hwid, message, license_data, current_time):
+    """Ответ с токеном: клиент проверяет его сам и приходит снова к refresh_at"""
+    expiration_time = license_data["created_at"] + license_data["subscription_duration"]
+    expires_at = min(expiration_time, current_time + TOKEN_TTL)
+    token = TOKEN_SIGNER.issue({
+        "sub": hwid,
+        "user_name": license_data["user_name"],
+        "expiration_time": expiration_time,
+        "max_uses": license_data["max_uses"],
+        "use_count": license_data["use_count"],
+        "iat": current_time,
+        "exp": expires_at
+    })
+    return {
+        "valid": True,
+        "message": message,
+        "token": token,
+        "expires_at": expires_at,
+        # Обновлять заранее, на последних 20% срока жизни токена
+        "refresh_at": current_time + (expires_at - current_time) * 4 // 5
+    }
+
+def record_request(route, method, status, started):
+    """Учет запроса в метриках (started - time.perf_counter() в начале обработки)"""
+    if METRICS_ENABLED:
+        LATENCY.observe(time.perf_counter() - started, route)
+        REQUESTS.inc(route, method, status)
+
+def record_stage(stage, started):
+    if METRICS_ENABLED:
+        STAGES.observe(time.perf_counter() - started, stage)
+
+def audit(endpoint, hwid, status, message=None):
+    """Событие проверки в журнал аудита (IP клиента - с учетом доверенных прокси)"""
+    if AUDIT is not None:
+        ip = client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'), TRUSTED_PROXIES)
+        AUDIT.record(hwid, endpoint, status, message, ip)
+
+def rate_limit_response(retry_after):
+    """Тело отказа по лимиту частоты (retry_after - через сколько секунд повторить)"""
+    return {"valid": False, "message": "Слишком много запросов", "retry_after": math.ceil(retry_after)}
+
+def hwid_retry_after(hwid):
+    """0, если HWID укладывается в лимит, иначе сколько секунд ждать"""
+    return HWID_LIMITS.acquire(hwid, time.monotonic()) if HWID_LIMITS is not None else 0
+
+def rate_limited(retry_after):
+    """Ответ 429 с Retry-After"""
+    body = rate_limit_response(retry_after)
+    return jsonify(body), 429, {"Retry-After": str(body["retry_after"])}
+
+@lru_cache(maxsize=65536)
+def readable_time(timestamp):
+    """Unix-время -> "ГГГГ-ММ-ДД ЧЧ:ММ:СС" (повторяющиеся даты не форматируются заново)"""
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+def license_info(license_data):
+    """Запись лицензии с читаемыми датами (для /get_license_info)"""
+    license_data = dict(license_data)
+    
+    # Добавляем читаемые даты
+    license_data["created_at_readable"] = readable_time(license_data["created_at"]) if license_data["created_at"] > 0 else "Не активирована"
+    license_data["last_used_readable"] = readable_time(license_data["last_used"]) if license_data["last_used"] > 0 else "Никогда"
+    
+    # Добавляем время истечения
+    expiration_time = license_data["created_at"] + license_data["subscription_duration"]
+    license_data["expires_at_readable"] = readable_time(expiration_time) if license_data["created_at"] > 0 else "Не активирована"
+    return license_data
+
+def license_etag(license_data):
+    """ETag ответа /get_license_info - версия записи
+
+    Ответ зависит только от полей лицензии, поэтому версия - их хеш: она
+    меняется при каждом изменении записи и совпадает у воркеров pre-fork,
+    фолловеров и после перезапуска, в отличие от счетчика в памяти.
+    """
+    values = repr([license_data[field] for field in FIELDS]).encode()
+    return hashlib.blake2b(values, digest_size=8).hexdigest()
+
+def info_headers(license_data, etag, current_time):
+    """ETag и Cache-Control для /get_license_info
+
+    Активная лицензия кэшируется не дольше, чем ей осталось, чтобы
+    истечение было видно сразу; остальные - на LICENSE_INFO_MAX_AGE.
+    """
+    max_age = INFO_MAX_AGE
+    if license_data["created_at"] > 0:
+        remaining = license_data["created_at"] + license_data["subscription_duration"] - current_time
+        if remaining > 0:
+            max_age = min(max_age, remaining)
+    return {"ETag": f'"{etag}"', "Cache-Control": f"private, max-age={max_age}"}
+
+def not_modified(if_none_match, etag):
+    """If-None-Match совпадает с etag (слабое сравнение, как требует RFC 9110)"""
+    return bool(if_none_match) and parse_etags(if_none_match).contains_weak(etag)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    record_request(route, request.method, response.status_code, g.get('request_started', time.perf_counter()))
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Сжатие больших текстовых ответов кодировкой из Accept-Encoding клиента
+
+    Потоковые ответы (экспорт, SSE) и файлы не сжимаются: их тело
+    собиралось бы целиком в памяти.
+    """
+    if (not COMPRESS_MIN_BYTES or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE)):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Байты другие, поэтому сильный ETag становится слабым (If-None-Match сравнивает слабо)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.before_request
+def limit_public_requests():
+    """Сброс нагрузки и лимит по IP - до разбора тела, подписи и обращения к хранилищу"""
+    if request.endpoint not in PUBLIC_ENDPOINTS:
+        return None
+
+    delay = request_start_delay(request.headers.get('X-Request-Start'), time.time())
+    if delay is not None:
+        SHEDDER.observe(delay)
+    if not SHEDDER.enter():
+        return jsonify({"valid": False, "message": "Сервер перегружен, повторите позже"}), 503, {"Retry-After": "1"}
+    g.shedder_entered = True
 
-    if current_time > license_created + duration:
-        return False, "Лицензия истекла"
+    if IP_LIMITS is not None:
+        ip = client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'), TRUSTED_PROXIES)
+        retry_after = IP_LIMITS.acquire(ip, time.monotonic())
+        if retry_after:
+            return rate_limited(retry_after)
+    return None
 
-    return True, "Лицензия действительна"
+# Маршруты фолловера, которые всегда обслуживаются на месте
+FOLLOWER_LOCAL_ENDPOINTS = {'admin_replication', 'metrics'}
+
+@app.before_request
+def forward_to_leader():
+    """Фолловер: изменения (все, кроме GET) и все запросы до первой синхронизации выполняет лидер"""
+    if FOLLOWER is None or request.endpoint in FOLLOWER_LOCAL_ENDPOINTS:
+        return None
+    if request.method == 'GET' and FOLLOWER.synced.is_set():
+        return None
+
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    headers = {'X-Forwarded-For': f"{forwarded_for}, {request.remote_addr}" if forwarded_for else request.remote_addr}
+    if request.content_type:
+        headers['Content-Type'] = request.content_type
+    try:
+        status, leader_headers, body = FOLLOWER.client.request(
+            request.method, request.full_path.rstrip('?'), request.get_data(), headers)
+    except Exception as e:
+        return jsonify({"valid": False, "message": f"Лидер недоступен: {str(e)}"}), 503, {"Retry-After": "1"}
+
+    response = Response(body, status)
+    for name, value in leader_headers:
+        if name.lower() in ('content-type', 'content-disposition', 'retry-after'):
+            response.headers[name] = value
+    return response
+
+@app.teardown_request
+def release_public_request(exc):
+    if g.pop('shedder_entered', False):
+        SHEDDER.leave()
 
 @app.route('/')
 def home():
@@ -69,6 +466,9 @@ def home():
         "base_url": base_url,
         "endpoints": {
             "check_license": f"{base_url}/check_license",
+            "check_license_batch": f"{base_url}/check_license/batch",
+            "check_license_token": f"{base_url}/check_license/token",
+            "token_keys": f"{base_url}/token_keys",
             "admin_panel": f"{base_url}/admin/licenses?key=FloraVisuals2024_Admin_Key_7x9K2mP8qR5",
             "license_info": f"{base_url}/get_license_info?hwid=YOUR_HWID"
         }
@@ -87,35 +487,111 @@ def check_license():
             }), 400
         
         hwid = data['hwid']
-        is_valid, message = validate_license(hwid)
+        retry_after = hwid_retry_after(hwid)
+        if retry_after:
+            audit('check_license', hwid, 429)
+            return rate_limited(retry_after)
+        
+        current_time = int(time.time())
+        # Проверка и учет использования выполняются хранилищем одной операцией
+        started = time.perf_counter()
+        is_valid, message, license_data = LICENSES.use(hwid, current_time)
+        record_stage("validate", started)
+        audit('check_license', hwid, 200 if is_valid else 403, message)
         
         if is_valid:
-            # Обновляем статистику использования
-            LICENSES[hwid]["last_used"] = int(time.time())
-            LICENSES[hwid]["use_count"] += 1
-            
-            # Вычисляем оставшееся время
-            current_time = int(time.time())
-            license_created = LICENSES[hwid]["created_at"]
-            duration = LICENSES[hwid]["subscription_duration"]
-            expiration_time = license_created + duration
-            remaining_time = max(0, expiration_time - current_time)
-            
-            response_data = {
-                "valid": True,
-                "message": message,
-                "user_name": LICENSES[hwid]["user_name"],
-                "expiration_time": expiration_time,
-                "remaining_time": remaining_time,
-                "use_count": LICENSES[hwid]["use_count"],
-                "max_uses": LICENSES[hwid]["max_uses"]
-            }
+            started = time.perf_counter()
+            body = license_response_json(message, license_data, current_time)
+            record_stage("sign", started)
+            return Response(body + "\n", mimetype='application/json')
+        else:
+            return jsonify({
+                "valid": False,
+                "message": message
+            }), 403
             
-            # Добавляем подпись
-            signature = generate_signature(json.dumps(response_data, sort_keys=True))
-            response_data["signature"] = signature
+    except Exception as e:
+        return jsonify({
+            "valid": False,
+            "message": f"Ошибка сервера: {str(e)}"
+        }), 500
+
+@app.route('/check_license/batch', methods=['POST'])
+def check_license_batch():
+    """Пакетная проверка лицензий: каждый HWID обрабатывается как в /check_license"""
+    try:
+        data = request.get_json()
+        hwids = data.get('hwids') if isinstance(data, dict) else None
+        
+        if not isinstance(hwids, list):
+            return jsonify({
+                "valid": False,
+                "message": "Неверный запрос"
+            }), 400
+        
+        if len(hwids) > BATCH_LIMIT:
+            return jsonify({
+                "valid": False,
+                "message": f"Слишком много HWID в запросе (максимум {BATCH_LIMIT})"
+            }), 413
+        
+        # Один момент времени на весь пакет, результаты в порядке запроса;
+        # подписанные ответы уже сериализованы, поэтому тело собирается строкой
+        current_time = int(time.time())
+        results = []
+        for hwid in hwids:
+            if not isinstance(hwid, str):
+                results.append(json.dumps({"hwid": hwid, "status": 400, "response": {"valid": False, "message": "Неверный запрос"}}))
+                continue
+            retry_after = hwid_retry_after(hwid)
+            if retry_after:
+                audit('check_license_batch', hwid, 429)
+                results.append(json.dumps({"hwid": hwid, "status": 429, "response": rate_limit_response(retry_after)}))
+                continue
+            is_valid, message, license_data = LICENSES.use(hwid, current_time)
+            audit('check_license_batch', hwid, 200 if is_valid else 403, message)
+            if is_valid:
+                results.append(f'{{"hwid": {json.dumps(hwid)}, "status": 200, "response": {license_response_json(message, license_data, current_time)}}}')
+            else:
+                results.append(json.dumps({"hwid": hwid, "status": 403, "response": {"valid": False, "message": message}}))
+        
+        return Response(f'{{"results": [{", ".join(results)}]}}\n', mimetype='application/json')
             
-            return jsonify(response_data)
+    except Exception as e:
+        return jsonify({
+            "valid": False,
+            "message": f"Ошибка сервера: {str(e)}"
+        }), 500
+
+@app.route('/check_license/token', methods=['POST'])
+def check_license_token():
+    """Проверка лицензии с выдачей подписанного токена для офлайн-проверки"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'hwid' not in data:
+            return jsonify({
+                "valid": False,
+                "message": "Неверный запрос"
+            }), 400
+        
+        hwid = data['hwid']
+        retry_after = hwid_retry_after(hwid)
+        if retry_after:
+            audit('check_license_token', hwid, 429)
+            return rate_limited(retry_after)
+        
+        current_time = int(time.time())
+        started = time.perf_counter()
+        is_valid, message, license_data = LICENSES.use(hwid, current_time)
+        record_stage("validate", started)
+        audit('check_license_token', hwid, 200 if is_valid else 403, message)
+        
+        if is_valid:
+            started = time.perf_counter()
+            token = license_token(hwid, message, license_data, current_time)
+            record_stage("sign", started)
+            return jsonify(token)
         else:
             return jsonify({
                 "valid": False,
@@ -128,27 +604,31 @@ def check_license():
             "message": f"Ошибка сервера: {str(e)}"
         }), 500
 
+@app.route('/token_keys', methods=['GET'])
+def token_keys():
+    """Открытые ключи для проверки токенов (JWKS)"""
+    return jsonify(TOKEN_SIGNER.jwks())
+
 @app.route('/get_license_info', methods=['GET'])
 def get_license_info():
     """Получение информации о лицензии (для отладки)"""
     hwid = request.args.get('hwid')
+    retry_after = hwid_retry_after(hwid) if hwid else 0
+    if retry_after:
+        return rate_limited(retry_after)
+    license_data = LICENSES.get(hwid) if hwid else None
     
-    if not hwid or hwid not in LICENSES:
+    if license_data is None:
         return jsonify({
             "error": "Лицензия не найдена"
         }), 404
     
-    license_data = LICENSES[hwid].copy()
-    
-    # Добавляем читаемые даты
-    license_data["created_at_readable"] = datetime.fromtimestamp(license_data["created_at"]).strftime("%Y-%m-%d %H:%M:%S") if license_data["created_at"] > 0 else "Не активирована"
-    license_data["last_used_readable"] = datetime.fromtimestamp(license_data["last_used"]).strftime("%Y-%m-%d %H:%M:%S") if license_data["last_used"] > 0 else "Никогда"
-    
-    # Добавляем время истечения
-    expiration_time = license_data["created_at"] + license_data["subscription_duration"]
-    license_data["expires_at_readable"] = datetime.fromtimestamp(expiration_time).strftime("%Y-%m-%d %H:%M:%S") if license_data["created_at"] > 0 else "Не активирована"
-    
-    return jsonify(license_data)
+    # Неизменившаяся лицензия - 304 без форматирования дат и сериализации
+    etag = license_etag(license_data)
+    headers = info_headers(license_data, etag, int(time.time()))
+    if not_modified(request.headers.get('If-None-Match'), etag):
+        return "", 304, headers
+    return jsonify(license_info(license_data)), 200, headers
 
 @app.route('/admin/licenses', methods=['GET'])
 def admin_licenses():
@@ -166,300 +646,7 @@ def admin_licenses():
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>FloraVisuals - Панель управления лицензиями</title>
-        <style>
-            * { margin: 0; padding: 0; box-sizing: border-box; }
-            body { 
-                font-family: 'Inter', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 50%, #f093fb 100%);
-                min-height: 100vh;
-                padding: 20px;
-                background-attachment: fixed;
-            }
-            .container { 
-                max-width: 1400px; 
-                margin: 0 auto; 
-                background: rgba(255, 255, 255, 0.98); 
-                padding: 40px; 
-                border-radius: 25px; 
-                box-shadow: 0 25px 50px rgba(0,0,0,0.15);
-                backdrop-filter: blur(20px);
-                border: 1px solid rgba(255, 255, 255, 0.2);
-            }
-            .header {
-                text-align: center;
-                margin-bottom: 50px;
-                padding: 30px;
-                background: linear-gradient(135deg, #667eea, #764ba2);
-                border-radius: 20px;
-                color: white;
-                box-shadow: 0 15px 35px rgba(102, 126, 234, 0.4);
-                position: relative;
-                overflow: hidden;
-            }
-            .header::before {
-                content: '';
-                position: absolute;
-                top: 0;
-                left: 0;
-                right: 0;
-                bottom: 0;
-                background: linear-gradient(45deg, rgba(255,255,255,0.1), transparent);
-                pointer-events: none;
-            }
-            .header h1 { 
-                font-size: 2.5em; 
-                margin-bottom: 10px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-            }
-            .header p { 
-                font-size: 1.2em; 
-                opacity: 0.9;
-            }
-            .add-license { 
-                background: linear-gradient(135deg, #e3f2fd, #f3e5f5); 
-                padding: 30px; 
-                border-radius: 20px; 
-                margin-bottom: 40px;
-                border: 2px solid #667eea;
-                box-shadow: 0 10px 25px rgba(102, 126, 234, 0.2);
-                position: relative;
-                overflow: hidden;
-            }
-            .add-license::before {
-                content: '';
-                position: absolute;
-                top: 0;
-                left: 0;
-                right: 0;
-                bottom: 0;
-                background: linear-gradient(45deg, rgba(102, 126, 234, 0.05), transparent);
-                pointer-events: none;
-            }
-            .add-license h3 { 
-                margin-bottom: 25px; 
-                color: #667eea; 
-                font-size: 1.6em;
-                display: flex;
-                align-items: center;
-                gap: 10px;
-                position: relative;
-                z-index: 1;
-            }
-            .form-row { 
-                display: flex; 
-                gap: 20px; 
-                flex-wrap: wrap; 
-                margin-bottom: 15px;
-            }
-            .form-group { 
-                flex: 1; 
-                min-width: 200px;
-            }
-            .form-group label { 
-                display: block; 
-                margin-bottom: 5px; 
-                font-weight: 600; 
-                color: #333;
-            }
-            .form-group input, .form-group select { 
-                width: 100%; 
-                padding: 12px; 
-                border: 2px solid #ddd; 
-                border-radius: 8px; 
-                font-size: 14px;
-                transition: all 0.3s ease;
-            }
-            .form-group input:focus, .form-group select:focus {
-                outline: none;
-                border-color: #667eea;
-                box-shadow: 0 0 15px rgba(102, 126, 234, 0.3);
-                transform: translateY(-2px);
-            }
-            .table-container {
-                overflow-x: auto;
-                border-radius: 15px;
-                box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-            }
-            table { 
-                width: 100%; 
-                border-collapse: collapse; 
-                background: white;
-            }
-            th { 
-                background: linear-gradient(135deg, #667eea, #764ba2); 
-                color: white; 
-                padding: 18px 12px; 
-                text-align: left; 
-                font-weight: 700;
-                text-transform: uppercase;
-                letter-spacing: 0.8px;
-                font-size: 0.9em;
-                position: relative;
-            }
-            th::after {
-                content: '';
-                position: absolute;
-                bottom: 0;
-                left: 0;
-                right: 0;
-                height: 3px;
-                background: linear-gradient(90deg, rgba(255,255,255,0.3), transparent);
-            }
-            td { 
-                padding: 15px 10px; 
-                border-bottom: 1px solid #eee;
-                vertical-align: middle;
-            }
-            tr:hover { 
-                background-color: #f8f9fa; 
-                transform: scale(1.01);
-                transition: all 0.2s ease;
-            }
-            tr:nth-child(even) { 
-                background-color: #f8f9fa; 
-            }
-            .hwid-cell {
-                font-family: 'Courier New', monospace;
-                background: #f5f5f5;
-                padding: 8px;
-                border-radius: 5px;
-                font-size: 12px;
-            }
-            .time-remaining {
-                font-weight: bold;
-                padding: 5px 10px;
-                border-radius: 20px;
-                font-size: 12px;
-                text-align: center;
-            }
-            .time-active {
-                background: #e8f5e8;
-                color: #2e7d32;
-            }
-            .time-expired {
-                background: #ffebee;
-                color: #c62828;
-            }
-            .time-warning {
-                background: #fff3e0;
-                color: #ef6c00;
-            }
-            button { 
-                padding: 8px 15px; 
-                border: none; 
-                cursor: pointer; 
-                border-radius: 8px; 
-                margin: 2px; 
-                font-weight: 600;
-                transition: all 0.3s ease;
-                font-size: 12px;
-            }
-            .btn-reset { 
-                background: linear-gradient(135deg, #ff9800, #f57c00); 
-                color: white; 
-                border-radius: 10px;
-                font-weight: 600;
-            }
-            .btn-reset:hover { 
-                transform: translateY(-3px);
-                box-shadow: 0 8px 20px rgba(255, 152, 0, 0.4);
-            }
-            .btn-delete { 
-                background: linear-gradient(135deg, #f44336, #d32f2f); 
-                color: white; 
-                border-radius: 10px;
-                font-weight: 600;
-            }
-            .btn-delete:hover { 
-                transform: translateY(-3px);
-                box-shadow: 0 8px 20px rgba(244, 67, 54, 0.4);
-            }
-            .btn-add { 
-                background: linear-gradient(135deg, #667eea, #764ba2); 
-                color: white; 
-                padding: 18px 35px; 
-                font-size: 16px;
-                border-radius: 12px;
-                font-weight: 700;
-                position: relative;
-                z-index: 1;
-            }
-            .btn-add:hover { 
-                transform: translateY(-3px);
-                box-shadow: 0 10px 25px rgba(102, 126, 234, 0.4);
-            }
-            .btn-extend { 
-                background: linear-gradient(135deg, #2196F3, #1976D2); 
-                color: white; 
-                border-radius: 10px;
-                font-weight: 600;
-            }
-            .btn-extend:hover { 
-                transform: translateY(-3px);
-                box-shadow: 0 8px 20px rgba(33, 150, 243, 0.4);
-            }
-            .btn-edit {
-                background: linear-gradient(135deg, #9c27b0, #7b1fa2);
-                color: white;
-                border-radius: 10px;
-                font-weight: 600;
-            }
-            .btn-edit:hover {
-                transform: translateY(-3px);
-                box-shadow: 0 8px 20px rgba(156, 39, 176, 0.4);
-            }
-            .status-active { 
-                color: #4CAF50; 
-                font-weight: bold; 
-                text-transform: uppercase;
-                letter-spacing: 1px;
-            }
-            .status-expired { 
-                color: #f44336; 
-                font-weight: bold; 
-                text-transform: uppercase;
-                letter-spacing: 1px;
-            }
-            .stats-grid {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(220px, 1fr));
-                gap: 25px;
-                margin-bottom: 40px;
-            }
-            .stat-card {
-                background: linear-gradient(135deg, #667eea, #764ba2);
-                color: white;
-                padding: 25px;
-                border-radius: 20px;
-                text-align: center;
-                box-shadow: 0 15px 30px rgba(102, 126, 234, 0.3);
-                position: relative;
-                overflow: hidden;
-                transition: transform 0.3s ease;
-            }
-            .stat-card:hover {
-                transform: translateY(-5px);
-            }
-            .stat-card::before {
-                content: '';
-                position: absolute;
-                top: 0;
-                left: 0;
-                right: 0;
-                bottom: 0;
-                background: linear-gradient(45deg, rgba(255,255,255,0.1), transparent);
-                pointer-events: none;
-            }
-            .stat-number {
-                font-size: 2em;
-                font-weight: bold;
-                margin-bottom: 5px;
-            }
-            .stat-label {
-                font-size: 0.9em;
-                opacity: 0.9;
-            }
-        </style>
+        <link rel="stylesheet" href=\"""" + asset_url("admin.css") + """\">
     </head>
     <body>
         <div class="container">
@@ -527,6 +714,63 @@ def admin_licenses():
                 <button class="btn-add" onclick="addLicense()">➕ Добавить лицензию</button>
             </div>
             
+            <div class="add-license">
+                <h3>📦 Импорт и экспорт</h3>
+                <div class="form-row">
+                    <div class="form-group">
+                        <label>Файл NDJSON или CSV (по строке на лицензию):</label>
+                        <input type="file" id="bulk_file" accept=".ndjson,.jsonl,.csv">
+                    </div>
+                </div>
+                <button class="btn-add" onclick="importLicenses()">📥 Импортировать</button>
+                <button class="btn-add" onclick="exportLicenses('csv')">📤 Экспорт CSV</button>
+                <button class="btn-add" onclick="exportLicenses('ndjson')">📤 Экспорт NDJSON</button>
+            </div>
+            
+            <div class="filters">
+                <div class="form-group">
+                    <label>Сортировка:</label>
+                    <select id="filter_sort">
+                        <option value="hwid">HWID</option>
+                        <option value="user_name">Пользователь</option>
+                        <option value="created_at">Создана</option>
+                        <option value="expires_at">Истекает</option>
+                    </select>
+                </div>
+                <div class="form-group">
+                    <label>Порядок:</label>
+                    <select id="filter_order">
+                        <option value="asc">По возрастанию</option>
+                        <option value="desc">По убыванию</option>
+                    </select>
+                </div>
+                <div class="form-group">
+                    <label>Статус:</label>
+                    <select id="filter_status">
+                        <option value="">Все</option>
+                        <option value="active">Активна</option>
+                        <option value="expired">Неактивна</option>
+                        <option value="expired_time">Истекла по времени</option>
+                        <option value="expired_uses">Истекла по использованию</option>
+                        <option value="not_activated">Не активирована</option>
+                    </select>
+                </div>
+                <div class="form-group">
+                    <label>Поиск:</label>
+                    <input type="text" id="filter_search" placeholder="Часть HWID или имени" onkeydown="if (event.key === 'Enter') applyFilters()">
+                </div>
+                <div class="form-group">
+                    <label>Имя начинается с:</label>
+                    <input type="text" id="filter_user" placeholder="Имя пользователя">
+                </div>
+                <div class="form-group">
+                    <label>Истекает до:</label>
+                    <input type="datetime-local" id="filter_expiring">
+                </div>
+                <button class="btn-add" onclick="applyFilters()">🔍 Показать</button>
+                <button class="btn-add" onclick="expiringSoon(7)">⏰ Истекают за 7 дней</button>
+            </div>
+            
             <div class="table-container">
                 <table>
                     <thead>
@@ -542,207 +786,278 @@ def admin_licenses():
                             <th>Действия</th>
                         </tr>
                     </thead>
-                    <tbody>
-    """
-    
-    total_licenses = len(LICENSES)
-    active_count = 0
-    expired_count = 0
-    
-    for hwid, data in LICENSES.items():
-        # Вычисляем время истечения
-        expiration_time = data["created_at"] + data["subscription_duration"]
-        expiration_readable = datetime.fromtimestamp(expiration_time).strftime("%Y-%m-%d %H:%M:%S") if data["created_at"] > 0 else "Не активирована"
-        created_readable = datetime.fromtimestamp(data["created_at"]).strftime("%Y-%m-%d %H:%M:%S") if data["created_at"] > 0 else "Не активирована"
-        last_used_readable = datetime.fromtimestamp(data["last_used"]).strftime("%Y-%m-%d %H:%M:%S") if data["last_used"] > 0 else "Никогда"
-        
-        # Вычисляем оставшееся время
-        current_time = int(time.time())
-        if data["created_at"] > 0:
-            remaining_seconds = expiration_time - current_time
-            if remaining_seconds > 0:
-                remaining_minutes = remaining_seconds // 60
-                remaining_secs = remaining_seconds % 60
-                if remaining_minutes > 0:
-                    time_remaining = f"{remaining_minutes}м {remaining_secs}с"
-                else:
-                    time_remaining = f"{remaining_secs}с"
-                time_class = "time-warning" if remaining_seconds < 60 else "time-active"
-                # Лицензия активна если есть время И не превышено количество использований
-                is_active = data["use_count"] < data["max_uses"]
-                if is_active:
-                    active_count += 1
-                else:
-                    expired_count += 1
-            else:
-                time_remaining = "Истекла"
-                time_class = "time-expired"
-                is_active = False
-                expired_count += 1
-        else:
-            time_remaining = "Не активирована"
-            time_class = "time-expired"
-            is_active = False
-            expired_count += 1
-        
-        # Статус зависит от времени И количества использований
-        if data["created_at"] > 0:
-            time_valid = remaining_seconds > 0
-            uses_valid = data["use_count"] < data["max_uses"]
-            is_active = time_valid and uses_valid
-            if not time_valid:
-                status = "Истекла по времени"
-            elif not uses_valid:
-                status = "Истекла по использованию"
-            else:
-                status = "Активна"
-        else:
-            status = "Не активирована"
-        status_class = "status-active" if is_active else "status-expired"
-        
-        html += f"""
-            <tr>
-                <td><div class="hwid-cell">{hwid}</div></td>
-                <td>{data["user_name"]}</td>
-                <td>{created_readable}</td>
-                <td>{expiration_readable}</td>
-                <td>{last_used_readable}</td>
-                <td>{data["use_count"]}/{data["max_uses"]}</td>
-                <td><div class="time-remaining {time_class}">{time_remaining}</div></td>
-                <td class="{status_class}">{status}</td>
-                        <td>
-                            <button class="btn-reset" onclick="resetLicense('{hwid}')">🔄 Сбросить</button>
-                            <button class="btn-extend" onclick="extendLicense('{hwid}')">⏰ Продлить</button>
-                            <button class="btn-edit" onclick="editMaxUses('{hwid}', {data["max_uses"]})">✏️ Max Uses</button>
-                            <button class="btn-delete" onclick="deleteLicense('{hwid}')">🗑️ Удалить</button>
-                        </td>
-            </tr>
-        """
-    
-    html += f"""
-                    </tbody>
+                    <tbody id="licenses-body"></tbody>
                 </table>
             </div>
+            <div class="load-more">
+                <button class="btn-add" id="load-more" onclick="loadMore()" style="display: none">⬇️ Показать еще</button>
+            </div>
         </div>
-        
-        <script>
-            // Обновляем статистику
-            document.getElementById('total-licenses').textContent = '{total_licenses}';
-            document.getElementById('active-licenses').textContent = '{active_count}';
-            document.getElementById('expired-licenses').textContent = '{expired_count}';
-            
-            function addLicense() {{
-                const hwid = document.getElementById('new_hwid').value;
-                const username = document.getElementById('new_username').value;
-                const duration = document.getElementById('new_duration').value;
-                const maxUses = document.getElementById('new_max_uses').value;
-                
-                if (!hwid || !username) {{
-                    alert('Пожалуйста, заполните HWID и имя пользователя');
-                    return;
-                }}
-                
-                fetch('/admin/add_license?key=FloraVisuals2024_Admin_Key_7x9K2mP8qR5', {{
-                    method: 'POST',
-                    headers: {{ 'Content-Type': 'application/json' }},
-                    body: JSON.stringify({{
-                        hwid: hwid,
-                        username: username,
-                        duration: parseInt(duration),
-                        max_uses: parseInt(maxUses)
-                    }})
-                }})
-                .then(response => response.json())
-                .then(data => {{
-                    alert(data.message);
-                    location.reload();
-                }})
-                .catch(error => alert('Ошибка: ' + error));
-            }}
-            
-            function resetLicense(hwid) {{
-                if (confirm('Сбросить эту лицензию? Это обнулит счетчик использований и время создания.')) {{
-                    fetch('/admin/reset_license?key=FloraVisuals2024_Admin_Key_7x9K2mP8qR5', {{
-                        method: 'POST',
-                        headers: {{ 'Content-Type': 'application/json' }},
-                        body: JSON.stringify({{hwid: hwid}})
-                    }})
-                    .then(response => response.json())
-                    .then(data => {{
-                        alert(data.message);
-                        location.reload();
-                    }})
-                    .catch(error => alert('Ошибка: ' + error));
-                }}
-            }}
-            
-            function extendLicense(hwid) {{
-                const duration = prompt('Продлить лицензию на сколько времени?\\n\\nПримеры:\\n• 5 (минуты)\\n• 60 (1 час)\\n• 480 (8 часов)\\n• 1440 (24 часа)\\n• 10080 (7 дней)\\n• 43200 (30 дней)\\n• 999999 (навсегда)\\n\\nВведите время в минутах:', '5');
-                if (duration && !isNaN(duration)) {{
-                    fetch('/admin/extend_license?key=FloraVisuals2024_Admin_Key_7x9K2mP8qR5', {{
-                        method: 'POST',
-                        headers: {{ 'Content-Type': 'application/json' }},
-                        body: JSON.stringify({{hwid: hwid, minutes: parseInt(duration)}})
-                    }})
-                    .then(response => response.json())
-                    .then(data => {{
-                        alert(data.message);
-                        location.reload();
-                    }})
-                    .catch(error => alert('Ошибка: ' + error));
-                }}
-            }}
-            
-                    function deleteLicense(hwid) {{
-                        if (confirm('Вы уверены, что хотите УДАЛИТЬ эту лицензию? Это действие нельзя отменить!')) {{
-                            fetch('/admin/delete_license?key=FloraVisuals2024_Admin_Key_7x9K2mP8qR5', {{
-                                method: 'POST',
-                                headers: {{ 'Content-Type': 'application/json' }},
-                                body: JSON.stringify({{hwid: hwid}})
-                            }})
-                            .then(response => response.json())
-                            .then(data => {{
-                                alert(data.message);
-                                location.reload();
-                            }})
-                            .catch(error => alert('Ошибка: ' + error));
-                        }}
-                    }}
-                    
-                    function editMaxUses(hwid, currentMaxUses) {{
-                        const newMaxUses = prompt(`Изменить максимальное количество использований для ${{hwid}}:\\n\\nТекущее значение: ${{currentMaxUses}}\\n\\nВведите новое значение (1-1000):`, currentMaxUses);
-                        
-                        if (newMaxUses && !isNaN(newMaxUses) && newMaxUses >= 1 && newMaxUses <= 1000) {{
-                            fetch('/admin/edit_max_uses?key=FloraVisuals2024_Admin_Key_7x9K2mP8qR5', {{
-                                method: 'POST',
-                                headers: {{ 'Content-Type': 'application/json' }},
-                                body: JSON.stringify({{
-                                    hwid: hwid,
-                                    max_uses: parseInt(newMaxUses)
-                                }})
-                            }})
-                            .then(response => response.json())
-                            .then(data => {{
-                                alert(data.message);
-                                location.reload();
-                            }})
-                            .catch(error => alert('Ошибка: ' + error));
-                        }} else if (newMaxUses !== null) {{
-                            alert('Пожалуйста, введите корректное значение от 1 до 1000');
-                        }}
-                    }}
-            
-            // Автообновление каждые 30 секунд
-            setInterval(() => {{
-                location.reload();
-            }}, 30000);
-        </script>
+    """
+    
+    html += """
+        <script src=\"""" + asset_url("admin.js") + """\"></script>
     </body>
     </html>
     """
     
     return html
 
+@app.route('/admin/static/<name>', methods=['GET'])
+def admin_static(name):
+    """Стили и скрипт админки (без ключа: ключ страница берет из своего адреса)"""
+    asset = ADMIN_ASSETS.get(name)
+    if asset is None:
+        return jsonify({"message": "Файл не найден"}), 404
+    body, mimetype, version = asset
+    headers = {
+        "ETag": f'"{version}"',
+        # Адрес с текущей версией не меняется никогда; без нее - проверка по ETag
+        "Cache-Control": "public, max-age=31536000, immutable" if request.args.get('v') == version else "no-cache"
+    }
+    if not_modified(request.headers.get('If-None-Match'), version):
+        return "", 304, headers
+    return Response(body, content_type=mimetype, headers=headers)
+
+def admin_row(hwid, data, current_time):
+    """Строка таблицы админки: запись со сроком истечения, остатком времени и статусом"""
+    expires_at = data["created_at"] + data["subscription_duration"] if data["created_at"] > 0 else 0
+    return dict(
+        data,
+        hwid=hwid,
+        expires_at=expires_at,
+        remaining_time=max(0, expires_at - current_time) if expires_at else 0,
+        status=license_status(data, current_time)
+    )
+
+def encode_cursor(cursor):
+    """Курсор страницы -> непрозрачная строка для URL"""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+def decode_cursor(value):
+    """Строка курсора из URL -> [значение, hwid]"""
+    if not value:
+        return None
+    cursor = json.loads(base64.urlsafe_b64decode(value.encode()))
+    if not isinstance(cursor, list) or len(cursor) != 2:
+        raise ValueError("Некорректный курсор")
+    return cursor
+
+@app.route('/admin/api/licenses', methods=['GET'])
+def admin_api_licenses():
+    """Постраничный список лицензий с сортировкой и фильтрами"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    sort = request.args.get('sort', 'hwid')
+    order = request.args.get('order', 'asc')
+    status = request.args.get('status') or None
+
+    if sort not in SORTS or order not in ('asc', 'desc'):
+        return jsonify({"message": "Некорректная сортировка"}), 400
+    if status not in (None, 'active', 'expired', 'expired_time', 'expired_uses', 'not_activated'):
+        return jsonify({"message": "Некорректный статус"}), 400
+
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 1000)
+        expiring_before = int(request.args['expiring_before']) if request.args.get('expiring_before') else None
+        cursor = decode_cursor(request.args.get('cursor'))
+    except (ValueError, TypeError):
+        return jsonify({"message": "Некорректные параметры запроса"}), 400
+
+    current_time = int(time.time())
+    page, next_cursor = LICENSES.page(
+        sort=sort,
+        descending=order == 'desc',
+        after=cursor,
+        limit=limit,
+        status=status,
+        user_prefix=request.args.get('user_prefix') or None,
+        expiring_before=expiring_before,
+        current_time=current_time
+    )
+
+    licenses = [admin_row(hwid, data, current_time) for hwid, data in page]
+    return jsonify({"licenses": licenses, "next_cursor": encode_cursor(next_cursor)})
+
+@app.route('/admin/search', methods=['GET'])
+def admin_search():
+    """Поиск лицензий по началу HWID или словам имени пользователя"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"message": "Пустой запрос"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 1000)
+    except ValueError:
+        return jsonify({"message": "Некорректные параметры запроса"}), 400
+
+    current_time = int(time.time())
+    found, more = LICENSES.search(query, limit)
+    licenses = [admin_row(hwid, data, current_time) for hwid, data in found]
+    return jsonify({"query": query, "licenses": licenses, "more": more})
+
+@app.route('/admin/events', methods=['GET'])
+def admin_events():
+    """Живое обновление админки (Server-Sent Events): измененные строки и статистика
+
+    Событие licenses - {hwid: строка или null (удалена)} не чаще раза в
+    ADMIN_EVENTS_MS, stats - счетчики для карточек, reload - изменений
+    слишком много, страницу нужно перечитать.
+    """
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    # EventSource при переподключении присылает номер последнего полученного события
+    after = request.headers.get('Last-Event-ID', type=int)
+    position = LICENSES.watch(after)
+    if position is None:
+        return jsonify({"message": "Живое обновление недоступно для этого хранилища"}), 404
+
+    def generate():
+        seq, changes = position
+        while True:
+            current_time = int(time.time())
+            if changes is None:
+                yield f"id: {seq}\nevent: reload\ndata: {{}}\n\n"
+            elif changes:
+                rows = {hwid: admin_row(hwid, data, current_time) if data is not None else None
+                        for hwid, data in changes.items()}
+                yield f"id: {seq}\nevent: licenses\ndata: {json.dumps(rows, ensure_ascii=False)}\n\n"
+            yield f"id: {seq}\nevent: stats\ndata: {json.dumps(LICENSES.stats(current_time))}\n\n"
+            # Изменения за интервал уходят одним событием: счетчик горячей лицензии - одна строка
+            time.sleep(ADMIN_EVENTS_MS / 1000)
+            seq, changes = LICENSES.changed(seq, ADMIN_EVENTS_KEEPALIVE)
+
+    response = Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Лента изменений ведется, пока открыта хотя бы одна вкладка
+    response.call_on_close(LICENSES.unwatch)
+    return response
+
+@app.route('/admin/stats', methods=['GET'])
+def admin_stats():
+    """Количество лицензий по статусам"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    return jsonify(LICENSES.stats(int(time.time())))
+
+def license_gauges():
+    current_time = int(time.time())
+    stats = LICENSES.stats(current_time)
+    return [((status,), stats[status]) for status in ("active", "expired_time", "expired_uses", "not_activated")]
+
+def cache_gauges():
+    cache = getattr(LICENSES, 'cache', None)
+    if cache is None:
+        return []
+    return [(("hit",), cache.hits), (("negative_hit",), cache.negative_hits), (("miss",), cache.misses)]
+
+def rate_limit_gauges():
+    return [((name,), limits.rejected) for name, limits in (("ip", IP_LIMITS), ("hwid", HWID_LIMITS)) if limits is not None]
+
+# Значения, которые считаются в момент выгрузки: общие для всех воркеров (таблица лицензий)
+LICENSE_GAUGES = [
+    Gauge("license_table_size", "Лицензий в памяти", callback=lambda: [((), len(LICENSES))]),
+    Gauge("license_status_count", "Лицензий по статусам", ("status",), callback=license_gauges),
+]
+# и свои у каждого процесса
+GAUGES = [
+    Gauge("license_process_resident_memory_bytes", "Резидентная память процесса", callback=lambda: [((), resident_memory())]),
+    Gauge("license_cache_requests_total", "Обращения к кэшу лицензий: ответ из кэша (hit, negative_hit) или из хранилища (miss)",
+          ("result",), callback=cache_gauges, kind="counter"),
+    Gauge("license_cache_entries", "Записей в кэше лицензий",
+          callback=lambda: [((), len(LICENSES.cache))] if hasattr(LICENSES, 'cache') else []),
+    Gauge("license_rate_limited_total", "Отказы по лимиту частоты", ("scope",), callback=rate_limit_gauges, kind="counter"),
+    Gauge("license_audit_events_total", "События журнала аудита: записанные и отброшенные из-за переполнения очереди",
+          ("result",), callback=lambda: [(("written",), AUDIT.written), (("dropped",), AUDIT.dropped)] if AUDIT is not None else [],
+          kind="counter"),
+    Gauge("license_shed_total", "Отказы из-за перегрузки", callback=lambda: [((), SHEDDER.shed)], kind="counter"),
+    Gauge("license_queue_delay_seconds", "Сглаженная задержка запросов в очереди", callback=lambda: [((), SHEDDER.queue_delay)]),
+    Gauge("license_inflight_requests", "Публичных запросов в обработке", callback=lambda: [((), SHEDDER.inflight)]),
+]
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики в формате Prometheus"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    if METRICS_HUB is None:
+        body = render(LICENSE_GAUGES + [REQUESTS, LATENCY, STAGES] + GAUGES)
+    else:
+        # Pre-fork: счетчики всех воркеров из мастера, у каждого - метка worker
+        publish_metrics()
+        body = render(LICENSE_GAUGES) + render([REQUESTS, LATENCY, STAGES] + GAUGES, METRICS_HUB.collect())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+def publish_metrics():
+    """Отправка метрик этого воркера в MetricsHub мастера"""
+    METRICS_HUB.publish(WORKER_ID, snapshot([REQUESTS, LATENCY, STAGES] + GAUGES))
+
+@app.route('/admin/rate_limit', methods=['GET'])
+def admin_rate_limit():
+    """Состояние лимитов и счетчики отказов"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    return jsonify({
+        "ip": IP_LIMITS.stats() if IP_LIMITS is not None else None,
+        "hwid": HWID_LIMITS.stats() if HWID_LIMITS is not None else None,
+        "shedding": SHEDDER.stats()
+    })
+
+@app.route('/admin/cache', methods=['GET'])
+def admin_cache():
+    """Состояние кэша лицензий и доля ответов из него"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    cache = getattr(LICENSES, 'cache', None)
+    return jsonify(cache.stats() if cache is not None else None)
+
+@app.route('/replication', methods=['GET'])
+def replication_changes():
+    """Изменения таблицы лицензий для фолловеров (длинный опрос до wait секунд)"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    after = request.args.get('after', 0, type=int)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 30)
+    changes = LICENSES.changes(request.args.get('epoch', ''), after, wait)
+    if changes is None:
+        return jsonify({"message": "Сервер не лидер (LICENSE_ROLE=leader)"}), 404
+    return Response(dumps(changes), mimetype='application/json')
+
+@app.route('/admin/replication', methods=['GET'])
+def admin_replication():
+    """Состояние репликации: номер последнего изменения, у фолловера - отставание от лидера"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    if FOLLOWER is not None:
+        return jsonify(FOLLOWER.stats())
+    return jsonify(LICENSES.replication_stats() or {"role": ROLE})
+
+INVALID_HWID = "HWID должен быть непустой строкой"
+
+def valid_hwid(hwid):
+    """HWID из запроса админки: только непустая строка (ключи таблицы, индексов и снимков - строки)"""
+    return isinstance(hwid, str) and hwid != ""
+
 @app.route('/admin/reset_license', methods=['POST'])
 def admin_reset_license():
     """Сброс лицензии (установка нового времени создания)"""
@@ -752,15 +1067,13 @@ def admin_reset_license():
 
     data = request.get_json()
     hwid = data.get('hwid')
+    if not valid_hwid(hwid):
+        return jsonify({"message": INVALID_HWID}), 400
 
-    if not hwid or hwid not in LICENSES:
+    # Новое время создания, счетчики обнуляются
+    if LICENSES.update(hwid, created_at=int(time.time()), last_used=0, use_count=0) is None:
         return jsonify({"message": "Лицензия не найдена"}), 404
 
-    license_data = LICENSES[hwid]
-    license_data['created_at'] = int(time.time())  # Новое время создания
-    license_data['last_used'] = 0
-    license_data['use_count'] = 0
-
     return jsonify({"message": f"Лицензия для {hwid} сброшена и активирована"}), 200
 
 @app.route('/admin/add_license', methods=['POST'])
@@ -778,18 +1091,20 @@ def admin_add_license():
 
     if not hwid or not username:
         return jsonify({"message": "HWID и имя пользователя обязательны"}), 400
+    if not valid_hwid(hwid):
+        return jsonify({"message": INVALID_HWID}), 400
 
-    if hwid in LICENSES:
-        return jsonify({"message": "Лицензия с таким HWID уже существует"}), 400
-
-    LICENSES[hwid] = {
+    added = LICENSES.add(hwid, {
         "user_name": username,
         "subscription_duration": duration,
         "max_uses": max_uses,
         "created_at": 0,  # Будет установлено при первом использовании
         "last_used": 0,
         "use_count": 0
-    }
+    })
+
+    if not added:
+        return jsonify({"message": "Лицензия с таким HWID уже существует"}), 400
 
     return jsonify({"message": f"Лицензия для {hwid} добавлена"}), 200
 
@@ -803,13 +1118,13 @@ def admin_extend_license():
     data = request.get_json()
     hwid = data.get('hwid')
     minutes = data.get('minutes', 5)
+    if not valid_hwid(hwid):
+        return jsonify({"message": INVALID_HWID}), 400
 
-    if not hwid or hwid not in LICENSES:
+    # Добавляем секунды
+    if LICENSES.extend(hwid, minutes * 60) is None:
         return jsonify({"message": "Лицензия не найдена"}), 404
 
-    license_data = LICENSES[hwid]
-    license_data['subscription_duration'] += minutes * 60  # Добавляем секунды
-
     return jsonify({"message": f"Лицензия для {hwid} продлена на {minutes} минут"}), 200
 
 @app.route('/admin/delete_license', methods=['POST'])
@@ -821,11 +1136,12 @@ def admin_delete_license():
 
     data = request.get_json()
     hwid = data.get('hwid')
+    if not valid_hwid(hwid):
+        return jsonify({"message": INVALID_HWID}), 400
 
-    if not hwid or hwid not in LICENSES:
+    if not LICENSES.delete(hwid):
         return jsonify({"message": "Лицензия не найдена"}), 404
 
-    del LICENSES[hwid]
     return jsonify({"message": f"Лицензия для {hwid} удалена"}), 200
 
 @app.route('/admin/edit_max_uses', methods=['POST'])
@@ -838,36 +1154,178 @@ def admin_edit_max_uses():
     data = request.get_json()
     hwid = data.get('hwid')
     max_uses = data.get('max_uses')
+    if not valid_hwid(hwid):
+        return jsonify({"message": INVALID_HWID}), 400
 
-    if not hwid or hwid not in LICENSES:
+    if hwid not in LICENSES:
         return jsonify({"message": "Лицензия не найдена"}), 404
 
     if not max_uses or max_uses < 1 or max_uses > 1000:
         return jsonify({"message": "Некорректное значение max_uses (должно быть от 1 до 1000)"}), 400
 
-    LICENSES[hwid]['max_uses'] = max_uses
+    if LICENSES.update(hwid, max_uses=max_uses) is None:
+        return jsonify({"message": "Лицензия не найдена"}), 404
+
     return jsonify({"message": f"Максимальное количество использований для {hwid} изменено на {max_uses}"}), 200
 
+def bulk_operation(row, default_op, current_time):
+    """Строка импорта -> операция хранилища (op, hwid, поля)"""
+    op = row.get('op') or default_op
+    hwid = row.get('hwid')
+
+    if not hwid:
+        raise ValueError("HWID обязателен")
+    if not valid_hwid(hwid):
+        raise ValueError(INVALID_HWID)
+
+    if op == 'add':
+        # Те же поля и значения по умолчанию, что у /admin/add_license
+        username = row.get('username') or row.get('user_name')
+        if not username:
+            raise ValueError("HWID и имя пользователя обязательны")
+        return 'add', hwid, {
+            "user_name": username,
+            "subscription_duration": int(row.get('duration') or 300),
+            "max_uses": int(row.get('max_uses') or 10),
+            "created_at": 0,
+            "last_used": 0,
+            "use_count": 0
+        }
+
+    if op == 'put':
+        # Полная запись в формате /admin/export (восстановление из выгрузки)
+        return 'put', hwid, {
+            "user_name": row['user_name'],
+            "subscription_duration": int(row['subscription_duration']),
+            "max_uses": int(row['max_uses']),
+            "created_at": int(row.get('created_at') or 0),
+            "last_used": int(row.get('last_used') or 0),
+            "use_count": int(row.get('use_count') or 0)
+        }
+
+    if op == 'extend':
+        return 'extend', hwid, {"seconds": int(row.get('minutes') or 5) * 60}
+
+    if op == 'edit_max_uses':
+        max_uses = int(row.get('max_uses') or 0)
+        if max_uses < 1 or max_uses > 1000:
+            raise ValueError("Некорректное значение max_uses (должно быть от 1 до 1000)")
+        return 'update', hwid, {"max_uses": max_uses}
+
+    if op == 'reset':
+        return 'update', hwid, {"created_at": current_time, "last_used": 0, "use_count": 0}
+
+    if op == 'delete':
+        return 'delete', hwid, {}
+
+    raise ValueError(f"Неизвестная операция {op}")
+
+@app.route('/admin/bulk', methods=['POST'])
+def admin_bulk():
+    """Пакетный импорт и изменение лицензий (NDJSON или CSV) одной транзакцией"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    default_op = request.args.get('op', 'add')
+    current_time = int(time.time())
+
+    # Тело читается построчно из потока запроса (с буфером, иначе поток читается по байту)
+    lines = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8', newline='')
+    rows = csv.DictReader(lines) if fmt == 'csv' else (line for line in lines if line.strip())
+
+    operations = []
+    errors = []
+    for line, row in enumerate(rows, 1):
+        try:
+            if fmt != 'csv':
+                row = json.loads(row)
+            operations.append(bulk_operation(row, default_op, current_time))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            errors.append((line, str(e)))
+
+    # Все или ничего: при любой ошибке таблица не меняется
+    if not errors:
+        errors = LICENSES.bulk(operations)
+
+    if errors:
+        return jsonify({
+            "message": f"Импорт отменен, ошибок: {len(errors)}",
+            "errors": [{"line": line, "message": message} for line, message in errors[:100]]
+        }), 400
+
+    return jsonify({"message": f"Применено операций: {len(operations)}", "applied": len(operations)}), 200
+
+@app.route('/admin/export', methods=['GET'])
+def admin_export():
+    """Потоковая выгрузка всех лицензий (NDJSON или CSV)"""
+    admin_key = request.args.get('key')
+    if admin_key != "FloraVisuals2024_Admin_Key_7x9K2mP8qR5":
+        return jsonify({"message": "Неверный ключ администратора"}), 403
+
+    fmt = request.args.get('format', 'ndjson')
+    hwids = LICENSES.keys()
+    columns = ["hwid", "user_name", "subscription_duration", "max_uses", "created_at", "last_used", "use_count"]
+
+    def generate():
+        # Таблица выгружается порциями, целиком в памяти не собирается
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(columns)
+        for start in range(0, len(hwids), 1000):
+            for hwid, license_data in LICENSES.get_many(hwids[start:start + 1000]):
+                if fmt == 'csv':
+                    writer.writerow([hwid] + [license_data[column] for column in columns[1:]])
+                else:
+                    buffer.write(json.dumps(dict(hwid=hwid, **license_data), ensure_ascii=False) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename=licenses.{'csv' if fmt == 'csv' else 'ndjson'}"
+    })
+
 @app.route('/increment_usage', methods=['POST'])
 def increment_usage():
     """Увеличение счетчика использований"""
     data = request.get_json()
     hwid = data.get('hwid')
+    retry_after = hwid_retry_after(hwid) if hwid else 0
+    if retry_after:
+        audit('increment_usage', hwid, 429)
+        return rate_limited(retry_after)
 
-    if not hwid or hwid not in LICENSES:
-        return jsonify({"valid": False, "message": "Лицензия не найдена"}), 404
-
-    license_data = LICENSES[hwid]
-    
     # Увеличиваем счетчик использований
-    license_data['use_count'] += 1
-    license_data['last_used'] = int(time.time())
+    if not hwid or LICENSES.increment(hwid, int(time.time())) is None:
+        if hwid:
+            audit('increment_usage', hwid, 404, "Лицензия не найдена")
+        return jsonify({"valid": False, "message": "Лицензия не найдена"}), 404
     
+    audit('increment_usage', hwid, 200, "Счетчик использований увеличен")
     return jsonify({"valid": True, "message": "Счетчик использований увеличен"}), 200
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting FloraVisuals License Server on port {port}")
+    if BACKEND == 'sqlite':
+        print(f"💾 License store: SQLite {SQLITE_PATH} ({len(LICENSES)} licenses)")
+    elif DATA_DIR:
+        print(f"💾 License store: {DATA_DIR} ({len(LICENSES)} licenses recovered in {LICENSES.recovery_time * 1000:.0f} ms)")
+        if COUNTER_FLUSH_MS:
+            print(f"🧮 Usage counters are flushed to the log every {COUNTER_FLUSH_MS} ms")
+        if EVICT_AFTER_DAYS:
+            print(f"🧊 Licenses expired more than {EVICT_AFTER_DAYS} days ago move to {cold_store.path}")
+    else:
+        print("💾 License store: in-memory only")
+    if FOLLOWER is not None:
+        print(f"🔁 Follower of {LEADER_URL}: reads are served locally, changes go to the leader")
+    elif ROLE == 'leader':
+        print("🔁 Leader: followers replicate from /replication")
     
     # Получаем внешний URL Railway
     railway_url = os.environ.get('RAILWAY_PUBLIC_DOMAIN')
@@ -896,4 +1354,12 @@ if __name__ == '__main__':
         print("💡 To get Railway URL: Go to Railway Dashboard → Settings → Networking → Generate Domain")
     
     print("=" * 50)
-    app.run(host='0.0.0.0', port=port, debug=False)
+    if WORKERS > 1 and FOLLOWER is not None:
+        print("⚠️ Follower runs in a single process (WEB_CONCURRENCY ignored)")
+    if WORKERS > 1 and FOLLOWER is None:
+        from prefork import serve_prefork
+        serve_prefork(app, LICENSES, '0.0.0.0', port, WORKERS, set_license_store, set_metrics_hub)
+    else:
+        # SIGTERM при деплое завершает процесс через atexit: накопленный учет сбрасывается в журнал
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Хранилище лицензий в файле SQLite (LICENSE_BACKEND=sqlite)
+
+Те же методы, что у LicenseStore, поэтому маршруты не знают, где лежат
+лицензии. База - в режиме WAL: читатели не ждут писателя, а запись
+не ждет fsync всего файла. Соединения берутся из пула на время одной
+операции (у werkzeug поток на запрос, поэтому соединение на поток
+пришлось бы открывать заново для каждого запроса), а у каждого
+соединения свой кэш подготовленных запросов: SQL-строки постоянные,
+значения передаются параметрами.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from license_index import name_matches, name_words
+from license_store import FIELDS, check_license_data
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS licenses (
+    hwid TEXT PRIMARY KEY,
+    user_name TEXT,
+    subscription_duration INTEGER NOT NULL,
+    max_uses INTEGER NOT NULL,
+    created_at INTEGER NOT NULL,
+    last_used INTEGER NOT NULL,
+    use_count INTEGER NOT NULL,
+    -- Как у _expires_at в license_index: не активированные лицензии не истекают
+    expires_at INTEGER GENERATED ALWAYS AS
+        (CASE WHEN created_at = 0 THEN 0 ELSE created_at + subscription_duration END) VIRTUAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS licenses_expires_at ON licenses (expires_at, hwid);
+CREATE INDEX IF NOT EXISTS licenses_user_name ON licenses (user_name, hwid);
+CREATE INDEX IF NOT EXISTS licenses_created_at ON licenses (created_at, hwid);
+"""
+
+COLUMNS = ", ".join(FIELDS)
+SELECT_ONE = f"SELECT {COLUMNS} FROM licenses WHERE hwid = ?"
+INSERT = f"INSERT OR IGNORE INTO licenses (hwid, {COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)"
+REPLACE = f"INSERT OR REPLACE INTO licenses (hwid, {COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+# Учет использования одним атомарным UPDATE: условие проверки - в WHERE,
+# поэтому max_uses не превышается даже при одновременных запросах
+USE_ACTIVE = f"""
+UPDATE licenses SET use_count = use_count + 1, last_used = ?1
+WHERE hwid = ?2 AND use_count < max_uses AND created_at != 0 AND ?1 <= created_at + subscription_duration
+RETURNING {COLUMNS}
+"""
+USE_ACTIVATE = f"""
+UPDATE licenses SET use_count = use_count + 1, last_used = ?1, created_at = ?1
+WHERE hwid = ?2 AND use_count < max_uses AND created_at = 0
+RETURNING {COLUMNS}
+"""
+ACTIVATE = f"""
+UPDATE licenses SET created_at = ?1
+WHERE hwid = ?2 AND use_count < max_uses AND created_at = 0
+RETURNING {COLUMNS}
+"""
+INCREMENT = f"UPDATE licenses SET use_count = use_count + 1, last_used = ?1 WHERE hwid = ?2 RETURNING {COLUMNS}"
+EXTEND = f"UPDATE licenses SET subscription_duration = subscription_duration + ?1 WHERE hwid = ?2 RETURNING {COLUMNS}"
+DELETE = "DELETE FROM licenses WHERE hwid = ?"
+
+# Статусы license_status в виде SQL (?1 - текущее время)
+STATUS_SQL = {
+    "not_activated": "created_at = 0",
+    "expired_time": "created_at != 0 AND expires_at - ?1 <= 0",
+    "expired_uses": "created_at != 0 AND expires_at - ?1 > 0 AND use_count >= max_uses",
+    "active": "created_at != 0 AND expires_at - ?1 > 0 AND use_count < max_uses",
+}
+STATUS_SQL["expired"] = f"NOT ({STATUS_SQL['active']})"
+
+STATS = "SELECT " + ", ".join(f"COALESCE(SUM({condition}), 0)" for status, condition in STATUS_SQL.items()
+                              if status != "expired") + " FROM licenses"
+NEXT_EXPIRY = "SELECT MIN(expires_at) FROM licenses WHERE expires_at > ?1"
+
+SEARCH_HWID = f"SELECT hwid, {COLUMNS} FROM licenses WHERE hwid >= ? AND hwid < ? ORDER BY hwid LIMIT ?"
+
+SORT_COLUMNS = {"hwid": "hwid", "user_name": "user_name", "expires_at": "expires_at", "created_at": "created_at"}
+
+
+def _record(row):
+    return dict(zip(FIELDS, row)) if row is not None else None
+
+
+class SqliteLicenseStore:
+    """Таблица лицензий в SQLite с пулом соединений
+
+    sync_commit=True - synchronous=FULL (fsync на каждую транзакцию), иначе
+    NORMAL: в режиме WAL при сбое питания можно потерять последние
+    транзакции, но база останется целой.
+    """
+
+    def __init__(self, path, seed=None, sync_commit=False, pool_size=16, cached_statements=64):
+        started = time.perf_counter()
+        self.path = path
+        self._sync_commit = sync_commit
+        self._cached_statements = cached_statements
+        self._pool = queue.LifoQueue()
+        self._semaphore = threading.BoundedSemaphore(pool_size)
+        self._connections = []
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            new = db.execute("PRAGMA user_version").fetchone()[0] == 0
+            db.executescript(SCHEMA)
+            db.execute("PRAGMA user_version = 1")
+
+        # Начальные лицензии записываем только в совсем новую базу
+        if new and seed:
+            for hwid, license_data in seed.items():
+                self.add(hwid, license_data)
+        self.recovery_time = time.perf_counter() - started
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False,
+                             cached_statements=self._cached_statements)
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute(f"PRAGMA synchronous = {'FULL' if self._sync_commit else 'NORMAL'}")
+        with self._lock:
+            self._connections.append(db)
+        return db
+
+    @contextmanager
+    def _connection(self):
+        """Соединение из пула на время операции (не больше pool_size одновременно)"""
+        self._semaphore.acquire()
+        try:
+            db = self._pool.get_nowait()
+        except queue.Empty:
+            db = self._connect()
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                db.rollback()
+            self._pool.put(db)
+            self._semaphore.release()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE: блокировка записи берется сразу, а не при первом изменении
+        with self._connection() as db:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            if db.in_transaction:
+                db.execute("COMMIT")
+
+    def _one(self, sql, *params):
+        # fetchall: UPDATE ... RETURNING завершается (и фиксируется) только после чтения всех строк
+        with self._connection() as db:
+            rows = db.execute(sql, params).fetchall()
+        return _record(rows[0]) if rows else None
+
+    def __contains__(self, hwid):
+        with self._connection() as db:
+            return db.execute("SELECT 1 FROM licenses WHERE hwid = ?", (hwid,)).fetchone() is not None
+
+    def __len__(self):
+        with self._connection() as db:
+            return db.execute("SELECT COUNT(*) FROM licenses").fetchone()[0]
+
+    def get(self, hwid):
+        """Запись лицензии или None"""
+        return self._one(SELECT_ONE, hwid)
+
+    def items(self):
+        """Вся таблица в виде списка (hwid, запись)"""
+        with self._connection() as db:
+            return [(row[0], _record(row[1:])) for row in db.execute(f"SELECT hwid, {COLUMNS} FROM licenses")]
+
+    def keys(self):
+        """Список всех HWID"""
+        with self._connection() as db:
+            return [row[0] for row in db.execute("SELECT hwid FROM licenses")]
+
+    def get_many(self, hwids):
+        """Записи для списка HWID в том же порядке (удаленные пропускаются)"""
+        found = {}
+        with self._connection() as db:
+            # Параметров в одном запросе не больше 999 (лимит старых сборок SQLite)
+            for start in range(0, len(hwids), 500):
+                chunk = hwids[start:start + 500]
+                sql = f"SELECT hwid, {COLUMNS} FROM licenses WHERE hwid IN ({', '.join('?' * len(chunk))})"
+                for row in db.execute(sql, chunk):
+                    found[row[0]] = _record(row[1:])
+        return [(hwid, found[hwid]) for hwid in hwids if hwid in found]
+
+    def add(self, hwid, license_data):
+        """Добавление лицензии; False, если такой HWID уже есть"""
+        with self._connection() as db:
+            return db.execute(INSERT, (hwid, *(license_data[field] for field in FIELDS))).rowcount == 1
+
+    def update(self, hwid, **fields):
+        """Изменение полей лицензии, возвращает запись или None"""
+        names = sorted(fields)
+        if any(name not in FIELDS for name in names):
+            raise ValueError(f"Неизвестные поля: {names}")
+        # Для каждого набора полей строка SQL одна и та же - запрос подготавливается один раз
+        sql = f"UPDATE licenses SET {', '.join(f'{name} = ?' for name in names)} WHERE hwid = ? RETURNING {COLUMNS}"
+        return self._one(sql, *(fields[name] for name in names), hwid)
+
+    def extend(self, hwid, seconds):
+        """Продление подписки на seconds секунд"""
+        return self._one(EXTEND, seconds, hwid)
+
+    def delete(self, hwid):
+        """Удаление лицензии; False, если ее не было"""
+        with self._connection() as db:
+            return db.execute(DELETE, (hwid,)).rowcount == 1
+
+    def bulk(self, operations):
+        """Применение пакета операций одной транзакцией (как LicenseStore.bulk)"""
+        errors = []
+        with self._transaction() as db:
+            staged = {}
+            for n, (op, hwid, fields) in enumerate(operations, 1):
+                if hwid in staged:
+                    current = staged[hwid]
+                else:
+                    current = _record(db.execute(SELECT_ONE, (hwid,)).fetchone())
+                if op == "add":
+                    if current is not None:
+                        errors.append((n, f"Лицензия с HWID {hwid} уже существует"))
+                    else:
+                        staged[hwid] = {field: fields[field] for field in FIELDS}
+                elif op == "put":
+                    staged[hwid] = {field: fields[field] for field in FIELDS}
+                elif current is None:
+                    errors.append((n, f"Лицензия {hwid} не найдена"))
+                elif op == "delete":
+                    staged[hwid] = None
+                elif op == "extend":
+                    staged[hwid] = dict(current, subscription_duration=current["subscription_duration"] + fields["seconds"])
+                elif op == "update":
+                    staged[hwid] = dict(current, **fields)
+                else:
+                    errors.append((n, f"Неизвестная операция {op}"))
+
+            if errors:
+                db.execute("ROLLBACK")
+                return errors
+            db.executemany(DELETE, [(hwid,) for hwid, license_data in staged.items() if license_data is None])
+            db.executemany(REPLACE, [(hwid, *(license_data[field] for field in FIELDS))
+                                     for hwid, license_data in staged.items() if license_data is not None])
+        return errors
+
+    def _refusal(self, hwid, current_time):
+        # UPDATE не нашел подходящую строку - причину отказа берем из текущей записи
+        license_data = self.get(hwid)
+        if license_data is None:
+            return False, "Лицензия не найдена"
+        is_valid, message, activate = check_license_data(license_data, current_time)
+        return False, message
+
+    def validate(self, hwid, current_time):
+        """Проверка лицензии (с активацией при первом использовании)"""
+        license_data = self.get(hwid)
+        if license_data is None:
+            return False, "Лицензия не найдена"
+        is_valid, message, activate = check_license_data(license_data, current_time)
+        if activate and self._one(ACTIVATE, current_time, hwid) is None:
+            # Лицензию успели активировать или изменить между чтением и записью
+            return self.validate(hwid, current_time)
+        return is_valid, message
+
+    def use(self, hwid, current_time):
+        """Проверка лицензии и учет использования одним условным UPDATE
+
+        Возвращает (валидна, сообщение, запись после учета).
+        """
+        license_data = self._one(USE_ACTIVE, current_time, hwid)
+        if license_data is not None:
+            return True, "Лицензия действительна", license_data
+        license_data = self._one(USE_ACTIVATE, current_time, hwid)
+        if license_data is not None:
+            return True, "Лицензия активирована", license_data
+        return self._refusal(hwid, current_time) + (None,)
+
+    def increment(self, hwid, current_time):
+        """Увеличение счетчика использований без проверки"""
+        return self._one(INCREMENT, current_time, hwid)
+
+    def stats(self, current_time):
+        """Количество лицензий по статусам (один проход по таблице)"""
+        with self._connection() as db:
+            counts = dict(zip(("not_activated", "expired_time", "expired_uses", "active"),
+                              db.execute(STATS, (current_time,)).fetchone()))
+            next_expiry = db.execute(NEXT_EXPIRY, (current_time,)).fetchone()[0]
+        counts = {status: counts[status] for status in ("active", "expired_time", "expired_uses", "not_activated")}
+        counts["total"] = sum(counts.values())
+        counts["expired"] = counts["total"] - counts["active"]
+        counts["next_expiry"] = next_expiry
+        return counts
+
+    def page(self, sort="hwid", descending=False, after=None, limit=50, status=None,
+             user_prefix=None, expiring_before=None, current_time=0, max_scan=None):
+        """Страница лицензий (параметры и курсор - как у LicenseStore.page)"""
+        column = SORT_COLUMNS[sort]
+        conditions = []
+        params = {"now": current_time}
+        if after:
+            conditions.append(f"({column}, hwid) {'<' if descending else '>'} (:after_value, :after_hwid)")
+            params["after_value"], params["after_hwid"] = after
+        if status:
+            conditions.append("(" + STATUS_SQL[status].replace("?1", ":now") + ")")
+        if user_prefix:
+            conditions.append("user_name >= :prefix AND user_name < :prefix_end")
+            params["prefix"], params["prefix_end"] = user_prefix, user_prefix + "\U0010ffff"
+        if expiring_before:
+            conditions.append("created_at != 0 AND expires_at < :expiring_before")
+            params["expiring_before"] = expiring_before
+
+        order = "DESC" if descending else "ASC"
+        sql = (f"SELECT {column}, hwid, {COLUMNS} FROM licenses"
+               f"{' WHERE ' + ' AND '.join(conditions) if conditions else ''}"
+               f" ORDER BY {column} {order}, hwid {order} LIMIT :limit")
+        params["limit"] = limit + 1
+        with self._connection() as db:
+            rows = db.execute(sql, params).fetchall()
+
+        results = [(row[1], _record(row[2:])) for row in rows[:limit]]
+        if len(rows) <= limit:
+            return results, None
+        return results, [rows[limit - 1][0], rows[limit - 1][1]]
+
+    def search(self, query, limit=50):
+        """Поиск по части HWID или имени (правила и результат - как у LicenseStore.search)
+
+        HWID ищется по диапазону первичного ключа, имя - просмотром индекса
+        имен с отбором LIKE. LIKE не различает регистр только у латиницы,
+        поэтому остальные слова проверяются уже в Python: на больших
+        таблицах это медленнее, чем обратный индекс в памяти.
+        """
+        query = query.strip()
+        if not query:
+            return [], False
+        found = {}
+        matched = []
+        with self._connection() as db:
+            for prefix in dict.fromkeys((query, query.upper())):
+                for row in db.execute(SEARCH_HWID, (prefix, prefix + "\U0010ffff", limit + 1)):
+                    found.setdefault(row[0], _record(row[1:]))
+
+            words = sorted(name_words(query))
+            if words and len(found) <= limit:
+                params = [f"%{word}%" for word in words if word.isascii()]
+                sql = ("SELECT hwid, user_name FROM licenses WHERE user_name IS NOT NULL"
+                       + " AND user_name LIKE ?" * len(params) + " ORDER BY user_name, hwid")
+                rows = db.execute(sql, params)
+                try:
+                    for hwid, name in rows:
+                        if hwid not in found and name_matches(name, words):
+                            matched.append(hwid)
+                            if len(found) + len(matched) > limit:
+                                break
+                finally:
+                    # Незавершенный SELECT держал бы снимок базы, пока соединение в пуле
+                    rows.close()
+
+        results = list(found.items()) + self.get_many(matched)
+        return results[:limit], len(results) > limit
+
+    def flush(self):
+        """Накопленного учета нет - каждая операция сразу пишется в базу"""
+        return 0
+
+    def changes(self, epoch, after, timeout=0):
+        """Журнала репликации нет: узлы с SQLite делят файл базы, а не реплицируют таблицу"""
+        return None
+
+    def replication_stats(self):
+        return None
+
+    def watch(self, after=None):
+        return None
+
+    def unwatch(self):
+        pass
+
+    def changed(self, after, timeout=0, limit=1000):
+        """Ленты изменений нет (базу могут менять другие процессы): админка обновляется опросом"""
+        return None
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            db.close()
@@ -0,0 +1,1446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import gc
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+
+from license_index import ChangeFeed, ExpiryIndex, LicenseIndex, LicenseStats, SearchIndex
+
+# Поля записи лицензии в порядке хранения в снапшоте
+FIELDS = ("user_name", "subscription_duration", "max_uses", "created_at", "last_used", "use_count")
+
+# Границы int64; минимум - метка "значение лежит вне массива"
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+def check_license_data(license_data, current_time):
+    """Правила проверки лицензии: (валидна, сообщение, нужно_активировать)"""
+    # Проверяем количество использований
+    if license_data["use_count"] >= license_data["max_uses"]:
+        return False, "Превышено максимальное количество использований", False
+
+    # Если лицензия еще не была использована, ее нужно активировать
+    if license_data["created_at"] == 0:
+        return True, "Лицензия активирована", True
+
+    # Проверяем время истечения
+    if current_time > license_data["created_at"] + license_data["subscription_duration"]:
+        return False, "Лицензия истекла", False
+
+    return True, "Лицензия действительна", False
+
+
+def license_status(license_data, current_time):
+    """Статус лицензии для админки: active, expired_time, expired_uses, not_activated"""
+    if license_data["created_at"] == 0:
+        return "not_activated"
+    if license_data["created_at"] + license_data["subscription_duration"] - current_time <= 0:
+        return "expired_time"
+    if license_data["use_count"] >= license_data["max_uses"]:
+        return "expired_uses"
+    return "active"
+
+
+class LicenseTable:
+    """Таблица лицензий колонками: HWID -> номер строки и по массиву на поле
+
+    Словарь на лицензию с отдельными объектами int для каждого времени
+    занимает больше полукилобайта, а строка таблицы - 40 байт в массивах
+    array("q") плюс ссылка на имя (одинаковые имена хранятся один раз).
+
+    Снаружи таблица похожа на словарь hwid -> запись, только get() и
+    items() собирают новый словарь при каждом обращении: изменить запись
+    можно лишь присваиванием table[hwid] = запись. Значения, которые не
+    помещаются в int64 (или не int), хранятся в отдельном словаре.
+
+    Одну лицензию меняет только держатель блокировки ее полосы; выделение
+    и освобождение строк защищены собственной блокировкой таблицы.
+    """
+
+    NUMBERS = FIELDS[1:]
+
+    def __init__(self, records=None):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._free = []
+        self._names = []
+        self._columns = [array("q") for field in self.NUMBERS]
+        self._other = {}
+        for hwid, license_data in (records or {}).items():
+            self[hwid] = license_data
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Таблица из колонок снапшота (массивы строятся целиком, без цикла по записям)"""
+        table = cls()
+        hwids = columns["hwid"]
+        table._names = [sys.intern(name) if type(name) is str else name for name in columns["user_name"]]
+        for i, field in enumerate(cls.NUMBERS):
+            try:
+                table._columns[i] = array("q", columns[field])
+            except (TypeError, OverflowError):
+                column = table._columns[i]
+                for row, value in enumerate(columns[field]):
+                    column.append(table._pack(row, i, value))
+        table._rows = dict(zip(hwids, range(len(hwids))))
+        if len(table._rows) != len(hwids):
+            # Повторяющийся HWID: остается последняя строка, как при загрузке в словарь
+            table._free = sorted(set(range(len(hwids))) - set(table._rows.values()), reverse=True)
+        return table
+
+    def _pack(self, row, i, value):
+        # Значение для массива; чужие значения - в словарь, в массиве остается метка
+        if type(value) is int and _INT64_MIN < value <= _INT64_MAX:
+            if self._other:
+                self._other.pop((row, i), None)
+            return value
+        self._other[(row, i)] = value
+        return _INT64_MIN
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, hwid):
+        return hwid in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def _read(self, row):
+        columns = self._columns
+        subscription_duration = columns[0][row]
+        max_uses = columns[1][row]
+        created_at = columns[2][row]
+        last_used = columns[3][row]
+        use_count = columns[4][row]
+        license_data = {
+            "user_name": self._names[row],
+            "subscription_duration": subscription_duration,
+            "max_uses": max_uses,
+            "created_at": created_at,
+            "last_used": last_used,
+            "use_count": use_count
+        }
+        if self._other and _INT64_MIN in (subscription_duration, max_uses, created_at, last_used, use_count):
+            for i, field in enumerate(self.NUMBERS):
+                if license_data[field] == _INT64_MIN:
+                    license_data[field] = self._other.get((row, i))
+        return license_data
+
+    def get(self, hwid, default=None):
+        """Новый словарь с записью лицензии или default"""
+        row = self._rows.get(hwid)
+        if row is None:
+            return default
+        license_data = self._read(row)
+        # Строку могли освободить и отдать другой лицензии, пока мы ее читали
+        if self._rows.get(hwid) != row:
+            return self.get(hwid, default)
+        return license_data
+
+    def __getitem__(self, hwid):
+        license_data = self.get(hwid)
+        if license_data is None:
+            raise KeyError(hwid)
+        return license_data
+
+    def __setitem__(self, hwid, license_data):
+        row = self._rows.get(hwid)
+        if row is not None:
+            self._write(row, license_data)
+            return
+        with self._lock:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self._names)
+                self._names.append(None)
+                for column in self._columns:
+                    column.append(0)
+            self._write(row, license_data)
+            # Строка видна читателям только после записи всех полей
+            self._rows[hwid] = row
+
+    def _write(self, row, license_data):
+        name = license_data["user_name"]
+        self._names[row] = sys.intern(name) if type(name) is str else name
+        for i, field in enumerate(self.NUMBERS):
+            self._columns[i][row] = self._pack(row, i, license_data[field])
+
+    def pop(self, hwid, default=None):
+        """Удаление лицензии, возвращает ее запись или default"""
+        with self._lock:
+            row = self._rows.pop(hwid, None)
+            if row is None:
+                return default
+            license_data = self._read(row)
+            self._names[row] = None
+            for i in range(len(self._columns)):
+                self._columns[i][row] = 0
+                self._other.pop((row, i), None)
+            self._free.append(row)
+        return license_data
+
+    def __delitem__(self, hwid):
+        if self.pop(hwid) is None:
+            raise KeyError(hwid)
+
+    def items(self):
+        """Пары (hwid, новый словарь записи) в порядке добавления"""
+        for hwid, row in list(self._rows.items()):
+            yield hwid, self._read(row)
+
+    def values(self):
+        for hwid, license_data in self.items():
+            yield license_data
+
+    def copy(self):
+        """Независимая копия (копируются массивы, а не записи) - для снапшота под блокировкой"""
+        table = LicenseTable()
+        with self._lock:
+            table._rows = dict(self._rows)
+            table._free = list(self._free)
+            table._names = list(self._names)
+            table._columns = [array("q", column) for column in self._columns]
+            table._other = dict(self._other)
+        return table
+
+    def columns(self):
+        """Колонки для снапшота (формат write_snapshot)"""
+        rows = list(self._rows.values())
+        columns = {"hwid": list(self._rows), "user_name": [self._names[row] for row in rows]}
+        for i, field in enumerate(self.NUMBERS):
+            column = self._columns[i]
+            values = [column[row] for row in rows]
+            if self._other:
+                values = [self._other.get((row, i)) if value == _INT64_MIN else value
+                          for row, value in zip(rows, values)]
+            columns[field] = values
+        return columns
+
+
+def write_snapshot(path, records, seq):
+    """Атомарная запись снапшота (колонками, чтобы восстановление было быстрым)"""
+    if isinstance(records, (LicenseTable, MappedTable)):
+        columns = records.columns()
+    else:
+        columns = {"hwid": list(records)}
+        for field in FIELDS:
+            columns[field] = [data[field] for data in records.values()]
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"seq": seq, "columns": columns}, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    """Чтение снапшота: (таблица LicenseTable, номер последней вошедшей в него операции)"""
+    if not os.path.exists(path):
+        return LicenseTable(), 0
+
+    with open(path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    return LicenseTable.from_columns(snapshot["columns"]), snapshot["seq"]
+
+
+# Двоичный снапшот: заголовок, записи фиксированной ширины по возрастанию HWID
+# (они же индекс для бинарного поиска) и строки HWID и имен
+SNAPSHOT_MAGIC = b"LICSNAP1"
+SNAPSHOT_HEADER = struct.Struct("<8sQQQ")  # Метка, seq, число записей, смещение строк
+# Смещение и длина HWID, смещение и длина имени, числовые поля LicenseTable.NUMBERS
+SNAPSHOT_RECORD = struct.Struct("<QHQH5q")
+SNAPSHOT_KEY = struct.Struct("<QH")
+# Длина имени для user_name = None
+_NO_NAME = 0xFFFF
+# Каждый такой по счету HWID снапшота держится в памяти: поиск начинается с bisect по ним
+_FENCE_STEP = 256
+
+
+def write_binary_snapshot(path, records, seq):
+    """Атомарная запись двоичного снапшота
+
+    ValueError, если запись не укладывается в формат (имя не строка и не
+    None, число вне int64, строка длиннее 65534 байт) - тогда нужен JSON.
+    HWID не строка - AttributeError или TypeError из encode/сортировки.
+    """
+    rows = sorted((hwid.encode("utf-8"), license_data) for hwid, license_data in records.items())
+    strings = []
+    packed = []
+    offset = 0
+    for hwid, license_data in rows:
+        name = license_data["user_name"]
+        if name is not None and type(name) is not str:
+            raise ValueError(f"user_name {name!r} не строка")
+        name = name.encode("utf-8") if name is not None else b""
+        if len(hwid) >= _NO_NAME or len(name) >= _NO_NAME:
+            raise ValueError("Слишком длинный HWID или имя")
+        numbers = [license_data[field] for field in LicenseTable.NUMBERS]
+        if any(type(value) is not int for value in numbers):
+            raise ValueError("Нечисловое поле")
+        try:
+            packed.append(SNAPSHOT_RECORD.pack(offset, len(hwid), offset + len(hwid),
+                                               len(name) if license_data["user_name"] is not None else _NO_NAME,
+                                               *numbers))
+        except struct.error as e:
+            raise ValueError(str(e))
+        strings.append(hwid)
+        strings.append(name)
+        offset += len(hwid) + len(name)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, seq, len(rows), SNAPSHOT_HEADER.size + SNAPSHOT_RECORD.size * len(rows)))
+        f.write(b"".join(packed))
+        f.write(b"".join(strings))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class MappedTable:
+    """Таблица лицензий поверх двоичного снапшота, отображенного в память (mmap)
+
+    Запуск не читает записи: файл отображается в память (в памяти процесса -
+    только каждый 256-й HWID), лицензия ищется бинарным поиском по
+    отсортированным HWID и при первом обращении
+    переносится в обычную LicenseTable (overlay). Изменения идут только в
+    overlay, удаленные из снапшота HWID помнит множество gone. Полный обход
+    (items, построение индексов админки, снапшот) читает снапшот напрямую,
+    не перенося записи в память.
+
+    Блокировки - как у LicenseTable; перенос из снапшота и вставка новой
+    лицензии идут под блокировкой таблицы, поэтому не затирают друг друга.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._map, "madvise"):
+            # Обращения точечные: упреждающее чтение соседних страниц только занимает память
+            self._map.madvise(mmap.MADV_RANDOM)
+        magic, self.seq, self._count, self._heap = SNAPSHOT_HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path}: не снапшот лицензий")
+        self._fence = [self._key(index) for index in range(0, self._count, _FENCE_STEP)]
+        self._lock = threading.Lock()
+        self._overlay = LicenseTable()
+        self._gone = set()
+        # Лицензии overlay, которых нет в снапшоте
+        self._added = 0
+
+    def _key(self, index):
+        offset, length = SNAPSHOT_KEY.unpack_from(self._map, SNAPSHOT_HEADER.size + index * SNAPSHOT_RECORD.size)
+        return self._map[self._heap + offset:self._heap + offset + length]
+
+    def _find(self, hwid):
+        """Номер записи снапшота с этим HWID или None"""
+        if type(hwid) is not str:
+            return None
+        key = hwid.encode("utf-8")
+        block = bisect_right(self._fence, key) - 1
+        if block < 0:
+            return None
+        low = block * _FENCE_STEP
+        high = min(low + _FENCE_STEP, self._count)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._key(low) == key:
+            return low
+        return None
+
+    def _record(self, index):
+        """(hwid, запись) записи снапшота"""
+        hwid_offset, hwid_length, name_offset, name_length, *numbers = SNAPSHOT_RECORD.unpack_from(
+            self._map, SNAPSHOT_HEADER.size + index * SNAPSHOT_RECORD.size)
+        start = self._heap + hwid_offset
+        hwid = self._map[start:start + hwid_length].decode("utf-8")
+        if name_length == _NO_NAME:
+            name = None
+        else:
+            start = self._heap + name_offset
+            name = self._map[start:start + name_length].decode("utf-8")
+        license_data = dict(zip(LicenseTable.NUMBERS, numbers))
+        license_data["user_name"] = name
+        return hwid, license_data
+
+    def __len__(self):
+        return self._count - len(self._gone) + self._added
+
+    def __contains__(self, hwid):
+        return hwid in self._overlay or (hwid not in self._gone and self._find(hwid) is not None)
+
+    def __iter__(self):
+        for hwid, license_data in self.items():
+            yield hwid
+
+    def get(self, hwid, default=None):
+        """Новый словарь с записью лицензии (при первом обращении - перенос из снапшота) или default"""
+        license_data = self._overlay.get(hwid)
+        if license_data is not None:
+            return license_data
+        if hwid in self._gone:
+            return default
+        index = self._find(hwid)
+        if index is None:
+            return default
+        with self._lock:
+            if hwid not in self._overlay and hwid not in self._gone:
+                self._overlay[hwid] = self._record(index)[1]
+        return self._overlay.get(hwid, default)
+
+    def __getitem__(self, hwid):
+        license_data = self.get(hwid)
+        if license_data is None:
+            raise KeyError(hwid)
+        return license_data
+
+    def __setitem__(self, hwid, license_data):
+        if hwid in self._overlay:
+            self._overlay[hwid] = license_data
+            return
+        with self._lock:
+            if hwid not in self._overlay:
+                if hwid in self._gone:
+                    self._gone.discard(hwid)
+                elif self._find(hwid) is None:
+                    self._added += 1
+            self._overlay[hwid] = license_data
+
+    def pop(self, hwid, default=None):
+        """Удаление лицензии, возвращает ее запись или default"""
+        with self._lock:
+            index = self._find(hwid) if hwid not in self._gone else None
+            license_data = self._overlay.pop(hwid)
+            if index is not None:
+                self._gone.add(hwid)
+                if license_data is None:
+                    license_data = self._record(index)[1]
+            elif license_data is not None:
+                self._added -= 1
+        return license_data if license_data is not None else default
+
+    def __delitem__(self, hwid):
+        if self.pop(hwid) is None:
+            raise KeyError(hwid)
+
+    def items(self):
+        """Пары (hwid, новый словарь записи): сначала измененные и прочитанные, затем остальные из снапшота"""
+        overlay = list(self._overlay.items())
+        yield from overlay
+        seen = {hwid for hwid, license_data in overlay}
+        for index in range(self._count):
+            hwid, license_data = self._record(index)
+            if hwid not in seen and hwid not in self._gone and hwid not in self._overlay:
+                yield hwid, license_data
+
+    def values(self):
+        for hwid, license_data in self.items():
+            yield license_data
+
+    def copy(self):
+        """Независимая копия изменений поверх того же снапшота (файл не меняется, новый пишется рядом)"""
+        table = MappedTable.__new__(MappedTable)
+        table._map, table.seq, table._count, table._heap = self._map, self.seq, self._count, self._heap
+        table._fence = self._fence
+        table._lock = threading.Lock()
+        with self._lock:
+            table._overlay = self._overlay.copy()
+            table._gone = set(self._gone)
+            table._added = self._added
+        return table
+
+    def columns(self):
+        """Колонки для снапшота (формат write_snapshot)"""
+        columns = {"hwid": [], "user_name": []}
+        for field in LicenseTable.NUMBERS:
+            columns[field] = []
+        for hwid, license_data in self.items():
+            columns["hwid"].append(hwid)
+            for field in FIELDS:
+                columns[field].append(license_data[field])
+        return columns
+
+
+def load_snapshot(data_dir):
+    """Снапшот каталога хранилища: двоичный (snapshot.bin) или прежний JSON; (таблица, seq)"""
+    path = os.path.join(data_dir, "snapshot.bin")
+    if os.path.exists(path):
+        table = MappedTable(path)
+        return table, table.seq
+    return read_snapshot(os.path.join(data_dir, "snapshot.json"))
+
+
+class NullLog:
+    """Журнал-заглушка: лицензии живут только в памяти"""
+
+    def load(self):
+        return LicenseTable(), 0
+
+    def append(self, entry):
+        return 0
+
+    def last_seq(self):
+        return 0
+
+    def wait(self, seq):
+        pass
+
+    def should_compact(self):
+        return False
+
+    def compact(self, records, seq):
+        pass
+
+    def close(self):
+        pass
+
+
+class WriteAheadLog:
+    """Журнал упреждающей записи с групповым fsync и периодическим снапшотом
+
+    Файлы в data_dir:
+      snapshot.bin         - снимок всей таблицы и номер последней вошедшей в него операции
+                             (отображается в память, см. MappedTable); snapshot.json -
+                             тот же снимок в JSON (snapshot_format="json" или данные,
+                             не укладывающиеся в двоичный формат)
+      wal-<первый seq>.log - сегменты журнала, по строке JSON на операцию
+                             (пакетная операция - тоже одна строка)
+
+    Записи копятся в памяти и сбрасываются на диск фоновым потоком одним
+    write + fsync раз в fsync_interval секунд, поэтому горячий путь не платит
+    за fsync на каждый запрос. При sync_commit=True запрос дожидается fsync
+    своей записи (групповой коммит: один fsync на всех ожидающих).
+    """
+
+    def __init__(self, data_dir, fsync_interval=0.01, sync_commit=False, snapshot_every=100000, snapshot_format="binary"):
+        self.data_dir = data_dir
+        self.fsync_interval = fsync_interval
+        self.sync_commit = sync_commit
+        self.snapshot_every = snapshot_every
+        self.snapshot_format = snapshot_format
+        self.recovery_time = 0.0
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._seq = 0
+        self._durable_seq = 0
+        self._since_snapshot = 0
+        self._compacting = False
+        self._closed = False
+        self._file = None
+        self._thread = None
+
+    def _segments(self):
+        names = [name for name in os.listdir(self.data_dir) if name.startswith("wal-") and name.endswith(".log")]
+        return sorted(names, key=lambda name: int(name[4:-4]))
+
+    def _open_segment(self, first_seq):
+        path = os.path.join(self.data_dir, f"wal-{first_seq}.log")
+        return open(path, "a", encoding="utf-8")
+
+    def load(self):
+        """Восстановление: снапшот + проигрывание хвоста журнала"""
+        started = time.perf_counter()
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        # Сборщик мусора на миллионе новых словарей только тратит время
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            records, seq, replayed = self._recover()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        self._seq = self._durable_seq = seq
+        self._since_snapshot = replayed
+        self._file = self._open_segment(seq + 1)
+        self._thread = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+        self.recovery_time = time.perf_counter() - started
+        return records, seq
+
+    def _recover(self):
+        records, seq = load_snapshot(self.data_dir)
+        replayed = 0
+        for name in self._segments():
+            with open(os.path.join(self.data_dir, name), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя запись после сбоя - дальше в сегменте ничего нет
+                        break
+                    if entry["s"] <= seq:
+                        continue
+                    if entry["op"] == "put":
+                        records[entry["h"]] = entry["d"]
+                    elif entry["op"] == "del":
+                        records.pop(entry["h"], None)
+                    else:
+                        # Пакет применяется целиком (оборванная строка отбрасывается целиком)
+                        for hwid, license_data in entry["d"].items():
+                            if license_data is None:
+                                records.pop(hwid, None)
+                            else:
+                                records[hwid] = license_data
+                    seq = entry["s"]
+                    replayed += 1
+        return records, seq, replayed
+
+    def append(self, entry):
+        """Добавление операции в журнал, возвращает ее номер"""
+        # Сериализуем вне блокировки, под ней только назначаем номер
+        body = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._cond:
+            self._seq += 1
+            self._pending.append(f'{{"s":{self._seq},{body[1:]}')
+            self._since_snapshot += 1
+            self._cond.notify_all()
+            return self._seq
+
+    def last_seq(self):
+        """Номер последней добавленной операции"""
+        with self._cond:
+            return self._seq
+
+    def wait(self, seq):
+        """Ожидание fsync операции (только в режиме sync_commit)"""
+        if not self.sync_commit:
+            return
+        with self._cond:
+            while self._durable_seq < seq and not self._closed:
+                self._cond.wait()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                batch = self._pending
+                self._pending = []
+                seq = self._seq
+
+            self._write_batch(batch)
+
+            with self._cond:
+                self._durable_seq = max(self._durable_seq, seq)
+                self._cond.notify_all()
+
+            # Окно группировки: за это время накопится следующая пачка записей
+            if self.fsync_interval:
+                time.sleep(self.fsync_interval)
+
+    def _write_batch(self, batch):
+        lines = []
+        for item in batch:
+            if isinstance(item, tuple):
+                # Маркер ротации: дописываем старый сегмент и открываем новый
+                self._write_lines(lines)
+                lines = []
+                self._file.close()
+                self._file = self._open_segment(item[1])
+            else:
+                lines.append(item)
+        self._write_lines(lines)
+
+    def _write_lines(self, lines):
+        if not lines:
+            return
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def should_compact(self):
+        return not self._compacting and self._since_snapshot >= self.snapshot_every
+
+    def compact(self, records, seq):
+        """Запись снапшота в фоне; records - копия таблицы на момент операции seq
+
+        Вызывается, когда таблица заблокирована целиком и seq - последняя
+        операция в журнале, поэтому маркер ротации встает ровно после нее.
+        """
+        with self._cond:
+            if self._compacting:
+                return
+            self._compacting = True
+            self._pending.append(("rotate", seq + 1))
+            self._cond.notify_all()
+        threading.Thread(target=self._compact, args=(records, seq), name="wal-compactor", daemon=True).start()
+
+    def _compact(self, records, seq):
+        try:
+            # Новые операции идут уже в новый сегмент, старые удаляем после снапшота
+            with self._cond:
+                while self._durable_seq < seq:
+                    self._cond.wait()
+            self._write_snapshot(records, seq)
+            for name in self._segments():
+                if int(name[4:-4]) <= seq:
+                    os.remove(os.path.join(self.data_dir, name))
+        except Exception as e:
+            # Сегменты остаются, журнал полон; следующая попытка - через snapshot_every операций
+            print(f"⚠️ WAL compaction at seq {seq} failed: {e}")
+        finally:
+            # И после неудачи: иначе каждая запись заново копировала бы таблицу и открывала сегмент
+            with self._cond:
+                self._since_snapshot = self._seq - seq
+            self._compacting = False
+
+    def _write_snapshot(self, records, seq):
+        binary_path = os.path.join(self.data_dir, "snapshot.bin")
+        json_path = os.path.join(self.data_dir, "snapshot.json")
+        if self.snapshot_format == "binary":
+            try:
+                write_binary_snapshot(binary_path, records, seq)
+                stale = json_path
+            except (ValueError, TypeError, AttributeError):
+                # Запись не укладывается в двоичный формат (в том числе HWID не строка)
+                write_snapshot(json_path, records, seq)
+                stale = binary_path
+        else:
+            write_snapshot(json_path, records, seq)
+            stale = binary_path
+        # При загрузке двоичный снапшот важнее, поэтому старый файл другого формата удаляется
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+        if self._file:
+            self._file.close()
+
+
+class ColdStore:
+    """Холодное хранилище давно истекших лицензий
+
+    Файл cold.log в data_dir: по строке JSON {"h": hwid, "d": запись или null}
+    на каждое выселение или удаление, действует последняя строка для HWID.
+    В памяти держится только смещение строки, сама запись читается с диска.
+    """
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, "cold.log")
+        self._lock = threading.Lock()
+        self._offsets = {}
+        os.makedirs(data_dir, exist_ok=True)
+
+        offset = 0
+        with open(self.path, "ab+") as f:
+            f.seek(0)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после сбоя
+                    f.truncate(offset)
+                    break
+                if entry["d"] is None:
+                    self._offsets.pop(entry["h"], None)
+                else:
+                    self._offsets[entry["h"]] = (offset, len(line))
+                offset += len(line)
+        self._file = open(self.path, "ab+")
+
+    def __contains__(self, hwid):
+        return hwid in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def keys(self):
+        """Список HWID лицензий в холодном хранилище"""
+        with self._lock:
+            return list(self._offsets)
+
+    def get(self, hwid):
+        """Запись лицензии из холодного хранилища или None"""
+        position = self._offsets.get(hwid)
+        if position is None:
+            return None
+        offset, length = position
+        return json.loads(os.pread(self._file.fileno(), length, offset))["d"]
+
+    def _write(self, entries):
+        lines = [(json.dumps({"h": hwid, "d": license_data}, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+                 for hwid, license_data in entries]
+        with self._lock:
+            offset = self._file.seek(0, os.SEEK_END)
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            for (hwid, license_data), line in zip(entries, lines):
+                if license_data is None:
+                    self._offsets.pop(hwid, None)
+                else:
+                    self._offsets[hwid] = (offset, len(line))
+                offset += len(line)
+
+    def put_many(self, entries):
+        """Запись списка (hwid, запись) с fsync"""
+        if entries:
+            self._write(entries)
+
+    def discard(self, hwid):
+        """Удаление лицензии из холодного хранилища; False, если ее там не было"""
+        if hwid not in self._offsets:
+            return False
+        self._write([(hwid, None)])
+        return True
+
+    def close(self):
+        self._file.close()
+
+
+class LicenseStore:
+    """Таблица лицензий; все изменения проходят через журнал
+
+    Наружу отдаются только копии записей, поэтому изменить лицензию в обход
+    журнала нельзя. Блокировки разбиты на полосы по hash(hwid): операции над
+    одной лицензией (проверка + учет использования) атомарны, а запросы к
+    разным HWID не ждут друг друга.
+
+    Слушатели (add_listener) вызываются после каждого изменения под
+    блокировкой полосы с аргументами (hwid, старая запись, новая запись);
+    None означает, что лицензии не было или она удалена.
+    replication (ReplicationLog из license_replication.py) - такой же
+    слушатель: журнал изменений для фолловеров, его читает changes().
+
+    С flush_interval > 0 учет использований (use_count и last_used) сразу
+    меняет таблицу, а в журнал попадает пачкой: раз в flush_interval секунд
+    или когда в полосе накопилось flush_size // stripes лицензий. Повторные
+    использования одной лицензии между сбросами дают одну запись. Проверка
+    max_uses идет по таблице, поэтому остается точной; при сбое теряется
+    учет не больше чем за flush_interval секунд (плюс окно fsync журнала).
+    Активация и все изменения из админки пишутся в журнал сразу.
+
+    С cold (ColdStore) и evict_after > 0 лицензии, истекшие больше
+    evict_after секунд назад, раз в evict_interval секунд переносятся из
+    памяти в холодное хранилище. Проверка и просмотр таких лицензий
+    работают как раньше, а любое изменение из админки возвращает их в таблицу.
+    """
+
+    def __init__(self, log=None, seed=None, stripes=64, cold=None, evict_after=0, evict_interval=60,
+                 flush_interval=0, flush_size=10000, replication=None):
+        self._log = log or NullLog()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        # Лицензии с несброшенным учетом использований, по полосам (под блокировкой полосы)
+        self._dirty = [{} for _ in range(stripes)]
+        self._flush_interval = flush_interval
+        self._flush_threshold = max(1, flush_size // stripes)
+        self._flush_wanted = threading.Event()
+        self._records, seq = self._log.load()
+        self._index = LicenseIndex()
+        self._stats = LicenseStats(license_status)
+        self._feed = ChangeFeed()
+        self._search = SearchIndex()
+        # Индексы и счетчики подключаются к слушателям, когда построены (_build),
+        # лента изменений - пока открыта живая лента админки (watch)
+        self._listeners = []
+        self._watchers = 0
+        self._build_lock = threading.Lock()
+        # Изменения, сделанные во время построения (None - ничего не строится)
+        self._pending = None
+        self._replication = replication
+        if replication is not None:
+            self._listeners.append(replication)
+
+        self._cold = cold
+        self._evict_after = evict_after
+        self._expiry = ExpiryIndex()
+        self._stopped = threading.Event()
+        if cold is not None and evict_after > 0:
+            threading.Thread(target=self._evict_loop, args=(evict_interval,), name="license-evictor", daemon=True).start()
+        if flush_interval > 0 and not isinstance(self._log, NullLog):
+            threading.Thread(target=self._flush_loop, name="counter-flusher", daemon=True).start()
+            # Раньше закрытия журнала (atexit вызывает функции в обратном порядке)
+            atexit.register(self.close)
+
+        # Начальные лицензии записываем только в совсем новое хранилище
+        if seq == 0 and seed:
+            for hwid, license_data in seed.items():
+                self.add(hwid, license_data)
+
+    @property
+    def recovery_time(self):
+        return getattr(self._log, "recovery_time", 0.0)
+
+    def _stripe(self, hwid):
+        return hash(hwid) % len(self._stripes)
+
+    def _lock(self, hwid):
+        return self._stripes[self._stripe(hwid)]
+
+    @contextmanager
+    def _lock_all(self):
+        """Блокировка всей таблицы (полосы берутся всегда в одном порядке)"""
+        for lock in self._stripes:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self._stripes):
+                lock.release()
+
+    def __contains__(self, hwid):
+        return hwid in self._records or (self._cold is not None and hwid in self._cold)
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, hwid):
+        """Копия записи лицензии (в том числе выселенной) или None"""
+        with self._lock(hwid):
+            license_data = self._records.get(hwid)
+            if license_data is not None:
+                return license_data
+        return self._cold.get(hwid) if self._cold is not None else None
+
+    def _hot(self, hwid):
+        """Запись из таблицы; выселенная лицензия возвращается в таблицу (под блокировкой полосы)"""
+        license_data = self._records.get(hwid)
+        if license_data is None and self._cold is not None:
+            # Строка в холодном хранилище остается: таблица важнее, а после
+            # сбоя до записи журнала лицензия не потеряется
+            license_data = self._cold.get(hwid)
+            if license_data is not None:
+                self._records[hwid] = license_data
+                for listener in self._listeners:
+                    listener(hwid, None, license_data)
+        return license_data
+
+    def items(self):
+        """Согласованная копия всей таблицы в виде списка (hwid, запись)
+
+        Под блокировкой полос копируются только массивы таблицы (как в
+        _build), записи собираются из копии уже без блокировки - снимок для
+        фолловера не держит проверки на время обхода всей таблицы.
+        """
+        with self._lock_all():
+            records = self._records.copy()
+        return list(records.items())
+
+    def keys(self):
+        """Список всех HWID, в том числе выселенных в холодное хранилище"""
+        hwids = list(self._records)
+        if self._cold is None:
+            return hwids
+        # Возвращенная в таблицу лицензия остается и в холодном хранилище
+        return list(dict.fromkeys(hwids + self._cold.keys()))
+
+    def get_many(self, hwids):
+        """Копии записей для списка HWID, в том числе выселенных (удаленные пропускаются)"""
+        result = []
+        for hwid in hwids:
+            license_data = self.get(hwid)
+            if license_data is not None:
+                result.append((hwid, license_data))
+        return result
+
+    def add_listener(self, listener):
+        """Подписка на изменения лицензий (только внутри процесса хранилища)"""
+        self._listeners.append(listener)
+
+    def _put(self, hwid, old, license_data):
+        seq = self._log.append({"op": "put", "h": hwid, "d": license_data})
+        for listener in self._listeners:
+            listener(hwid, old, license_data)
+        return seq
+
+    def _count(self, hwid, old, license_data):
+        """Запись учета использования: таблица и слушатели сразу, журнал - при сбросе"""
+        self._records[hwid] = license_data
+        if not self._flush_interval:
+            return self._put(hwid, old, license_data)
+        for listener in self._listeners:
+            listener(hwid, old, license_data)
+        dirty = self._dirty[self._stripe(hwid)]
+        dirty[hwid] = None
+        if len(dirty) >= self._flush_threshold:
+            self._flush_wanted.set()
+        return 0
+
+    def flush(self):
+        """Запись накопленного учета использований в журнал, возвращает число лицензий
+
+        Полосы сбрасываются по очереди, по записи журнала на полосу: запись
+        делается под блокировкой полосы, поэтому не обгоняет изменения этих
+        лицензий из админки и не ждет остальные полосы.
+        """
+        flushed = 0
+        seq = 0
+        for stripe, lock in enumerate(self._stripes):
+            if not self._dirty[stripe]:
+                continue
+            with lock:
+                dirty = self._dirty[stripe]
+                self._dirty[stripe] = {}
+                staged = {}
+                for hwid in dirty:
+                    license_data = self._records.get(hwid)
+                    if license_data is not None:
+                        staged[hwid] = license_data
+                if staged:
+                    seq = self._log.append({"op": "batch", "d": staged})
+                    flushed += len(staged)
+        if seq:
+            self._commit(seq)
+        return flushed
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._flush_wanted.wait(self._flush_interval)
+            self._flush_wanted.clear()
+            self.flush()
+
+    def _commit(self, seq):
+        """Действия после операции, уже вне блокировки полосы"""
+        if self._log.should_compact():
+            with self._lock_all():
+                if self._log.should_compact():
+                    # Копия массивов, а не миллиона записей - таблица заблокирована недолго
+                    self._log.compact(self._records.copy(), self._log.last_seq())
+        self._log.wait(seq)
+
+    def add(self, hwid, license_data):
+        """Добавление лицензии; False, если такой HWID уже есть"""
+        with self._lock(hwid):
+            if hwid in self._records or (self._cold is not None and hwid in self._cold):
+                return False
+            license_data = {field: license_data[field] for field in FIELDS}
+            self._records[hwid] = license_data
+            seq = self._put(hwid, None, license_data)
+        self._commit(seq)
+        return True
+
+    def update(self, hwid, **fields):
+        """Изменение полей лицензии, возвращает копию записи или None"""
+        with self._lock(hwid):
+            license_data = self._hot(hwid)
+            if license_data is None:
+                return None
+            old = dict(license_data)
+            license_data.update(fields)
+            self._records[hwid] = license_data
+            seq = self._put(hwid, old, license_data)
+        self._commit(seq)
+        return license_data
+
+    def extend(self, hwid, seconds):
+        """Продление подписки на seconds секунд"""
+        with self._lock(hwid):
+            license_data = self._hot(hwid)
+            if license_data is None:
+                return None
+            old = dict(license_data)
+            license_data["subscription_duration"] += seconds
+            self._records[hwid] = license_data
+            seq = self._put(hwid, old, license_data)
+        self._commit(seq)
+        return license_data
+
+    def delete(self, hwid):
+        """Удаление лицензии; False, если ее не было"""
+        with self._lock(hwid):
+            old = self._records.pop(hwid, None)
+            evicted = self._cold is not None and self._cold.discard(hwid)
+            if old is None:
+                return evicted
+            seq = self._log.append({"op": "del", "h": hwid})
+            for listener in self._listeners:
+                listener(hwid, old, None)
+        self._commit(seq)
+        return True
+
+    def bulk(self, operations):
+        """Применение пакета операций одной транзакцией
+
+        operations - список (op, hwid, поля), op: add, put, update, extend, delete.
+        Возвращает список ошибок (номер операции, сообщение); если он не пуст,
+        таблица не меняется.
+        """
+        errors = []
+        with self._lock_all():
+            # Итоговое состояние затронутых лицензий (None - удалена)
+            staged = {}
+            for n, (op, hwid, fields) in enumerate(operations, 1):
+                if hwid in staged:
+                    current = staged[hwid]
+                else:
+                    current = self._records.get(hwid)
+                    if current is None and self._cold is not None:
+                        current = self._cold.get(hwid)
+                if op == "add":
+                    if current is not None:
+                        errors.append((n, f"Лицензия с HWID {hwid} уже существует"))
+                    else:
+                        staged[hwid] = {field: fields[field] for field in FIELDS}
+                elif op == "put":
+                    staged[hwid] = {field: fields[field] for field in FIELDS}
+                elif current is None:
+                    errors.append((n, f"Лицензия {hwid} не найдена"))
+                elif op == "delete":
+                    staged[hwid] = None
+                elif op == "extend":
+                    staged[hwid] = dict(current, subscription_duration=current["subscription_duration"] + fields["seconds"])
+                elif op == "update":
+                    staged[hwid] = dict(current, **fields)
+                else:
+                    errors.append((n, f"Неизвестная операция {op}"))
+
+            if errors or not staged:
+                return errors
+            seq = self._apply(staged)
+        self._commit(seq)
+        return errors
+
+    def _apply(self, staged):
+        # Запись пакета {hwid: запись или None} в журнал и таблицу (таблица заблокирована целиком)
+        seq = self._log.append({"op": "batch", "d": staged})
+        for hwid, license_data in staged.items():
+            if license_data is None:
+                old = self._records.pop(hwid, None)
+                if self._cold is not None:
+                    self._cold.discard(hwid)
+            else:
+                old = self._records.get(hwid)
+                self._records[hwid] = license_data
+            for listener in self._listeners:
+                listener(hwid, old, license_data)
+        return seq
+
+    def apply(self, changes):
+        """Запись готового состояния лицензий без проверок (репликация с лидера)
+
+        changes - {hwid: запись или None (удалена)}; применяется одной транзакцией.
+        """
+        if not changes:
+            return
+        staged = {hwid: {field: license_data[field] for field in FIELDS} if license_data is not None else None
+                  for hwid, license_data in changes.items()}
+        with self._lock_all():
+            seq = self._apply(staged)
+        self._commit(seq)
+
+    def changes(self, epoch, after, timeout=0):
+        """Изменения после after для фолловера (ReplicationLog.read) или None, если журнала репликации нет"""
+        if self._replication is None:
+            return None
+        return self._replication.read(epoch, after, timeout, self.items)
+
+    def replication_stats(self):
+        return self._replication.stats() if self._replication is not None else None
+
+    def watch(self, after=None):
+        """Подписка живой ленты админки: changed(after); по окончании - unwatch()
+
+        Лента изменений ведется, только пока есть подписчики, иначе ее
+        блокировка стояла бы на пути каждого учета использования.
+        """
+        with self._lock_all():
+            self._watchers += 1
+            if self._watchers == 1:
+                self._feed.reset()
+                self._listeners.append(self._feed)
+        return self.changed(after)
+
+    def unwatch(self):
+        with self._lock_all():
+            self._watchers -= 1
+            if self._watchers == 0:
+                self._listeners.remove(self._feed)
+
+    def changed(self, after, timeout=0, limit=1000):
+        """Живое обновление админки: (номер, {hwid: запись или None}) после номера after
+
+        Вместо записей None - изменений слишком много, страницу нужно перечитать.
+        """
+        seq, hwids = self._feed.read(after, timeout, limit)
+        if hwids is None:
+            return seq, None
+        return seq, {hwid: self.get(hwid) for hwid in hwids}
+
+    def _check_evicted(self, hwid, current_time):
+        # Выселяются только давно истекшие лицензии, поэтому проверка лишь формирует отказ
+        license_data = self._cold.get(hwid) if self._cold is not None else None
+        if license_data is None:
+            return False, "Лицензия не найдена"
+        is_valid, message, activate = check_license_data(license_data, current_time)
+        return False, message
+
+    def validate(self, hwid, current_time):
+        """Проверка лицензии (с активацией при первом использовании)"""
+        with self._lock(hwid):
+            license_data = self._records.get(hwid)
+            if license_data is None:
+                return self._check_evicted(hwid, current_time)
+            is_valid, message, activate = check_license_data(license_data, current_time)
+            if not activate:
+                return is_valid, message
+            old = dict(license_data)
+            license_data["created_at"] = current_time
+            self._records[hwid] = license_data
+            seq = self._put(hwid, old, license_data)
+        self._commit(seq)
+        return is_valid, message
+
+    def use(self, hwid, current_time):
+        """Проверка лицензии и учет использования одной атомарной операцией
+
+        Возвращает (валидна, сообщение, копия записи после учета).
+        """
+        with self._lock(hwid):
+            license_data = self._records.get(hwid)
+            if license_data is None:
+                return self._check_evicted(hwid, current_time) + (None,)
+            is_valid, message, activate = check_license_data(license_data, current_time)
+            if not is_valid:
+                return False, message, None
+            old = dict(license_data)
+            license_data["last_used"] = current_time
+            license_data["use_count"] += 1
+            if activate:
+                # Активация меняет срок действия и пишется в журнал сразу
+                license_data["created_at"] = current_time
+                self._records[hwid] = license_data
+                seq = self._put(hwid, old, license_data)
+            else:
+                seq = self._count(hwid, old, license_data)
+        self._commit(seq)
+        return True, message, license_data
+
+    def increment(self, hwid, current_time):
+        """Увеличение счетчика использований без проверки (выселенная лицензия возвращается в таблицу)"""
+        with self._lock(hwid):
+            license_data = self._hot(hwid)
+            if license_data is None:
+                return None
+            old = dict(license_data)
+            license_data["use_count"] += 1
+            license_data["last_used"] = current_time
+            seq = self._count(hwid, old, license_data)
+        self._commit(seq)
+        return license_data
+
+    def _defer(self, hwid, old, new):
+        # Слушатель на время построения: изменение применится к индексу, когда тот будет готов
+        self._pending.append((hwid, old, dict(new) if new is not None else None))
+
+    def _build(self, view, *args):
+        """Построение индекса или счетчиков при первом обращении
+
+        Строится по копии таблицы без блокировки полос, поэтому проверки в
+        это время не ждут. Изменения, сделанные во время построения, копятся
+        и применяются по порядку, после чего индекс подключается к слушателям.
+        """
+        if view in self._listeners:
+            return
+        with self._build_lock:
+            if view in self._listeners:
+                return
+            with self._lock_all():
+                # Копия массивов, а не миллиона записей - таблица заблокирована недолго
+                records = self._records.copy()
+                self._pending = deque()
+                self._listeners.append(self._defer)
+            try:
+                view.build(records, *args)
+                del records
+
+                # Накопленное применяем без блокировки, короткий остаток - под ней
+                while len(self._pending) > 100:
+                    for _ in range(len(self._pending)):
+                        view(*self._pending.popleft())
+                with self._lock_all():
+                    while self._pending:
+                        view(*self._pending.popleft())
+                    self._listeners.remove(self._defer)
+                    self._listeners.append(view)
+                    self._pending = None
+            except BaseException:
+                # Индекс не подключен: перестаем копить изменения, следующий вызов строит заново
+                with self._lock_all():
+                    if self._defer in self._listeners:
+                        self._listeners.remove(self._defer)
+                    self._pending = None
+                raise
+
+    def stats(self, current_time):
+        """Количество лицензий по статусам (поддерживается при изменениях, O(1))"""
+        self._build(self._stats, current_time)
+        return self._stats.snapshot(current_time)
+
+    def page(self, sort="hwid", descending=False, after=None, limit=50, status=None,
+             user_prefix=None, expiring_before=None, current_time=0, max_scan=None):
+        """Страница лицензий по вторичному индексу
+
+        after - курсор [значение, hwid] последней записи предыдущей страницы.
+        Фильтры: status (active, expired_time, expired_uses, not_activated или
+        expired - любая неактивная), user_prefix, expiring_before (активированные
+        с истечением раньше этого времени). Просматривается не больше max_scan
+        ключей, поэтому страница может оказаться неполной - тогда продолжать
+        нужно с возвращенного курсора. Возвращает (список (hwid, запись), курсор
+        или None, если дальше записей нет).
+        """
+        self._build(self._index)
+
+        key = tuple(after) if after else None
+        max_scan = max_scan or limit * 50
+
+        # Префикс имени и срок истечения сужают просматриваемый диапазон индекса
+        if key is None and sort == "user_name" and user_prefix:
+            key = (user_prefix + "\U0010ffff",) if descending else (user_prefix,)
+        if key is None and sort == "expires_at" and expiring_before:
+            key = (expiring_before,) if descending else (1,)
+        # Активные ("истекают скоро") - только со сроком позже текущего момента
+        if sort == "expires_at" and status == "active" and not descending:
+            key = max(key or (current_time + 1,), (current_time + 1,))
+
+        results = []
+        examined = 0
+        while examined < max_scan:
+            keys = self._index.scan(sort, key, min(500, max_scan - examined), descending)
+            if not keys:
+                return results, None
+            for index_key in keys:
+                value, hwid = index_key
+                examined += 1
+
+                # Дальше по индексу подходящих записей уже не будет
+                if sort == "user_name" and user_prefix and not value.startswith(user_prefix):
+                    return results, None
+                if sort == "expires_at" and expiring_before and not descending and value >= expiring_before:
+                    return results, None
+
+                key = index_key
+                license_data = self._records.get(hwid)
+                if license_data is None:
+                    continue
+
+                if user_prefix and not str(license_data["user_name"]).startswith(user_prefix):
+                    continue
+                if expiring_before and (license_data["created_at"] == 0 or
+                                        license_data["created_at"] + license_data["subscription_duration"] >= expiring_before):
+                    continue
+                if status:
+                    current_status = license_status(license_data, current_time)
+                    if current_status != status and not (status == "expired" and current_status != "active"):
+                        continue
+
+                results.append((hwid, license_data))
+                if len(results) == limit:
+                    return results, list(key)
+        return results, list(key) if key else None
+
+    def search(self, query, limit=50):
+        """Поиск лицензий для поддержки по части HWID или имени
+
+        HWID ищется по началу (как введено и в верхнем регистре), имя - по
+        словам: каждое слово запроса должно быть началом какого-то слова
+        имени, в любом порядке и регистре (оба индекса - SearchIndex).
+        Сначала идут совпадения по HWID, затем по имени.
+        Возвращает (список (hwid, запись) не длиннее limit, есть ли еще).
+        """
+        query = query.strip()
+        if not query:
+            return [], False
+        self._build(self._search)
+
+        found = {}
+        # Точное совпадение - в том числе выселенная в холодное хранилище лицензия
+        for hwid in dict.fromkeys((query, query.upper())):
+            license_data = self.get(hwid)
+            if license_data is not None:
+                found[hwid] = license_data
+        for prefix in dict.fromkeys((query, query.upper())):
+            for hwid in self._search.hwids(prefix, limit + 1):
+                license_data = self._records.get(hwid)
+                if license_data is not None:
+                    found.setdefault(hwid, license_data)
+
+        results = list(found.items())
+        more = len(results) > limit
+        if not more:
+            by_name, more = self._search.by_name(query, limit + 1, self._records.get)
+            results.extend((hwid, license_data) for hwid, license_data in by_name if hwid not in found)
+        return results[:limit], more or len(results) > limit
+
+    def evict(self, current_time, limit=10000):
+        """Перенос лицензий, истекших больше evict_after секунд назад, в холодное хранилище
+
+        Сначала записи с fsync попадают в холодное хранилище, затем удаляются
+        из таблицы через журнал; запись, изменившаяся между этими шагами,
+        остается в таблице. Возвращает количество выселенных лицензий.
+        """
+        if self._cold is None or self._evict_after <= 0:
+            return 0
+        self._build(self._expiry)
+
+        candidates = []
+        for expires_at, hwid in self._expiry.pop_due(current_time - self._evict_after, limit):
+            with self._lock(hwid):
+                license_data = self._records.get(hwid)
+                if license_data is not None and license_status(license_data, current_time) == "expired_time":
+                    candidates.append((hwid, license_data))
+        self._cold.put_many(candidates)
+
+        evicted = 0
+        seq = 0
+        for hwid, license_data in candidates:
+            with self._lock(hwid):
+                if self._records.get(hwid) != license_data:
+                    # Изменилась между шагами - возвращаем в очередь с текущим сроком
+                    if hwid in self._records:
+                        self._expiry(hwid, None, self._records[hwid])
+                    continue
+                del self._records[hwid]
+                seq = self._log.append({"op": "del", "h": hwid})
+                for listener in self._listeners:
+                    listener(hwid, license_data, None)
+                evicted += 1
+        if seq:
+            self._commit(seq)
+        return evicted
+
+    def _evict_loop(self, interval):
+        while not self._stopped.wait(interval):
+            self.evict(int(time.time()))
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._flush_wanted.set()
+        self.flush()
+        self._log.close()
+        if self._cold is not None:
+            self._cold.close()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Подписанные токены лицензий для проверки на стороне клиента
+
+Формат - компактный JWT (header.payload.signature в base64url), поэтому
+клиент может проверить токен любой JWT-библиотекой. В заголовке kid -
+идентификатор ключа, по нему при ротации находится нужный ключ.
+
+Алгоритмы:
+  HS256 - HMAC-SHA256 на общем секрете (только стандартная библиотека)
+  EdDSA - Ed25519: клиенту нужен только открытый ключ (/token_keys),
+          подделать токен с ним нельзя. Нужен пакет cryptography.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:
+    Ed25519PrivateKey = None
+
+
+class InvalidToken(ValueError):
+    """Токен не прошел проверку"""
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def b64decode(value):
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+class TokenKey:
+    """Ключ подписи токенов
+
+    not_after - момент, после которого токены этого ключа не принимаются
+    (окно ротации: старый ключ еще проверяет выданные им токены, но уже
+    ничего не подписывает).
+    """
+
+    def __init__(self, kid, alg="HS256", secret=None, private_key=None, public_key=None, not_after=None):
+        self.kid = kid
+        self.alg = alg
+        self.not_after = not_after
+        self._private = None
+
+        if alg == "HS256":
+            if not secret:
+                raise ValueError(f"Ключу {kid} нужен secret")
+            # Состояние HMAC после ключа считается один раз, на токен - только copy()
+            self._hmac = hmac.new(secret.encode() if isinstance(secret, str) else secret, digestmod=hashlib.sha256)
+        elif alg == "EdDSA":
+            if Ed25519PrivateKey is None:
+                raise ValueError("Для EdDSA нужен пакет cryptography: pip install cryptography")
+            if private_key:
+                self._private = Ed25519PrivateKey.from_private_bytes(b64decode(private_key))
+                self._public = self._private.public_key()
+            elif public_key:
+                self._public = Ed25519PublicKey.from_public_bytes(b64decode(public_key))
+            else:
+                raise ValueError(f"Ключу {kid} нужен private_key или public_key")
+        else:
+            raise ValueError(f"Неизвестный алгоритм {alg}")
+
+    @property
+    def can_sign(self):
+        return self.alg == "HS256" or self._private is not None
+
+    def sign(self, message):
+        if self.alg == "HS256":
+            mac = self._hmac.copy()
+            mac.update(message)
+            return mac.digest()
+        return self._private.sign(message)
+
+    def verify(self, message, signature):
+        if self.alg == "HS256":
+            return hmac.compare_digest(self.sign(message), signature)
+        try:
+            self._public.verify(signature, message)
+            return True
+        except InvalidSignature:
+            return False
+
+    def jwk(self):
+        """Открытый ключ в формате JWK (у HMAC-ключей открытой части нет)"""
+        if self.alg != "EdDSA":
+            return None
+        jwk = {"kty": "OKP", "crv": "Ed25519", "alg": "EdDSA", "kid": self.kid,
+               "x": b64encode(self._public.public_bytes(Encoding.Raw, PublicFormat.Raw))}
+        if self.not_after is not None:
+            jwk["not_after"] = self.not_after
+        return jwk
+
+
+def load_keys(spec, default_secret):
+    """Ключи из JSON-списка (LICENSE_TOKEN_KEYS); первый в списке подписывает новые токены
+
+    Элемент: {"kid": ..., "alg": "HS256" | "EdDSA", "secret" | "private_key" |
+    "public_key": ..., "not_after": unix-время}. Без настройки - один
+    HS256-ключ "default" на default_secret.
+    """
+    if not spec:
+        return [TokenKey("default", "HS256", secret=default_secret)]
+    return [TokenKey(**entry) for entry in json.loads(spec)]
+
+
+class TokenSigner:
+    """Выдача и проверка токенов набором ключей"""
+
+    def __init__(self, keys):
+        if not keys or not keys[0].can_sign:
+            raise ValueError("Первый ключ должен уметь подписывать")
+        self.active = keys[0]
+        self.keys = {key.kid: key for key in keys}
+        self._header = b64encode(json.dumps({"alg": self.active.alg, "kid": self.active.kid, "typ": "JWT"},
+                                            separators=(",", ":")).encode())
+
+    def issue(self, claims):
+        """Подписанный токен с данными claims"""
+        payload = b64encode(json.dumps(claims, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode())
+        signing_input = f"{self._header}.{payload}"
+        return f"{signing_input}.{b64encode(self.active.sign(signing_input.encode()))}"
+
+    def verify(self, token, current_time):
+        """Данные токена; InvalidToken, если подпись, ключ или срок не подходят"""
+        return verify_token(token, self.keys, current_time)
+
+    def jwks(self):
+        """Открытые ключи для офлайн-проверки (/token_keys)"""
+        return {"keys": [jwk for jwk in (key.jwk() for key in self.keys.values()) if jwk]}
+
+
+def verify_token(token, keys, current_time):
+    """Проверка токена по словарю kid -> TokenKey (годится и для клиента)"""
+    try:
+        header_part, payload_part, signature_part = token.split(".")
+        header = json.loads(b64decode(header_part))
+        signature = b64decode(signature_part)
+    except (ValueError, AttributeError):
+        raise InvalidToken("Некорректный токен")
+
+    key = keys.get(header.get("kid"))
+    # Алгоритм берется из ключа, а не из заголовка: иначе токен мог бы выбрать его сам
+    if key is None or header.get("alg") != key.alg:
+        raise InvalidToken("Неизвестный ключ")
+    if key.not_after is not None and current_time > key.not_after:
+        raise InvalidToken("Ключ выведен из обращения")
+    if not key.verify(f"{header_part}.{payload_part}".encode(), signature):
+        raise InvalidToken("Неверная подпись")
+
+    claims = json.loads(b64decode(payload_part))
+    if current_time >= claims["exp"]:
+        raise InvalidToken("Токен истек")
+    return claims
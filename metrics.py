@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Метрики в текстовом формате Prometheus без внешних зависимостей
+
+Запись идет без блокировок: у каждого потока свой шард (словарь меток ->
+значения), блокировка берется только при первой записи из нового потока
+и при выгрузке. Шарды завершившихся потоков сворачиваются в общий итог,
+поэтому поток на запрос (werkzeug) не раздувает память.
+
+Метрики нескольких процессов (воркеры pre-fork режима) собираются в
+MetricsHub мастера: каждый процесс присылает snapshot() своих метрик, а
+render() выгружает значения всех процессов с меткой worker.
+"""
+
+import os
+import threading
+from bisect import bisect_left
+
+# Границы гистограммы задержек по умолчанию, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """Общая часть счетчика и гистограммы: потоковые шарды и их свертка"""
+
+    TYPE = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._merged = {}
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._lock:
+                self._fold_dead()
+                self._shards.append((threading.current_thread(), shard))
+            self._local.shard = shard
+            return shard
+
+    def _fold(self, shard):
+        for labels, row in list(shard.items()):
+            merged = self._merged.get(labels)
+            if merged is None:
+                self._merged[labels] = list(row)
+            else:
+                for i, value in enumerate(row):
+                    merged[i] += value
+
+    def _fold_dead(self):
+        # Вызывается под self._lock
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._fold(shard)
+        self._shards = alive
+
+    def collect(self):
+        """Сумма по всем потокам: метки -> значения"""
+        with self._lock:
+            self._fold_dead()
+            totals = {labels: list(row) for labels, row in self._merged.items()}
+            shards = [shard for thread, shard in self._shards]
+        for shard in shards:
+            # list() над словарем и строкой выполняется целиком под GIL
+            for labels, row in list(shard.items()):
+                row = list(row)
+                total = totals.get(labels)
+                if total is None:
+                    totals[labels] = row
+                else:
+                    for i, value in enumerate(row):
+                        total[i] += value
+        return totals
+
+    def values(self):
+        """Значения для snapshot(): [(метки, значения)]"""
+        return sorted(self.collect().items())
+
+    def samples(self, values, worker=None):
+        """Строки значений; worker - номер процесса для метки worker"""
+        names = self.labelnames + ("worker",) if worker is not None else self.labelnames
+        lines = []
+        for labels, row in values:
+            lines.extend(self._render_row(names, labels + (worker,) if worker is not None else labels, row))
+        return lines
+
+
+class Counter(_Sharded):
+    """Счетчик событий с метками"""
+
+    TYPE = "counter"
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            shard[labels] = [amount]
+        else:
+            row[0] += amount
+
+    def _render_row(self, names, labels, row):
+        return [f"{self.name}{_labels(names, labels)} {_number(row[0])}"]
+
+
+class Histogram(_Sharded):
+    """Гистограмма (по умолчанию - задержек в секундах) с метками"""
+
+    TYPE = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            # Счетчики по корзинам (последняя - +Inf), затем сумма
+            row = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def _render_row(self, names, labels, row):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), row[:-1]):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_labels(names + ('le',), labels + (bound,))} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(names, labels)} {_number(row[-1])}")
+        lines.append(f"{self.name}_count{_labels(names, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Значение, которое считается в момент выгрузки: callback() -> [(метки, значение)]"""
+
+    TYPE = "gauge"
+
+    def __init__(self, name, help, labelnames=(), callback=None, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        # Накопительные значения из других модулей (отказы лимитов) выгружаются как counter
+        self.TYPE = kind
+
+    def values(self):
+        """Значения для snapshot(): [(метки, значение)]"""
+        return [(labels, value) for labels, value in self.callback() if value is not None]
+
+    def samples(self, values, worker=None):
+        """Строки значений; worker - номер процесса для метки worker"""
+        names = self.labelnames + ("worker",) if worker is not None else self.labelnames
+        return [f"{self.name}{_labels(names, labels + (worker,) if worker is not None else labels)} {_number(value)}"
+                for labels, value in values]
+
+
+def snapshot(metrics):
+    """Текущие значения метрик процесса (для MetricsHub): {имя: [(метки, значения)]}"""
+    return {metric.name: metric.values() for metric in metrics}
+
+
+def render(metrics, workers=None):
+    """Текст для /metrics
+
+    workers - {номер: snapshot(metrics)} процессов из MetricsHub.collect():
+    значения каждого выгружаются с меткой worker. Без workers - значения
+    этого процесса.
+    """
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+        if workers is None:
+            lines.extend(metric.samples(metric.values()))
+        else:
+            for worker, values in sorted(workers.items()):
+                lines.extend(metric.samples(values.get(metric.name, []), worker))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHub:
+    """Метрики воркеров pre-fork режима в мастер-процессе
+
+    Воркер присылает snapshot() своих метрик раз в несколько секунд и при
+    выгрузке, поэтому /metrics любого воркера отдает счетчики всех. Номер
+    воркера (метка worker) сохраняется при перезапуске: счетчики нового
+    процесса начинаются с нуля, и Prometheus видит обычный сброс счетчика.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}
+
+    def publish(self, worker, values):
+        with self._lock:
+            self._workers[worker] = values
+
+    def collect(self):
+        """{номер воркера: snapshot() его метрик}"""
+        with self._lock:
+            return dict(self._workers)
+
+
+def resident_memory():
+    """Резидентная память процесса в байтах (None, если /proc недоступен)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
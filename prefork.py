@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+from werkzeug.serving import make_server
+
+from metrics import MetricsHub
+
+
+class LicenseManager(BaseManager):
+    """Доступ воркеров к общему хранилищу лицензий мастер-процесса"""
+
+
+def _exposed_methods(store):
+    # Все публичные методы хранилища (LicenseStore или SqliteLicenseStore) плюс операторы in и len()
+    cls = type(store)
+    names = [name for name in dir(cls) if not name.startswith("_") and callable(getattr(cls, name))]
+    return tuple(names) + ("__contains__", "__len__")
+
+
+def serve_prefork(app, store, host, port, workers, set_store, set_metrics=None):
+    """Pre-fork сервер: мастер держит хранилище, воркеры обрабатывают запросы
+
+    Мастер-процесс владеет LicenseStore (и его журналом) и раздает его
+    воркерам через multiprocessing-менеджер на unix-сокете. Воркеры
+    наследуют общий слушающий сокет и работают с хранилищем через прокси,
+    поэтому use_count и время активации согласованы между процессами.
+    set_store(proxy, invalidations) подменяет хранилище приложения в
+    воркере; invalidations - счетчик в разделяемой памяти
+    (multiprocessing.Value), через который изменение из админки в одном
+    воркере сбрасывает кэши лицензий остальных. set_metrics(hub, номер
+    воркера) подключает его к MetricsHub мастера (номер от 0 до
+    workers - 1, перезапущенный воркер получает номер упавшего).
+    """
+    authkey = os.urandom(16)
+    address = os.path.join(tempfile.mkdtemp(prefix="license-server-"), "licenses.sock")
+    hub = MetricsHub()
+    # Создается до fork, поэтому у всех воркеров одна и та же память
+    invalidations = multiprocessing.Value("Q", 0)
+
+    LicenseManager.register("licenses", callable=lambda: store, exposed=_exposed_methods(store))
+    LicenseManager.register("metrics", callable=lambda: hub, exposed=("publish", "collect"))
+    state_server = LicenseManager(address=address, authkey=authkey).get_server()
+    threading.Thread(target=state_server.serve_forever, name="license-state", daemon=True).start()
+
+    listener = socket.create_server((host, port), backlog=1024)
+    listener.set_inheritable(True)
+
+    def run_worker(slot):
+        manager = LicenseManager(address=address, authkey=authkey)
+        manager.connect()
+        set_store(manager.licenses(), invalidations)
+        if set_metrics is not None:
+            set_metrics(manager.metrics(), slot)
+
+        server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+        signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+        signal.signal(signal.SIGINT, lambda signum, frame: os._exit(0))
+        server.serve_forever()
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            # В воркере не выполняем atexit мастера (журнал принадлежит мастеру)
+            try:
+                run_worker(slot)
+            finally:
+                os._exit(1)
+        return pid
+
+    # pid -> номер воркера
+    children = {spawn(slot): slot for slot in range(workers)}
+    print(f"👷 Pre-fork mode: {workers} workers, shared license state in PID {os.getpid()}")
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Перезапускаем упавшие воркеры, пока мастер не получит сигнал остановки
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in children:
+            slot = children.pop(pid)
+            print(f"⚠️ Worker {pid} exited with status {status}, restarting")
+            children[spawn(slot)] = slot
+        else:
+            time.sleep(0.2)
+
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+    store.close()
+    sys.exit(0)
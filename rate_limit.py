@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+
+
+def client_ip(remote_addr, forwarded_for, trusted_proxies):
+    """Адрес клиента: за trusted_proxies прокси берем адрес, который добавил ближайший к нам прокси"""
+    if trusted_proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return remote_addr
+
+
+def request_start_delay(header, current_time):
+    """Время в очереди по заголовку X-Request-Start прокси ("t=<время>" в с, мс или мкс)"""
+    if not header:
+        return None
+    try:
+        started = float(header[2:] if header.startswith("t=") else header)
+    except ValueError:
+        return None
+    # Единицы определяем по порядку величины
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, current_time - started)
+
+
+class TokenBuckets:
+    """Корзины токенов по ключу (IP или HWID) в таблице ограниченного размера
+
+    В каждой корзине до burst токенов, пополнение - rate в секунду, запрос
+    тратит один токен. Когда таблица заполнена, вытесняется ключ, к которому
+    дольше всего не обращались (LRU), поэтому память не растет при переборе
+    адресов или HWID.
+    """
+
+    def __init__(self, rate, burst, max_entries=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_entries = max_entries
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, key, now):
+        """0, если запрос укладывается в лимит, иначе сколько секунд ждать токена"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_entries:
+                    self._buckets.popitem(last=False)
+                self._buckets[key] = [self.burst - 1, now]
+                return 0
+
+            self._buckets.move_to_end(key)
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            self.rejected += 1
+            return (1 - tokens) / self.rate
+
+    def stats(self):
+        return {"rate": self.rate, "burst": self.burst, "tracked": len(self._buckets), "rejected": self.rejected}
+
+
+class LoadShedder:
+    """Сброс нагрузки: отказ сразу, пока запросы слишком долго ждут в очереди
+
+    Задержка в очереди сглаживается (EWMA) по замерам observe(): заголовок
+    X-Request-Start прокси или отставание цикла событий в ASGI-режиме.
+    max_inflight дополнительно ограничивает число одновременно
+    обрабатываемых запросов (0 - без ограничения).
+    """
+
+    def __init__(self, max_queue_delay, max_inflight=0, smoothing=0.2):
+        self.max_queue_delay = max_queue_delay
+        self.max_inflight = max_inflight
+        self.smoothing = smoothing
+        self.queue_delay = 0.0
+        self.inflight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def observe(self, delay):
+        with self._lock:
+            self.queue_delay += (delay - self.queue_delay) * self.smoothing
+
+    def enter(self):
+        """True - запрос принят (потом обязательно leave()), False - отказ"""
+        with self._lock:
+            if (self.max_queue_delay and self.queue_delay > self.max_queue_delay) or \
+                    (self.max_inflight and self.inflight >= self.max_inflight):
+                self.shed += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def stats(self):
+        return {"queue_delay_ms": round(self.queue_delay * 1000, 1), "inflight": self.inflight, "shed": self.shed}
@@ -0,0 +1,299 @@
+// Ключ - из адреса страницы (/admin/licenses?key=...): файл отдается без ключа и кэшируется
+const ADMIN_KEY = new URLSearchParams(location.search).get('key');
+const PAGE_SIZE = 100;
+let nextCursor = null;
+let loadedPages = 1;
+// Показанные строки: hwid -> {license, receivedAt} (для живого обновления и отсчета времени)
+let shown = new Map();
+let liveUpdates = false;
+let pollTimer = null;
+
+function escapeHtml(value) {
+    return String(value).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'})[c]);
+}
+
+function formatDate(timestamp) {
+    const d = new Date(timestamp * 1000);
+    const pad = n => String(n).padStart(2, '0');
+    return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())} ${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`;
+}
+
+function renderRow(license) {
+    const activated = license.created_at > 0;
+    let timeRemaining = 'Не активирована';
+    let timeClass = 'time-expired';
+    if (activated && license.remaining_time > 0) {
+        const minutes = Math.floor(license.remaining_time / 60);
+        const seconds = license.remaining_time % 60;
+        timeRemaining = minutes > 0 ? `${minutes}м ${seconds}с` : `${seconds}с`;
+        timeClass = license.remaining_time < 60 ? 'time-warning' : 'time-active';
+    } else if (activated) {
+        timeRemaining = 'Истекла';
+    }
+    const statuses = {
+        active: 'Активна',
+        expired_time: 'Истекла по времени',
+        expired_uses: 'Истекла по использованию',
+        not_activated: 'Не активирована'
+    };
+    const statusClass = license.status === 'active' ? 'status-active' : 'status-expired';
+    const hwid = escapeHtml(license.hwid);
+    const hwidArg = escapeHtml(JSON.stringify(license.hwid));
+    return `
+        <tr data-hwid="${hwid}">
+            <td><div class="hwid-cell">${hwid}</div></td>
+            <td>${escapeHtml(license.user_name)}</td>
+            <td>${activated ? formatDate(license.created_at) : 'Не активирована'}</td>
+            <td>${activated ? formatDate(license.expires_at) : 'Не активирована'}</td>
+            <td>${license.last_used > 0 ? formatDate(license.last_used) : 'Никогда'}</td>
+            <td>${license.use_count}/${license.max_uses}</td>
+            <td><div class="time-remaining ${timeClass}">${timeRemaining}</div></td>
+            <td class="${statusClass}">${statuses[license.status]}</td>
+            <td>
+                <button class="btn-reset" onclick="resetLicense(${hwidArg})">🔄 Сбросить</button>
+                <button class="btn-extend" onclick="extendLicense(${hwidArg})">⏰ Продлить</button>
+                <button class="btn-edit" onclick="editMaxUses(${hwidArg}, ${license.max_uses})">✏️ Max Uses</button>
+                <button class="btn-delete" onclick="deleteLicense(${hwidArg})">🗑️ Удалить</button>
+            </td>
+        </tr>
+    `;
+}
+
+function listUrl(cursor, limit) {
+    // Поиск заменяет фильтры: результаты одной страницей без курсора
+    const search = document.getElementById('filter_search').value.trim();
+    if (search) {
+        return '/admin/search?' + new URLSearchParams({key: ADMIN_KEY, q: search, limit: limit}).toString();
+    }
+    const params = new URLSearchParams({
+        key: ADMIN_KEY,
+        limit: limit,
+        sort: document.getElementById('filter_sort').value,
+        order: document.getElementById('filter_order').value
+    });
+    const status = document.getElementById('filter_status').value;
+    const user = document.getElementById('filter_user').value;
+    const expiring = document.getElementById('filter_expiring').value;
+    if (status) params.set('status', status);
+    if (user) params.set('user_prefix', user);
+    if (expiring) params.set('expiring_before', Math.floor(new Date(expiring).getTime() / 1000));
+    if (cursor) params.set('cursor', cursor);
+    return '/admin/api/licenses?' + params.toString();
+}
+
+function loadPage(cursor, limit, replace) {
+    return fetch(listUrl(cursor, limit))
+        .then(response => response.json())
+        .then(data => {
+            const body = document.getElementById('licenses-body');
+            const rows = data.licenses.map(renderRow).join('');
+            const receivedAt = Date.now();
+            if (replace) {
+                shown = new Map();
+            }
+            data.licenses.forEach(license => shown.set(license.hwid, {license, receivedAt}));
+            if (replace) {
+                body.innerHTML = rows;
+            } else {
+                body.insertAdjacentHTML('beforeend', rows);
+            }
+            nextCursor = data.next_cursor;
+            document.getElementById('load-more').style.display = nextCursor ? '' : 'none';
+        })
+        .catch(error => alert('Ошибка: ' + error));
+}
+
+function applyFilters() {
+    loadedPages = 1;
+    loadPage(null, PAGE_SIZE, true);
+}
+
+// Активные лицензии по сроку истечения в ближайшие days дней
+function expiringSoon(days) {
+    const until = new Date(Date.now() + days * 86400000);
+    until.setMinutes(until.getMinutes() - until.getTimezoneOffset());
+    document.getElementById('filter_search').value = '';
+    document.getElementById('filter_sort').value = 'expires_at';
+    document.getElementById('filter_order').value = 'asc';
+    document.getElementById('filter_status').value = 'active';
+    document.getElementById('filter_expiring').value = until.toISOString().slice(0, 16);
+    applyFilters();
+}
+
+function loadMore() {
+    if (nextCursor) {
+        loadedPages += 1;
+        loadPage(nextCursor, PAGE_SIZE, false);
+    }
+}
+
+function rowElement(hwid) {
+    return document.querySelector(`#licenses-body tr[data-hwid="${CSS.escape(hwid)}"]`);
+}
+
+// Измененные строки с сервера: обновляются только уже показанные
+function applyChanges(rows) {
+    const receivedAt = Date.now();
+    for (const [hwid, license] of Object.entries(rows)) {
+        const row = shown.has(hwid) ? rowElement(hwid) : null;
+        if (!row) continue;
+        if (license === null) {
+            shown.delete(hwid);
+            row.remove();
+        } else {
+            shown.set(hwid, {license, receivedAt});
+            row.outerHTML = renderRow(license);
+        }
+    }
+}
+
+// Отсчет оставшегося времени и истечение по времени - без запросов к серверу
+function tick() {
+    const now = Date.now();
+    shown.forEach(({license, receivedAt}, hwid) => {
+        if (license.status !== 'active') return;
+        const remaining = Math.max(0, license.remaining_time - Math.floor((now - receivedAt) / 1000));
+        const row = rowElement(hwid);
+        if (row) {
+            row.outerHTML = renderRow(Object.assign({}, license, {
+                remaining_time: remaining,
+                status: remaining > 0 ? 'active' : 'expired_time'
+            }));
+        }
+    });
+}
+
+function showStats(stats) {
+    document.getElementById('total-licenses').textContent = stats.total;
+    document.getElementById('active-licenses').textContent = stats.active;
+    document.getElementById('expired-licenses').textContent = stats.expired;
+}
+
+// Статистика для карточек (счетчики поддерживаются сервером)
+function loadStats() {
+    fetch('/admin/stats?key=' + ADMIN_KEY)
+    .then(response => response.json())
+    .then(showStats);
+}
+
+// Перезагружаем только уже показанные строки, а не всю страницу
+function refresh() {
+    loadStats();
+    loadPage(null, PAGE_SIZE * loadedPages, true);
+}
+
+// Измененную строку пришлет сервер; новая лицензия (reload) требует перечитать страницу
+function adminAction(path, body, reload) {
+    fetch(path + '?key=' + ADMIN_KEY, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    })
+    .then(response => response.json())
+    .then(data => {
+        alert(data.message);
+        if (reload || !liveUpdates) refresh();
+    })
+    .catch(error => alert('Ошибка: ' + error));
+}
+
+function addLicense() {
+    const hwid = document.getElementById('new_hwid').value;
+    const username = document.getElementById('new_username').value;
+    const duration = document.getElementById('new_duration').value;
+    const maxUses = document.getElementById('new_max_uses').value;
+
+    if (!hwid || !username) {
+        alert('Пожалуйста, заполните HWID и имя пользователя');
+        return;
+    }
+
+    adminAction('/admin/add_license', {
+        hwid: hwid,
+        username: username,
+        duration: parseInt(duration),
+        max_uses: parseInt(maxUses)
+    }, true);
+}
+
+function importLicenses() {
+    const file = document.getElementById('bulk_file').files[0];
+    if (!file) {
+        alert('Пожалуйста, выберите файл');
+        return;
+    }
+    const format = file.name.endsWith('.csv') ? 'csv' : 'ndjson';
+
+    fetch('/admin/bulk?key=' + ADMIN_KEY + '&format=' + format, {
+        method: 'POST',
+        headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson' },
+        body: file
+    })
+    .then(response => response.json())
+    .then(data => {
+        const errors = (data.errors || []).map(e => `Строка ${e.line}: ${e.message}`).join('\n');
+        alert(data.message + (errors ? '\n\n' + errors : ''));
+        refresh();
+    })
+    .catch(error => alert('Ошибка: ' + error));
+}
+
+function exportLicenses(format) {
+    location.href = '/admin/export?key=' + ADMIN_KEY + '&format=' + format;
+}
+
+function resetLicense(hwid) {
+    if (confirm('Сбросить эту лицензию? Это обнулит счетчик использований и время создания.')) {
+        adminAction('/admin/reset_license', {hwid: hwid});
+    }
+}
+
+function extendLicense(hwid) {
+    const duration = prompt('Продлить лицензию на сколько времени?\n\nПримеры:\n• 5 (минуты)\n• 60 (1 час)\n• 480 (8 часов)\n• 1440 (24 часа)\n• 10080 (7 дней)\n• 43200 (30 дней)\n• 999999 (навсегда)\n\nВведите время в минутах:', '5');
+    if (duration && !isNaN(duration)) {
+        adminAction('/admin/extend_license', {hwid: hwid, minutes: parseInt(duration)});
+    }
+}
+
+function deleteLicense(hwid) {
+    if (confirm('Вы уверены, что хотите УДАЛИТЬ эту лицензию? Это действие нельзя отменить!')) {
+        adminAction('/admin/delete_license', {hwid: hwid});
+    }
+}
+
+function editMaxUses(hwid, currentMaxUses) {
+    const newMaxUses = prompt(`Изменить максимальное количество использований для ${hwid}:\n\nТекущее значение: ${currentMaxUses}\n\nВведите новое значение (1-1000):`, currentMaxUses);
+
+    if (newMaxUses && !isNaN(newMaxUses) && newMaxUses >= 1 && newMaxUses <= 1000) {
+        adminAction('/admin/edit_max_uses', {hwid: hwid, max_uses: parseInt(newMaxUses)});
+    } else if (newMaxUses !== null) {
+        alert('Пожалуйста, введите корректное значение от 1 до 1000');
+    }
+}
+
+// Без живого обновления - перечитывание показанных строк каждые 30 секунд
+function startPolling() {
+    if (!pollTimer) pollTimer = setInterval(refresh, 30000);
+}
+
+function connectEvents() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    const events = new EventSource('/admin/events?key=' + ADMIN_KEY);
+    events.onopen = () => { liveUpdates = true; };
+    events.addEventListener('licenses', event => applyChanges(JSON.parse(event.data)));
+    events.addEventListener('stats', event => showStats(JSON.parse(event.data)));
+    events.addEventListener('reload', () => refresh());
+    events.onerror = () => {
+        liveUpdates = false;
+        // Ответ не 200 (хранилище без ленты изменений) - EventSource не переподключается
+        if (events.readyState === EventSource.CLOSED) startPolling();
+    };
+}
+
+loadStats();
+applyFilters();
+connectEvents();
+setInterval(tick, 1000);
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Отчет по журналу аудита: запуски по часам и по лицензиям, общие HWID
+
+Файлы журнала (license_audit.py) читаются потоком, по одному и кусками,
+поэтому память зависит от числа часов и различных HWID, а не от объема
+журнала. Запуск - успешная проверка (valid или activated) на
+/check_license, /check_license/batch или /check_license/token.
+
+  by_hour - события, запуски и результаты по часам
+  top     - лицензии с наибольшим числом запусков (--top)
+  users   - запуски по пользователям (имена из снапшота --data-dir)
+  sharing - HWID, запускавшиеся с --sharing-ips и более разных IP
+
+Пример: python tools/audit_report.py data/audit --since "2026-10-01 00:00" --top 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from license_audit import audit_files, read_events
+from license_store import load_snapshot
+
+LAUNCH_ENDPOINTS = {"check_license", "check_license_batch", "check_license_token"}
+LAUNCH_RESULTS = {"valid", "activated"}
+# Сколько разных IP помнить на HWID (больше для отчета не нужно)
+IP_LIMIT = 64
+
+
+def parse_time(value):
+    """Unix-время или "ГГГГ-ММ-ДД ЧЧ:ММ" (местное время) -> миллисекунды"""
+    if value is None:
+        return None
+    try:
+        return int(float(value) * 1000)
+    except ValueError:
+        return int(datetime.strptime(value, "%Y-%m-%d %H:%M").timestamp() * 1000)
+
+
+def user_names(data_dir):
+    """HWID -> имя пользователя по снапшоту хранилища (двоичному или JSON)"""
+    table, _ = load_snapshot(data_dir)
+    columns = table.columns()
+    return dict(zip(columns["hwid"], columns["user_name"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", default=["data/audit"], help="Файлы или каталоги журнала")
+    parser.add_argument("--since", help="С какого времени (unix или \"ГГГГ-ММ-ДД ЧЧ:ММ\")")
+    parser.add_argument("--until", help="До какого времени (не включая)")
+    parser.add_argument("--top", type=int, default=20, help="Лицензий в списке top")
+    parser.add_argument("--sharing-ips", type=int, default=3, help="Порог разных IP для списка sharing")
+    parser.add_argument("--data-dir", help="Каталог хранилища: имена пользователей для отчета users")
+    args = parser.parse_args()
+
+    since, until = parse_time(args.since), parse_time(args.until)
+    started = time.perf_counter()
+    files = audit_files(args.paths)
+
+    events = 0
+    by_hour = defaultdict(Counter)
+    launches = Counter()
+    ips = defaultdict(set)
+    last_seen = {}
+    for path in files:
+        for timestamp, hwid, endpoint, status, result, ip in read_events(path):
+            if since is not None and timestamp < since or until is not None and timestamp >= until:
+                continue
+            events += 1
+            hour = by_hour[timestamp // 3600000]
+            hour["events"] += 1
+            hour[result] += 1
+            if endpoint not in LAUNCH_ENDPOINTS or result not in LAUNCH_RESULTS:
+                continue
+            hour["launches"] += 1
+            launches[hwid] += 1
+            last_seen[hwid] = max(last_seen.get(hwid, 0), timestamp)
+            seen = ips[hwid]
+            if len(seen) < IP_LIMIT:
+                seen.add(ip)
+
+    def readable(timestamp_ms):
+        return datetime.fromtimestamp(timestamp_ms / 1000).strftime("%Y-%m-%d %H:%M:%S")
+
+    report = {
+        "files": len(files),
+        "events": events,
+        "by_hour": {datetime.fromtimestamp(hour * 3600).strftime("%Y-%m-%d %H:00"): dict(counts)
+                    for hour, counts in sorted(by_hour.items())},
+        "top": [{"hwid": hwid, "launches": count, "ips": len(ips[hwid]), "last_seen": readable(last_seen[hwid])}
+                for hwid, count in launches.most_common(args.top)],
+        "sharing": sorted(({"hwid": hwid, "ips": len(seen), "launches": launches[hwid]}
+                           for hwid, seen in ips.items() if len(seen) >= args.sharing_ips),
+                          key=lambda row: (-row["ips"], -row["launches"])),
+    }
+    if args.data_dir:
+        names = user_names(args.data_dir)
+        users = Counter()
+        for hwid, count in launches.items():
+            users[names.get(hwid, "?")] += count
+        report["users"] = dict(users.most_common())
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
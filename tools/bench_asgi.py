@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Сравнение Flask- и ASGI-вариантов сервера при большом числе медленных клиентов
+
+Держит --idle открытых соединений, которые "медленно" шлют заголовки, и
+параллельно гоняет --concurrency активных клиентов по /check_license.
+
+Пример: python tools/bench_asgi.py --idle 5000 --concurrency 50 --seconds 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ADMIN_KEY = "FloraVisuals2024_Admin_Key_7x9K2mP8qR5"
+HWID = "BENCH0000000001"
+SERVERS = {"flask": "license_server.py", "asgi": "asgi_server.py"}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def http_request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return int(data[9:12])
+
+
+async def idle_client(port, stop):
+    """Медленный клиент: начинает запрос и держит соединение"""
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /check_license HTTP/1.1\r\nHost: localhost\r\n")
+        await writer.drain()
+        while not stop.is_set():
+            await asyncio.sleep(1)
+            writer.write(b"X-Slow: 1\r\n")
+            await writer.drain()
+        writer.close()
+        return True
+    except OSError:
+        return False
+
+
+async def active_client(port, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(http_request(port, "POST", "/check_license", {"hwid": HWID}), 10)
+        except (OSError, asyncio.TimeoutError):
+            errors.append(1)
+            continue
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(status)
+
+
+async def measure(port, idle, concurrency, seconds):
+    await http_request(port, "POST", f"/admin/add_license?key={ADMIN_KEY}", {
+        "hwid": HWID, "username": "bench", "duration": 999999999, "max_uses": 10 ** 12
+    })
+
+    stop = asyncio.Event()
+    idle_tasks = [asyncio.create_task(idle_client(port, stop)) for _ in range(idle)]
+    await asyncio.sleep(2)
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(active_client(port, deadline, latencies, errors) for _ in range(concurrency)))
+
+    stop.set()
+    held = sum(await asyncio.gather(*idle_tasks))
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        "idle_connections_held": held,
+        "requests_per_second": round(len(latencies) / seconds, 1),
+        "errors": len(errors),
+        "p50_ms": percentile(0.5),
+        "p99_ms": percentile(0.99)
+    }
+
+
+def run(name, args):
+    port = free_port()
+    # Бенчмарк нагружает несколько HWID с одного адреса - лимиты частоты выключаем
+    env = dict(os.environ, PORT=str(port), LICENSE_DATA_DIR=tempfile.mkdtemp(prefix="license-bench-"),
+               LICENSE_IP_RATE="0", LICENSE_HWID_RATE="0")
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, SERVERS[name])], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        return asyncio.run(measure(port, args.idle, args.concurrency, args.seconds))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--idle", type=int, default=2000, help="Медленных соединений")
+    parser.add_argument("--concurrency", type=int, default=50, help="Активных клиентов")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    args = parser.parse_args()
+
+    results = {name: run(name, args) for name in args.servers}
+    print(json.dumps({"idle": args.idle, "concurrency": args.concurrency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
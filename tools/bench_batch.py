@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Сравнение /check_license/batch с циклом одиночных /check_license
+
+Пример: python tools/bench_batch.py --licenses 2000
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ADMIN_KEY = "FloraVisuals2024_Admin_Key_7x9K2mP8qR5"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def post(conn, path, body):
+    conn.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=2000)
+    parser.add_argument("--server", default="license_server.py", help="license_server.py или asgi_server.py")
+    args = parser.parse_args()
+
+    port = free_port()
+    # Бенчмарк нагружает несколько HWID с одного адреса - лимиты частоты выключаем
+    env = dict(os.environ, PORT=str(port), LICENSE_DATA_DIR=tempfile.mkdtemp(prefix="license-bench-"),
+               LICENSE_IP_RATE="0", LICENSE_HWID_RATE="0")
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, args.server)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        # Постоянное соединение, чтобы одиночные вызовы не платили за TCP-handshake
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        hwids = [f"BATCH{i:011d}" for i in range(args.licenses)]
+        for hwid in hwids:
+            post(conn, f"/admin/add_license?key={ADMIN_KEY}", {
+                "hwid": hwid, "username": "bench", "duration": 999999999, "max_uses": 10 ** 9
+            })
+
+        started = time.perf_counter()
+        for hwid in hwids:
+            post(conn, "/check_license", {"hwid": hwid})
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        status, body = post(conn, "/check_license/batch", {"hwids": hwids})
+        batch = time.perf_counter() - started
+        assert status == 200 and len(json.loads(body)["results"]) == len(hwids)
+
+        print(json.dumps({
+            "licenses": args.licenses,
+            "single_checks_per_second": round(args.licenses / single, 1),
+            "batch_checks_per_second": round(args.licenses / batch, 1),
+            "speedup": round(single / batch, 1)
+        }, indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
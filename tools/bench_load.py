@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Нагрузочный тест сервера: пропускная способность и p50/p99/p999 в JSON
+
+Поднимает сервер на временном каталоге с заранее записанным снапшотом на
+--licenses лицензий, держит --concurrency постоянных соединений и гоняет
+выбранную смесь запросов --seconds секунд. Результат - JSON (--output),
+его можно сравнить с результатом другого коммита через --compare.
+
+Смеси запросов:
+  check     - /check_license (95%) и /get_license_info (5%) по случайным HWID
+  admin     - список, статистика, продление, сброс, изменение max_uses
+  increment - /increment_usage по 16 "горячим" HWID (шторм инкрементов)
+  mixed     - 80% check, 10% increment, 10% admin
+
+--backend sqlite - то же на базе SQLite (сравнение с таблицей в памяти).
+
+Пример: python tools/bench_load.py --licenses 100000 --workload mixed --concurrency 32 --seconds 20
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from license_sqlite import REPLACE, SqliteLicenseStore
+from license_store import FIELDS, write_snapshot
+
+ADMIN_KEY = "FloraVisuals2024_Admin_Key_7x9K2mP8qR5"
+SERVERS = {"flask": "license_server.py", "asgi": "asgi_server.py", "prefork": "license_server.py"}
+HOT_HWIDS = 16
+
+
+def hwid_of(i):
+    return f"LOAD{i:012d}"
+
+
+def make_record(i, current_time):
+    # Треть лицензий еще не активирована, остальные активны; лимиты не мешают нагрузке
+    return {
+        "user_name": f"user_{i % 5000}",
+        "subscription_duration": 10 ** 9,
+        "max_uses": 10 ** 12,
+        "created_at": 0 if i % 3 == 0 else current_time - i % 86400,
+        "last_used": 0,
+        "use_count": 0
+    }
+
+
+def admin_request(rng, licenses):
+    hwid = hwid_of(rng.randrange(licenses))
+    roll = rng.random()
+    if roll < 0.4:
+        sort = rng.choice(["hwid", "user_name", "created_at", "expires_at"])
+        return "admin_list", "GET", f"/admin/api/licenses?key={ADMIN_KEY}&sort={sort}&limit=50", None
+    if roll < 0.6:
+        return "admin_stats", "GET", f"/admin/stats?key={ADMIN_KEY}", None
+    if roll < 0.8:
+        return "admin_extend", "POST", f"/admin/extend_license?key={ADMIN_KEY}", {"hwid": hwid, "minutes": 1}
+    if roll < 0.9:
+        return "admin_edit_max_uses", "POST", f"/admin/edit_max_uses?key={ADMIN_KEY}", {"hwid": hwid, "max_uses": 1000}
+    return "admin_reset", "POST", f"/admin/reset_license?key={ADMIN_KEY}", {"hwid": hwid}
+
+
+def check_request(rng, licenses):
+    hwid = hwid_of(rng.randrange(licenses))
+    if rng.random() < 0.95:
+        return "check_license", "POST", "/check_license", {"hwid": hwid}
+    return "get_license_info", "GET", f"/get_license_info?hwid={hwid}", None
+
+
+def increment_request(rng, licenses):
+    return "increment_usage", "POST", "/increment_usage", {"hwid": hwid_of(rng.randrange(min(HOT_HWIDS, licenses)))}
+
+
+def mixed_request(rng, licenses):
+    roll = rng.random()
+    if roll < 0.8:
+        return check_request(rng, licenses)
+    if roll < 0.9:
+        return increment_request(rng, licenses)
+    return admin_request(rng, licenses)
+
+
+WORKLOADS = {"check": check_request, "admin": admin_request, "increment": increment_request, "mixed": mixed_request}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p * len(sorted_values)) - 1)]
+
+
+def summary(latencies):
+    latencies.sort()
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "p999_ms": round(percentile(latencies, 0.999) * 1000, 3) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+
+class Connection:
+    """Постоянное HTTP/1.1-соединение (переоткрывается, если сервер его закрыл)"""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body):
+        payload = json.dumps(body).encode() if body is not None else b""
+        for attempt in (0, 1):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+            try:
+                self.writer.write(
+                    f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await self.writer.drain()
+                head = await self.reader.readuntil(b"\r\n\r\n")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+
+            status = int(head[9:12])
+            headers = head.decode("latin-1").lower()
+            length = None
+            for line in headers.split("\r\n"):
+                if line.startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            if length is None:
+                # Без Content-Length ответ заканчивается закрытием соединения
+                await self.reader.read()
+                self.close()
+            else:
+                await self.reader.readexactly(length)
+                if "connection: close" in headers:
+                    self.close()
+            return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def drive(port, workload, licenses, concurrency, seconds, seed):
+    """Замкнутый цикл: concurrency клиентов, каждый шлет следующий запрос после ответа"""
+    make_request = WORKLOADS[workload]
+    latencies = {}
+    statuses = {}
+    errors = [0]
+    deadline = time.perf_counter() + seconds
+
+    async def client(n):
+        rng = random.Random(seed * 1000003 + n)
+        connection = Connection(port)
+        while time.perf_counter() < deadline:
+            operation, method, path, body = make_request(rng, licenses)
+            started = time.perf_counter()
+            try:
+                status = await connection.request(method, path, body)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors[0] += 1
+                connection.close()
+                continue
+            latencies.setdefault(operation, []).append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(concurrency)))
+    return latencies, statuses, errors[0], time.perf_counter() - started
+
+
+def populate(data_dir, licenses, backend):
+    """Снапшот (или база SQLite) с лицензиями вместо тысяч запросов к /admin/add_license"""
+    current_time = int(time.time())
+    records = {hwid_of(i): make_record(i, current_time) for i in range(licenses)}
+    if backend == "sqlite":
+        # Схема создается хранилищем; база уже не новая, начальные лицензии не добавятся
+        path = os.path.join(data_dir, "licenses.db")
+        SqliteLicenseStore(path).close()
+        db = sqlite3.connect(path, isolation_level=None)
+        db.execute("BEGIN")
+        db.executemany(REPLACE, ((hwid, *(data[field] for field in FIELDS)) for hwid, data in records.items()))
+        db.execute("COMMIT")
+        db.close()
+        return
+    # seq > 0: хранилище не считается новым и не добавляет начальные лицензии
+    write_snapshot(os.path.join(data_dir, "snapshot.json"), records, 1)
+
+
+def start_server(args, data_dir, port):
+    env = dict(os.environ, PORT=str(port), LICENSE_DATA_DIR=data_dir, LICENSE_BACKEND=args.backend,
+               LICENSE_IP_RATE="0", LICENSE_HWID_RATE="0", LICENSE_SHED_QUEUE_MS="0",
+               WEB_CONCURRENCY=str(args.workers if args.server == "prefork" else 1))
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, SERVERS[args.server])], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    started = time.perf_counter()
+    while time.perf_counter() - started < args.startup_timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"Сервер завершился с кодом {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server, time.perf_counter() - started
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Сервер не поднялся")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline):
+    """Изменение относительно результата другого запуска, в процентах"""
+    def delta(new, old):
+        return round((new - old) / old * 100, 1) if new is not None and old else None
+
+    changes = {"throughput_rps": delta(result["throughput_rps"], baseline["throughput_rps"])}
+    for name in ("p50_ms", "p99_ms", "p999_ms"):
+        changes[name] = delta(result["latency"][name], baseline["latency"][name])
+    return {"baseline_commit": baseline.get("commit"), "change_percent": changes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=sorted(SERVERS), default="flask")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--workers", type=int, default=4, help="Воркеров для --server prefork")
+    parser.add_argument("--licenses", type=int, default=10000, help="Размер таблицы (1000 - 1000000)")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2, help="Секунд прогрева (в результат не входят)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", help="Куда записать JSON (по умолчанию - только stdout)")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="license-load-")
+    server = None
+    try:
+        started = time.perf_counter()
+        populate(data_dir, args.licenses, args.backend)
+        populate_seconds = time.perf_counter() - started
+
+        port = free_port()
+        server, startup_seconds = start_server(args, data_dir, port)
+
+        if args.warmup:
+            asyncio.run(drive(port, args.workload, args.licenses, args.concurrency, args.warmup, args.seed + 1))
+        latencies, statuses, errors, elapsed = asyncio.run(
+            drive(port, args.workload, args.licenses, args.concurrency, args.seconds, args.seed))
+
+        all_latencies = [value for values in latencies.values() for value in values]
+        result = {
+            "commit": git_commit(),
+            "server": args.server,
+            "backend": args.backend,
+            "workers": args.workers if args.server == "prefork" else 1,
+            "licenses": args.licenses,
+            "workload": args.workload,
+            "concurrency": args.concurrency,
+            "seconds": round(elapsed, 2),
+            "requests": len(all_latencies),
+            "errors": errors,
+            "throughput_rps": round(len(all_latencies) / elapsed, 1),
+            "latency": summary(all_latencies),
+            "operations": {name: summary(values) for name, values in sorted(latencies.items())},
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            "populate_seconds": round(populate_seconds, 2),
+            "startup_seconds": round(startup_seconds, 2),
+        }
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                result["comparison"] = compare(result, json.load(f))
+
+        output = json.dumps(result, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+        print(output)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Память на лицензию: словарь словарей против таблицы колонками (LicenseTable)
+
+Оба варианта загружаются из одного снапшота, память считается tracemalloc
+после загрузки (временные объекты JSON уже освобождены).
+
+Пример: python tools/bench_memory.py --licenses 1000000
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from license_store import FIELDS, read_snapshot, write_snapshot
+
+
+def make_record(i, current_time):
+    return {
+        "user_name": f"user_{i}",
+        "subscription_duration": 2592000,
+        "max_uses": 1000,
+        "created_at": current_time - i % 86400 if i % 3 else 0,
+        "last_used": current_time - i % 3600 if i % 3 else 0,
+        "use_count": i % 1000
+    }
+
+
+def read_dicts(path):
+    """Прежний формат таблицы: словарь hwid -> словарь полей"""
+    with open(path, "r", encoding="utf-8") as f:
+        columns = json.load(f)["columns"]
+    return {
+        hwid: dict(zip(FIELDS, values))
+        for hwid, *values in zip(columns["hwid"], *(columns[field] for field in FIELDS))
+    }, 0
+
+
+def measure(load, path, hwids):
+    gc.collect()
+    tracemalloc.start()
+    records, seq = load(path)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for hwid in hwids:
+        records.get(hwid)
+    get_seconds = time.perf_counter() - started
+
+    result = {
+        "bytes_per_license": round(size / len(records), 1),
+        "total_mb": round(size / 2 ** 20, 1),
+        "get_us": round(get_seconds / len(hwids) * 1e6, 2),
+    }
+    del records
+    gc.collect()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=100000, help="Лицензий в таблице")
+    parser.add_argument("--gets", type=int, default=100000, help="Чтений записи для замера get()")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="license-memory-")
+    try:
+        current_time = int(time.time())
+        path = os.path.join(data_dir, "snapshot.json")
+        records = {f"{i:016X}": make_record(i, current_time) for i in range(args.licenses)}
+        write_snapshot(path, records, 1)
+        del records
+
+        rng = random.Random(1)
+        hwids = [f"{rng.randrange(args.licenses):016X}" for _ in range(args.gets)]
+        dicts = measure(read_dicts, path, hwids)
+        table = measure(read_snapshot, path, hwids)
+
+        print(json.dumps({
+            "licenses": args.licenses,
+            "dict": dicts,
+            "table": table,
+            "saved_percent": round((1 - table["bytes_per_license"] / dicts["bytes_per_license"]) * 100, 1)
+        }, indent=2))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
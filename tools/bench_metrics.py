@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Накладные расходы метрик на горячем пути /check_license
+
+Пример: python tools/bench_metrics.py --calls 20000 --threads 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("LICENSE_DATA_DIR", "")
+os.environ.setdefault("LICENSE_IP_RATE", "0")
+os.environ.setdefault("LICENSE_HWID_RATE", "0")
+
+import license_server
+
+
+def run_requests(calls):
+    client = license_server.app.test_client()
+    started = time.perf_counter()
+    for _ in range(calls):
+        client.post("/check_license", json={"hwid": "BENCHMETRICS"})
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def record_cost(calls, threads):
+    """Стоимость всех записей метрик одного запроса (мкс), calls раз в каждом из threads потоков"""
+    def worker():
+        for _ in range(calls):
+            started = time.perf_counter()
+            license_server.record_stage("validate", started)
+            license_server.record_stage("sign", started)
+            license_server.record_request("/check_license", "POST", 200, started)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter() - started) / (calls * threads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=5, help="Чередований с метриками и без")
+    args = parser.parse_args()
+
+    license_server.LICENSES.add("BENCHMETRICS", {"user_name": "bench", "subscription_duration": 10 ** 9,
+                                                "max_uses": 10 ** 9, "created_at": 0, "last_used": 0, "use_count": 0})
+    run_requests(1000)
+
+    # Чередуем, чтобы дрейф частоты процессора не попал в разницу
+    timings = {True: [], False: []}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            license_server.METRICS_ENABLED = enabled
+            timings[enabled].append(run_requests(args.calls // args.rounds))
+    license_server.METRICS_ENABLED = True
+    recorded_before = license_server.REQUESTS.collect()[("/check_license", "POST", 200)][0]
+
+    without_metrics = min(timings[False])
+    with_metrics = min(timings[True])
+    per_request = record_cost(args.calls, args.threads)
+    print(json.dumps({
+        "calls": args.calls,
+        "request_us_without_metrics": round(without_metrics, 2),
+        "request_us_with_metrics": round(with_metrics, 2),
+        "metrics_record_us_per_request": round(per_request, 3),
+        "overhead_percent": round(per_request / without_metrics * 100, 2),
+        # Запись без блокировок не должна терять инкременты
+        "lost_increments": recorded_before + args.calls * args.threads -
+        license_server.REQUESTS.collect()[("/check_license", "POST", 200)][0],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
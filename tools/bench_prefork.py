@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Масштабирование /check_license по числу воркеров pre-fork режима
+
+Пример: python tools/bench_prefork.py --workers 1 2 4 --clients 16 --seconds 10
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ADMIN_KEY = "FloraVisuals2024_Admin_Key_7x9K2mP8qR5"
+HWID = "BENCH0000000001"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def client(port, deadline, result):
+    count = 0
+    body = {"hwid": HWID}
+    while time.time() < deadline:
+        if request(port, "POST", "/check_license", body) == 200:
+            count += 1
+    result.put(count)
+
+
+def run(workers, clients, seconds):
+    port = free_port()
+    # Бенчмарк нагружает несколько HWID с одного адреса - лимиты частоты выключаем
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers),
+               LICENSE_DATA_DIR=tempfile.mkdtemp(prefix="license-bench-"),
+               LICENSE_IP_RATE="0", LICENSE_HWID_RATE="0")
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "license_server.py")], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                request(port, "GET", "/")
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        request(port, "POST", f"/admin/add_license?key={ADMIN_KEY}", {
+            "hwid": HWID, "username": "bench", "duration": 999999999, "max_uses": 10 ** 12
+        })
+
+        result = multiprocessing.Queue()
+        deadline = time.time() + seconds
+        procs = [multiprocessing.Process(target=client, args=(port, deadline, result)) for _ in range(clients)]
+        for proc in procs:
+            proc.start()
+        total = sum(result.get() for _ in procs)
+        for proc in procs:
+            proc.join()
+        return total / seconds
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16, help="Клиентских процессов")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        rps = run(workers, args.clients, args.seconds)
+        results.append({"workers": workers, "requests_per_second": round(rps, 1)})
+        print(f"workers={workers}: {rps:.0f} req/s", file=sys.stderr)
+
+    print(json.dumps({"cpu_count": os.cpu_count(), "clients": args.clients, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
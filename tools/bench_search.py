@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Поиск в админке (/admin/search): построение индекса и время запросов
+
+Таблица заполняется --licenses лицензиями со случайными HWID и именами
+вида "ivan_12345", затем замеряются первый поиск (строит SearchIndex) с
+приростом резидентной памяти и среднее время типичных запросов.
+
+Пример: python tools/bench_search.py --licenses 1000000
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from license_store import LicenseStore
+from metrics import resident_memory
+
+NAMES = ("ivan", "petr", "alex", "maria", "oleg", "anna", "dmitry", "olga")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=1000000, help="Лицензий в таблице")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов каждого запроса")
+    parser.add_argument("--limit", type=int, default=50, help="Результатов на запрос")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    store = LicenseStore()
+    for _ in range(args.licenses):
+        store.add(f"{rng.randrange(16 ** 16):016X}", {
+            "user_name": f"{rng.choice(NAMES)}_{rng.randrange(100000)}",
+            "subscription_duration": 2592000,
+            "max_uses": 1000,
+            "created_at": 0,
+            "last_used": 0,
+            "use_count": 0
+        })
+    hwid = next(iter(store.keys()))
+
+    gc.collect()
+    rss = resident_memory()
+    started = time.perf_counter()
+    store.search("-")
+    build_seconds = time.perf_counter() - started
+    index_bytes = resident_memory() - rss
+
+    queries = {
+        "hwid_exact": hwid,
+        "hwid_prefix": hwid[:6].lower(),
+        "name_word": "ivan",
+        "name_prefix": "iv",
+        "name_two_words": "olga 9999",
+        "name_rare_and_common": "ivan 5",
+        "not_found": "zzzz",
+    }
+    results = {}
+    for name, query in queries.items():
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            found, more = store.search(query, args.limit)
+        results[name] = {"query": query, "found": len(found), "more": more,
+                         "ms": round((time.perf_counter() - started) / args.repeat * 1000, 3)}
+
+    print(json.dumps({
+        "licenses": args.licenses,
+        "build_seconds": round(build_seconds, 2),
+        "index_mb": round(index_bytes / 2 ** 20, 1),
+        "queries": results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
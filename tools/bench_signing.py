@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Микробенчмарк подписанного ответа /check_license: CPU на запрос до и после кэширования
+
+Пример: python tools/bench_signing.py --licenses 1000 --calls 200000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("LICENSE_DATA_DIR", "")
+
+from flask import Response, jsonify
+
+import license_server
+
+
+def measure(build, licenses, calls, current_time):
+    """CPU-время на вызов в микросекундах"""
+    started = time.process_time()
+    for i in range(calls):
+        build(licenses[i % len(licenses)], current_time + i // 1000)
+    return (time.process_time() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=1000, help="Разных лицензий в цикле")
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    current_time = int(time.time())
+    licenses = [{
+        "user_name": f"user{i}", "subscription_duration": 2592000, "max_uses": 999999,
+        "created_at": current_time - i, "last_used": current_time, "use_count": i
+    } for i in range(args.licenses)]
+    message = "Лицензия действительна"
+
+    # Ответы обоих вариантов совпадают
+    for license_data in licenses[:100]:
+        assert json.loads(license_server.license_response_json(message, license_data, current_time)) == \
+            license_server.license_response(message, license_data, current_time)
+
+    with license_server.app.app_context():
+        results = {
+            # Было: словарь -> json.dumps для подписи -> jsonify сериализует еще раз
+            "before_us": measure(lambda data, now: jsonify(license_server.license_response(message, data, now)),
+                                 licenses, args.calls, current_time),
+            # Стало: одна сериализация, неизменные части и хеш их начала из кэша
+            "after_us": measure(lambda data, now: Response(license_server.license_response_json(message, data, now) + "\n",
+                                                           mimetype="application/json"),
+                                licenses, args.calls, current_time),
+            "sign_only_before_us": measure(lambda data, now: license_server.license_response(message, data, now),
+                                           licenses, args.calls, current_time),
+            "sign_only_after_us": measure(lambda data, now: license_server.license_response_json(message, data, now),
+                                          licenses, args.calls, current_time),
+        }
+
+    results = {name: round(value, 2) for name, value in results.items()}
+    results["speedup"] = round(results["before_us"] / results["after_us"], 2)
+    results["sign_only_speedup"] = round(results["sign_only_before_us"] / results["sign_only_after_us"], 2)
+    print(json.dumps(dict({"licenses": args.licenses, "calls": args.calls}, **results), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Холодный старт хранилища: снапшот JSON против двоичного (mmap) по размерам таблицы
+
+Для каждого размера пишется снапшот в обоих форматах, затем в новом
+процессе (как после перезапуска на Railway) замеряются загрузка
+LicenseStore, первое чтение лицензий (в двоичном формате - перенос из
+снапшота) и повторное чтение, а также память после загрузки: rss_mb -
+вместе со страницами отображенного файла (общий кэш ОС), anon_mb -
+собственная память процесса.
+
+Пример: python tools/bench_startup.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from license_store import write_binary_snapshot, write_snapshot
+
+# Выполняется в отдельном процессе: в нем нет ни кэша страниц Python, ни прогретой таблицы
+PROBE = """
+import json, os, random, sys, time
+started = time.perf_counter()
+from license_store import LicenseStore, WriteAheadLog
+from metrics import resident_memory
+store = LicenseStore(WriteAheadLog(sys.argv[1]))
+load = time.perf_counter() - started
+rss = resident_memory()
+# Страницы отображенного файла входят в RSS, но это общий кэш ОС; собственная память процесса - RssAnon
+anon = None
+if os.path.exists("/proc/self/status"):
+    with open("/proc/self/status") as f:
+        anon = next((int(line.split()[1]) * 1024 for line in f if line.startswith("RssAnon:")), None)
+rng = random.Random(1)
+hwids = [f"{rng.randrange(int(sys.argv[2])):016X}" for _ in range(int(sys.argv[3]))]
+started = time.perf_counter()
+for hwid in hwids:
+    store.get(hwid)
+first = time.perf_counter() - started
+started = time.perf_counter()
+for hwid in hwids:
+    store.get(hwid)
+again = time.perf_counter() - started
+store.close()
+print(json.dumps({"load_ms": round(load * 1000, 1), "first_get_us": round(first / len(hwids) * 1e6, 2),
+                  "get_us": round(again / len(hwids) * 1e6, 2), "rss_mb": round(rss / 2 ** 20, 1),
+                  "anon_mb": round(anon / 2 ** 20, 1) if anon is not None else None}))
+"""
+
+
+def make_record(i):
+    return {
+        "user_name": f"user_{i % 5000}",
+        "subscription_duration": 2592000,
+        "max_uses": 1000,
+        "created_at": 1700000000 + i if i % 3 else 0,
+        "last_used": 1700000000 + i if i % 3 else 0,
+        "use_count": i % 1000
+    }
+
+
+def probe(data_dir, licenses, gets):
+    output = subprocess.run([sys.executable, "-c", PROBE, data_dir, str(licenses), str(gets)],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="Лицензий в таблице")
+    parser.add_argument("--gets", type=int, default=10000, help="Чтений случайных лицензий после запуска")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        data_dir = tempfile.mkdtemp(prefix="license-startup-")
+        try:
+            records = {f"{i:016X}": make_record(i) for i in range(size)}
+            row = {"licenses": size}
+            for name, write, file_name in (("json", write_snapshot, "snapshot.json"),
+                                           ("binary", write_binary_snapshot, "snapshot.bin")):
+                format_dir = os.path.join(data_dir, name)
+                os.makedirs(format_dir)
+                path = os.path.join(format_dir, file_name)
+                write(path, records, size)
+                row[name] = dict(probe(format_dir, size, args.gets), snapshot_mb=round(os.path.getsize(path) / 2 ** 20, 1))
+            del records
+            results.append(row)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Скорость выдачи и проверки токенов лицензий (HS256 и EdDSA) против запроса /check_license
+
+Пример: python tools/bench_tokens.py --calls 20000 --launches-per-day 20
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("LICENSE_DATA_DIR", "")
+os.environ.setdefault("LICENSE_HWID_RATE", "0")
+os.environ.setdefault("LICENSE_IP_RATE", "0")
+
+import license_server
+from license_tokens import TokenKey, TokenSigner, b64encode, verify_token
+
+
+def per_call_us(func, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return round((time.perf_counter() - started) / calls * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--launches-per-day", type=int, default=20, help="Запусков клиента в сутки для оценки трафика")
+    args = parser.parse_args()
+
+    current_time = int(time.time())
+    claims = {"sub": "4553BEC6D63967B1", "user_name": "bench", "expiration_time": current_time + 2592000,
+              "max_uses": 999999, "use_count": 1, "iat": current_time, "exp": current_time + license_server.TOKEN_TTL}
+
+    keys = [TokenKey("hs", "HS256", secret=secrets.token_urlsafe(32))]
+    try:
+        keys.append(TokenKey("ed", "EdDSA", private_key=b64encode(secrets.token_bytes(32))))
+    except ValueError as e:
+        print(f"EdDSA пропущен: {e}", file=sys.stderr)
+
+    results = {}
+    for key in keys:
+        signer = TokenSigner([key])
+        token = signer.issue(claims)
+        # Клиенту для проверки нужен только kid -> ключ (для EdDSA - открытый)
+        client_keys = {key.kid: key if key.alg == "HS256" else
+                       TokenKey(key.kid, "EdDSA", public_key=signer.jwks()["keys"][0]["x"])}
+        results[key.alg] = {
+            "issue_us": per_call_us(lambda: signer.issue(claims), args.calls),
+            "verify_us": per_call_us(lambda: verify_token(token, client_keys, current_time), args.calls),
+            "token_bytes": len(token)
+        }
+
+    # Для сравнения - полный запрос /check_license внутри процесса (без сети)
+    client = license_server.app.test_client()
+    license_server.LICENSES.add("BENCHTOKEN", {"user_name": "bench", "subscription_duration": 10 ** 9,
+                                              "max_uses": 10 ** 9, "created_at": 0, "last_used": 0, "use_count": 0})
+    check_us = per_call_us(lambda: client.post("/check_license", json={"hwid": "BENCHTOKEN"}), args.calls // 10)
+
+    # Без токенов клиент ходит на сервер при каждом запуске, с токеном - раз в refresh_at
+    refreshes_per_day = 86400 / (license_server.TOKEN_TTL * 4 // 5)
+    print(json.dumps({
+        "calls": args.calls,
+        "algorithms": results,
+        "check_license_request_us": check_us,
+        "token_ttl": license_server.TOKEN_TTL,
+        "requests_per_client_per_day_before": args.launches_per_day,
+        "requests_per_client_per_day_after": round(min(args.launches_per_day, refreshes_per_day), 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Проверка репликации: лидер и фолловеры на одной машине, результат в JSON
+
+Поднимает лидера (LICENSE_ROLE=leader) и --followers фолловеров на
+свободных портах и проверяет:
+  propagation - лицензия, добавленная через один фолловер, видна на другом
+                (время до появления - отставание репликации)
+  max_uses    - параллельные /check_license на все узлы проходят ровно
+                max_uses раз
+  converge    - use_count после проверок одинаков на всех узлах
+  admin_edit  - изменение max_uses на лидере доходит до фолловеров
+  resync      - перезапущенный фолловер снова получает всю таблицу
+
+Код выхода 1, если хоть одна проверка не прошла. --serve оставляет кластер
+запущенным после проверок (Ctrl+C - остановить).
+
+Пример: python tools/cluster.py --followers 2 --max-uses 50
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ADMIN_KEY = "FloraVisuals2024_Admin_Key_7x9K2mP8qR5"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def call(port, method, path, body=None):
+    """(статус, JSON ответа)"""
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+
+
+def start_node(role, port, data_dir, leader_port=None):
+    env = dict(os.environ, PORT=str(port), LICENSE_ROLE=role, LICENSE_DATA_DIR=data_dir, LICENSE_BACKEND="memory",
+               LICENSE_IP_RATE="0", LICENSE_HWID_RATE="0", LICENSE_SHED_QUEUE_MS="0", WEB_CONCURRENCY="1")
+    if leader_port:
+        env["LICENSE_LEADER_URL"] = f"http://127.0.0.1:{leader_port}"
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, "license_server.py")], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until(condition, timeout):
+    """Секунды до выполнения condition() или None, если не дождались"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if condition():
+                return time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def synced(port):
+    status, state = call(port, "GET", f"/admin/replication?key={ADMIN_KEY}")
+    return status == 200 and state.get("synced", True)
+
+
+def license_on(port, hwid):
+    status, info = call(port, "GET", f"/get_license_info?hwid={hwid}")
+    return info if status == 200 else None
+
+
+def check_max_uses(ports, hwid, attempts_per_node, threads_per_node):
+    """Сколько параллельных /check_license по всем узлам прошли"""
+    passed = []
+    lock = threading.Lock()
+
+    def worker(port, attempts):
+        for _ in range(attempts):
+            status, _ = call(port, "POST", "/check_license", {"hwid": hwid})
+            if status == 200:
+                with lock:
+                    passed.append(port)
+
+    workers = [threading.Thread(target=worker, args=(port, attempts_per_node // threads_per_node))
+               for port in ports for _ in range(threads_per_node)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(passed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--followers", type=int, default=2, help="Фолловеров (не меньше 2)")
+    parser.add_argument("--max-uses", type=int, default=50, help="max_uses лицензии для проверки лимита")
+    parser.add_argument("--threads", type=int, default=4, help="Параллельных клиентов на узел")
+    parser.add_argument("--timeout", type=float, default=15, help="Секунд на каждое ожидание")
+    parser.add_argument("--serve", action="store_true", help="Не останавливать кластер после проверок")
+    args = parser.parse_args()
+    args.followers = max(2, args.followers)
+
+    data_dir = tempfile.mkdtemp(prefix="license-cluster-")
+    nodes = {}
+    try:
+        leader_port = free_port()
+        nodes[leader_port] = start_node("leader", leader_port, os.path.join(data_dir, "leader"))
+        follower_ports = [free_port() for _ in range(args.followers)]
+        for port in follower_ports:
+            nodes[port] = start_node("follower", port, "", leader_port)
+        ports = [leader_port] + follower_ports
+        startup = wait_until(lambda: all(synced(port) for port in ports), args.timeout * 2)
+        if startup is None:
+            raise RuntimeError("Узлы не поднялись или не синхронизировались")
+
+        checks = {}
+        hwid = f"CLUSTER{int(time.time())}"
+        first, second = follower_ports[0], follower_ports[1]
+
+        # Запись через фолловер выполняет лидер, на другой фолловер она приходит репликацией
+        status, _ = call(first, "POST", f"/admin/add_license?key={ADMIN_KEY}",
+                         {"hwid": hwid, "username": "cluster", "duration": 3600, "max_uses": args.max_uses})
+        lag = wait_until(lambda: license_on(second, hwid) is not None, args.timeout)
+        checks["propagation"] = {"ok": status == 200 and lag is not None,
+                                 "lag_ms": round(lag * 1000, 1) if lag is not None else None}
+
+        attempts = args.max_uses * 2 // len(ports) + args.threads
+        attempts -= attempts % args.threads
+        passed = check_max_uses(ports, hwid, attempts, args.threads)
+        checks["max_uses"] = {"ok": passed == args.max_uses, "passed": passed,
+                              "attempts": attempts * len(ports), "max_uses": args.max_uses}
+
+        converged = wait_until(lambda: all((license_on(port, hwid) or {}).get("use_count") == args.max_uses
+                                           for port in ports), args.timeout)
+        checks["converge"] = {"ok": converged is not None,
+                              "use_count": {str(port): (license_on(port, hwid) or {}).get("use_count") for port in ports}}
+
+        status, _ = call(leader_port, "POST", f"/admin/edit_max_uses?key={ADMIN_KEY}",
+                         {"hwid": hwid, "max_uses": args.max_uses + 1})
+        edited = wait_until(lambda: all((license_on(port, hwid) or {}).get("max_uses") == args.max_uses + 1
+                                        for port in follower_ports), args.timeout)
+        checks["admin_edit"] = {"ok": status == 200 and edited is not None,
+                                "lag_ms": round(edited * 1000, 1) if edited is not None else None}
+
+        nodes[second].terminate()
+        nodes[second].wait()
+        nodes[second] = start_node("follower", second, "", leader_port)
+        resynced = wait_until(lambda: synced(second) and license_on(second, hwid) == license_on(leader_port, hwid),
+                              args.timeout)
+        checks["resync"] = {"ok": resynced is not None,
+                            "seconds": round(resynced, 2) if resynced is not None else None}
+
+        ok = all(check["ok"] for check in checks.values())
+        print(json.dumps({
+            "leader": leader_port,
+            "followers": follower_ports,
+            "startup_seconds": round(startup, 2),
+            "checks": checks,
+            "ok": ok
+        }, indent=2))
+
+        if args.serve:
+            print(f"Кластер запущен: лидер http://127.0.0.1:{leader_port}, фолловеры "
+                  + ", ".join(f"http://127.0.0.1:{port}" for port in follower_ports))
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        return 0 if ok else 1
+    finally:
+        for node in nodes.values():
+            node.terminate()
+        for node in nodes.values():
+            node.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
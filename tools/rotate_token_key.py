@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Ротация ключа токенов: новое значение LICENSE_TOKEN_KEYS
+
+Новый ключ становится первым (подписывающим). Старые ключи остаются для
+проверки уже выданных токенов до not_after = сейчас + grace (по умолчанию
+LICENSE_TOKEN_TTL, т.е. пока не истечет последний выданный ими токен);
+ключи с прошедшим not_after удаляются. Если LICENSE_TOKEN_KEYS не был задан,
+старым ключом считается "default" (HS256 на SECRET_KEY сервера).
+
+Пример: python tools/rotate_token_key.py --alg EdDSA --kid 2026-10 > keys.json
+"""
+
+import argparse
+import json
+import os
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from license_tokens import TokenKey, b64encode
+
+
+def server_secret_key():
+    """SECRET_KEY из license_server (им подписывает ключ "default")"""
+    # Модуль импортируется только ради константы: таблица в памяти, без журнала, аудита и репликации
+    os.environ.update(LICENSE_DATA_DIR="", LICENSE_AUDIT_DIR="", LICENSE_BACKEND="memory", LICENSE_ROLE="standalone")
+    import license_server
+    return license_server.SECRET_KEY
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", default=os.environ.get("LICENSE_TOKEN_KEYS", ""), help="Текущий LICENSE_TOKEN_KEYS")
+    parser.add_argument("--kid", default=time.strftime("%Y%m%d%H%M%S"), help="Идентификатор нового ключа")
+    parser.add_argument("--alg", choices=("HS256", "EdDSA"), default="HS256")
+    parser.add_argument("--grace", type=int, default=int(os.environ.get("LICENSE_TOKEN_TTL", 86400)),
+                        help="Сколько секунд принимать токены старых ключей")
+    args = parser.parse_args()
+
+    current_time = int(time.time())
+    if args.keys:
+        keys = json.loads(args.keys)
+    else:
+        # Без LICENSE_TOKEN_KEYS сервер подписывал ключом "default": его токены принимаются еще grace секунд
+        keys = [{"kid": "default", "alg": "HS256", "secret": server_secret_key()}]
+    if any(entry["kid"] == args.kid for entry in keys):
+        sys.exit(f"Ключ {args.kid} уже есть")
+
+    if args.alg == "HS256":
+        new_key = {"kid": args.kid, "alg": "HS256", "secret": secrets.token_urlsafe(32)}
+    else:
+        new_key = {"kid": args.kid, "alg": "EdDSA", "private_key": b64encode(secrets.token_bytes(32))}
+    # Проверяем, что сервер сможет загрузить ключ (для EdDSA нужен cryptography)
+    TokenKey(**new_key)
+
+    rotated = [new_key]
+    for entry in keys:
+        entry.setdefault("not_after", current_time + args.grace)
+        if entry["not_after"] >= current_time:
+            rotated.append(entry)
+
+    print(json.dumps(rotated))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Нагрузочная проверка счетчиков: нет потерянных инкрементов и превышения max_uses
+
+Пример: python tools/stress_counters.py --threads 64 --target app
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--calls", type=int, default=500, help="Вызовов на поток")
+    parser.add_argument("--licenses", type=int, default=8, help="Сколько HWID делят потоки")
+    parser.add_argument("--target", choices=["store", "app"], default="store",
+                        help="store - LicenseStore напрямую, app - через Flask /check_license")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LICENSE_DATA_DIR", tempfile.mkdtemp(prefix="license-stress-"))
+    # Потоки долбят несколько HWID - лимиты частоты здесь помешали бы проверке
+    os.environ.setdefault("LICENSE_IP_RATE", "0")
+    os.environ.setdefault("LICENSE_HWID_RATE", "0")
+    import license_server
+
+    total_calls = args.threads * args.calls
+    # Половина лицензий упирается в max_uses, половина - нет
+    limits = {}
+    for i in range(args.licenses):
+        hwid = f"STRESS{i:04d}"
+        limits[hwid] = total_calls // (2 * args.licenses) if i % 2 else total_calls
+        license_server.LICENSES.add(hwid, {
+            "user_name": f"stress_{i}",
+            "subscription_duration": 3600,
+            "max_uses": limits[hwid],
+            "created_at": 0,
+            "last_used": 0,
+            "use_count": 0
+        })
+
+    hwids = list(limits)
+    successes = {hwid: 0 for hwid in hwids}
+    successes_lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker(n):
+        client = license_server.app.test_client() if args.target == "app" else None
+        local = {hwid: 0 for hwid in hwids}
+        barrier.wait()
+        for i in range(args.calls):
+            hwid = hwids[(n + i) % len(hwids)]
+            if client:
+                ok = client.post("/check_license", json={"hwid": hwid}).status_code == 200
+            else:
+                ok = license_server.LICENSES.use(hwid, int(time.time()))[0]
+            local[hwid] += ok
+        with successes_lock:
+            for hwid, count in local.items():
+                successes[hwid] += count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    failed = False
+    for hwid in hwids:
+        use_count = license_server.LICENSES.get(hwid)["use_count"]
+        attempts = sum(1 for n in range(args.threads) for i in range(args.calls)
+                       if hwids[(n + i) % len(hwids)] == hwid)
+        expected = min(attempts, limits[hwid])
+        status = "OK" if use_count == successes[hwid] == expected else "FAIL"
+        failed |= status == "FAIL"
+        print(f"{hwid}: use_count={use_count} successes={successes[hwid]} expected={expected} "
+              f"max_uses={limits[hwid]} {status}")
+
+    print(f"{total_calls} calls, {args.threads} threads, {total_calls / elapsed:.0f} calls/s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()